@@ -0,0 +1,61 @@
+"""
+Compara dos reportes de benchmarks.run::
+
+    python -m benchmarks.comparar antes.json despues.json [--tolerancia 10]
+
+Regresa 1 si alguna vista hace más consultas o si su mediana crece más que
+la tolerancia (en porcentaje), para poder usarlo en CI.
+"""
+import argparse
+import json
+import sys
+
+
+def comparar(antes, despues, tolerancia):
+    filas = []
+    regresion = False
+    for nombre in sorted(set(antes['vistas']) | set(despues['vistas'])):
+        a = antes['vistas'].get(nombre)
+        d = despues['vistas'].get(nombre)
+        if a is None or d is None:
+            filas.append((nombre, 'solo en {}'.format('después' if a is None else 'antes'), '', ''))
+            continue
+        if 'error' in a or 'error' in d:
+            empeora = 'error' in d and 'error' not in a
+            regresion = regresion or empeora
+            filas.append((nombre, 'error', d.get('error', 'corregido'), 'REGRESIÓN' if empeora else ''))
+            continue
+        cambio = (d['mediana_ms'] - a['mediana_ms']) / a['mediana_ms'] * 100 if a['mediana_ms'] else 0
+        empeora = d['consultas'] > a['consultas'] or cambio > tolerancia
+        regresion = regresion or empeora
+        filas.append((
+            nombre,
+            '{} -> {}'.format(a['consultas'], d['consultas']),
+            '{} -> {} ms ({:+.1f}%)'.format(a['mediana_ms'], d['mediana_ms'], cambio),
+            'REGRESIÓN' if empeora else '',
+        ))
+    return filas, regresion
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compara dos reportes de benchmarks.')
+    parser.add_argument('antes')
+    parser.add_argument('despues')
+    parser.add_argument('--tolerancia', type=float, default=10.0)
+    args = parser.parse_args(argv)
+    with open(args.antes) as archivo:
+        antes = json.load(archivo)
+    with open(args.despues) as archivo:
+        despues = json.load(archivo)
+    if antes['escala'] != despues['escala']:
+        sys.stderr.write('Advertencia: los reportes usan escalas distintas.\n')
+    filas, regresion = comparar(antes, despues, args.tolerancia)
+    print('{} ({}) -> {} ({})'.format(antes['commit'], antes['fecha'], despues['commit'], despues['fecha']))
+    anchos = [max(len(fila[i]) for fila in filas) for i in range(4)]
+    for fila in filas:
+        print('  '.join(valor.ljust(ancho) for valor, ancho in zip(fila, anchos)).rstrip())
+    return 1 if regresion else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
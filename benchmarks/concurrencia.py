@@ -0,0 +1,203 @@
+"""
+Carga concurrente sobre las vistas de consulta.
+
+Varios usuarios (hilos, cada uno con su cliente y su conexión) piden al mismo
+tiempo las vistas de sólo lectura de benchmarks/escenarios.py. Se mide la
+latencia y el tiempo que cada petición tiene la conexión dentro de una
+transacción, con las vistas de consulta fuera de ATOMIC_REQUESTS (la política
+actual, ver construbot/core/replica.py) y con todas las vistas dentro de
+ATOMIC_REQUESTS, como antes.
+
+Uso, desde la raíz del repositorio::
+
+    DATABASE_URL=postgres://... python -m benchmarks.concurrencia --usuarios 20 --salida concurrencia.json
+    # 50 usuarios con el pool de psycopg (DATABASE_POOL_MAX_SIZE, etc.):
+    DATABASE_URL=postgres://... python -m benchmarks.concurrencia --usuarios 50 --pool
+
+Con ``--pool`` el reporte incluye por modo las estadísticas del pool, entre
+ellas el tiempo promedio que una petición esperó por una conexión.
+
+Con SQLite los hilos comparten una base en memoria y el resultado sólo sirve
+para probar el script.
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from benchmarks.run import configurar_django, get_commit, get_tenant, percentil
+
+MODOS = ('todo_atomico', 'solo_lectura_sin_transaccion')
+
+
+@contextmanager
+def todo_atomico():
+    """Envuelve todas las vistas en atomic(), ignorando non_atomic_requests."""
+    from django.core.handlers.base import BaseHandler
+    from django.db import connections, transaction
+    original = BaseHandler.make_view_atomic
+
+    def make_view_atomic(self, view):
+        for alias, settings_dict in connections.settings.items():
+            if settings_dict['ATOMIC_REQUESTS']:
+                view = transaction.atomic(using=alias)(view)
+        return view
+    BaseHandler.make_view_atomic = make_view_atomic
+    try:
+        yield
+    finally:
+        BaseHandler.make_view_atomic = original
+
+
+class MedidorTransaccion(object):
+    """execute_wrapper que separa el tiempo de las consultas dentro y fuera de
+    una transacción. El tiempo en transacción va de la primera a la última
+    consulta del bloque atómico, que es lo menos que la conexión queda tomada."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.primera = self.ultima = None
+        self.fuera = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            fin = time.perf_counter()
+            if self.connection.in_atomic_block:
+                self.primera = inicio if self.primera is None else self.primera
+                self.ultima = fin
+            else:
+                self.fuera += fin - inicio
+
+    def en_transaccion(self):
+        return (self.ultima - self.primera if self.primera is not None else 0.0) + self.fuera
+
+
+def usuario(client, rutas, peticiones, barrera, muestras, errores):
+    from django.db import connection
+    medidor = MedidorTransaccion(connection)
+    try:
+        with connection.execute_wrapper(medidor):
+            barrera.wait()
+            for i in range(peticiones):
+                ruta = rutas[i % len(rutas)]
+                medidor.reiniciar()
+                inicio = time.perf_counter()
+                try:
+                    response = client.get(ruta)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                except Exception as e:
+                    errores.append('{}: {}'.format(type(e).__name__, e))
+                    continue
+                muestras.append((time.perf_counter() - inicio, medidor.en_transaccion()))
+    finally:
+        connection.close()
+
+
+def medir(user, rutas, usuarios, peticiones):
+    from django.test import Client
+    clientes = []
+    for _ in range(usuarios):
+        client = Client()
+        client.force_login(user)
+        clientes.append(client)
+    barrera = threading.Barrier(usuarios)
+    muestras = []
+    errores = []
+    hilos = [
+        threading.Thread(target=usuario, args=(client, rutas, peticiones, barrera, muestras, errores))
+        for client in clientes
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    latencias = [latencia * 1000 for latencia, _ in muestras]
+    transacciones = [transaccion * 1000 for _, transaccion in muestras]
+    if not muestras:
+        return {'errores': len(errores), 'primer_error': errores[0] if errores else None}
+    return {
+        'peticiones': len(muestras),
+        'errores': len(errores),
+        'primer_error': errores[0] if errores else None,
+        'peticiones_por_s': round(len(muestras) / duracion, 1),
+        'latencia_mediana_ms': round(statistics.median(latencias), 2),
+        'latencia_p95_ms': round(percentil(latencias, 95), 2),
+        'transaccion_mediana_ms': round(statistics.median(transacciones), 2),
+        'transaccion_p95_ms': round(percentil(transacciones, 95), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mide las vistas de consulta con usuarios concurrentes.')
+    parser.add_argument('--escala', default='chica', choices=['chica', 'mediana', 'grande'])
+    parser.add_argument('--usuarios', type=int, default=10)
+    parser.add_argument('--peticiones', type=int, default=20, help='Peticiones por usuario en cada modo.')
+    parser.add_argument('--salida', help='Archivo JSON del reporte; si no se da se imprime.')
+    parser.add_argument('--reusar', action='store_true', help='Conserva la base de pruebas y sus datos.')
+    parser.add_argument('--pool', action='store_true', help='Usa el pool de conexiones de psycopg (PostgreSQL).')
+    args = parser.parse_args(argv)
+
+    configurar_django()
+    import environ
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from benchmarks.escenarios import ESCENARIOS, get_referencias
+    from construbot.core import pool
+
+    if args.pool:
+        if connection.vendor != 'postgresql':
+            raise SystemExit('El pool de conexiones sólo existe para PostgreSQL.')
+        pool.configurar_conexiones(connection.settings_dict, environ.Env())
+
+    setup_test_environment()
+    nombre_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, keepdb=args.reusar, serialize=False)
+    try:
+        nombre = 'benchmark-{}'.format(args.escala)
+        company, user, _, _ = get_tenant(nombre, args.escala, args.reusar, None)
+        referencias = get_referencias(company)
+        rutas = [construir(referencias) for escenario, construir in ESCENARIOS if not escenario.startswith('api_')]
+        modos = {}
+        for modo in MODOS:
+            with todo_atomico() if modo == 'todo_atomico' else nullcontext():
+                cache.clear()
+                pool.get_estadisticas(reiniciar=True)
+                modos[modo] = medir(user, rutas, args.usuarios, args.peticiones)
+                modos[modo]['pool'] = pool.get_estadisticas().get('default')
+            sys.stderr.write('{}: {}\n'.format(modo, modos[modo]))
+    finally:
+        if not args.reusar:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+    reporte = {
+        'commit': get_commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'base_de_datos': connection.vendor,
+        'escala': args.escala,
+        'usuarios': args.usuarios,
+        'peticiones_por_usuario': args.peticiones,
+        'pool': connection.settings_dict['OPTIONS'].get('pool'),
+        'modos': modos,
+    }
+    contenido = json.dumps(reporte, indent=2, sort_keys=True)
+    if args.salida:
+        Path(args.salida).write_text(contenido + '\n')
+    else:
+        print(contenido)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Vistas que se miden. Cada escenario recibe los objetos de referencia del
+tenant generado (ver `get_referencias`) y regresa la URL a pedir.
+"""
+import json
+from django.urls import reverse
+from django.utils.http import urlencode
+from construbot.proyectos.models import Contrato, Estimate
+
+
+def get_referencias(company):
+    """El contrato raíz con más subcontratos y su última estimación."""
+    contrato = Contrato.objects.filter(contraparte__company=company, depth=1).order_by('-numchild', 'path').first()
+    estimate = Estimate.objects.filter(project=contrato).order_by('-consecutive').first()
+    return {'contrato': contrato, 'estimate': estimate}
+
+
+def url(nombre, *args, **params):
+    def construir(referencias):
+        kwargs = {'pk': referencias[args[0]].pk} if args else {}
+        ruta = reverse(nombre, kwargs=kwargs)
+        valores = {llave: valor(referencias) if callable(valor) else valor for llave, valor in params.items()}
+        return '{}?{}'.format(ruta, urlencode(valores)) if valores else ruta
+    return construir
+
+
+ESCENARIOS = [
+    ('dashboard', url('proyectos:proyect_dashboard')),
+    ('contrato_detail', url('proyectos:contrato_detail', 'contrato')),
+    ('estimate_detail', url('proyectos:estimate_detail', 'estimate')),
+    ('estimate_pdf', url('proyectos:estimate_detailpdf', 'estimate')),
+    ('generator_pdf', url('proyectos:generator_detailpdf', 'estimate')),
+    ('reporte_subcontratistas', url('proyectos:reporte-subcontratistas', 'estimate')),
+    ('catalogo_conceptos', url('proyectos:catalogo_conceptos_listado', 'contrato')),
+    ('listado_contratos', url('proyectos:listado_de_contratos')),
+    ('listado_clientes', url('proyectos:listado_de_clientes')),
+    ('listado_sitios', url('proyectos:listado_de_sitios')),
+    ('listado_destinatarios', url('proyectos:listado_de_destinatarios')),
+    ('autocomplete_clientes', url('proyectos:cliente-autocomplete', q='cliente-1')),
+    ('autocomplete_sitios', url('proyectos:sitio-autocomplete', q='Sitio 1')),
+    ('autocomplete_destinatarios', url(
+        'proyectos:destinatario-autocomplete', q='Residente',
+        forward=lambda referencias: json.dumps({'project': str(referencias['contrato'].pk)})
+    )),
+    ('autocomplete_unidades', url('proyectos:unit-autocomplete', q='unidad')),
+    ('api_contratos', url('api:contratos')),
+    ('api_estimaciones', url('api:estimaciones')),
+]
@@ -0,0 +1,112 @@
+"""
+Logins por segundo con el hasher de producción.
+
+Mide LoginBackend directo, api-token-auth sin el cache de credenciales y
+api-token-auth con el cache (ver construbot/api/autenticacion.py), todos con
+construbot.core.hashers.Argon2PasswordHasher. Los parámetros de Argon2 son los
+de CONSTRUBOT_ARGON2 (ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM)
+o los que se den en la línea de comandos, así se prueban antes de cambiarlos en
+una instalación; los hashes con otros parámetros se rehacen en el siguiente
+login (ver construbot/core/hashers.py).
+
+Uso, desde la raíz del repositorio::
+
+    python -m benchmarks.login --logins 50
+    python -m benchmarks.login --time-cost 3 --memory-cost 65536 --parallelism 2 --salida argon2.json
+
+``logins_por_s_cpu`` divide entre el tiempo de CPU del proceso, que es lo que
+rinde un núcleo; con ``parallelism`` mayor a 1 Argon2 usa varios hilos y
+``logins_por_s`` puede ser mayor.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from benchmarks.run import configurar_django, get_commit
+
+MODOS = ('login_backend', 'api_token_auth', 'api_token_auth_cache')
+
+
+def medir(funcion, logins):
+    funcion()
+    inicio, cpu = time.perf_counter(), time.process_time()
+    for _ in range(logins):
+        funcion()
+    duracion, cpu = time.perf_counter() - inicio, time.process_time() - cpu
+    return {
+        'logins': logins,
+        'logins_por_s': round(logins / duracion, 1),
+        'logins_por_s_cpu': round(logins / cpu, 1) if cpu else None,
+        'login_ms': round(duracion / logins * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mide los logins por segundo con Argon2.')
+    parser.add_argument('--logins', type=int, default=20, help='Logins por modo.')
+    parser.add_argument('--time-cost', type=int)
+    parser.add_argument('--memory-cost', type=int, help='KiB.')
+    parser.add_argument('--parallelism', type=int)
+    parser.add_argument('--salida', help='Archivo JSON del reporte; si no se da se imprime.')
+    args = parser.parse_args(argv)
+
+    configurar_django()
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import override_settings, setup_test_environment
+    from django.urls import reverse
+    from construbot.core.backends import LoginBackend
+    from construbot.proyectos import poblacion
+
+    argon2 = dict(settings.CONSTRUBOT_ARGON2)
+    for parametro in argon2:
+        if getattr(args, parametro) is not None:
+            argon2[parametro] = getattr(args, parametro)
+
+    setup_test_environment()
+    nombre_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+    modos = {}
+    try:
+        with override_settings(
+                PASSWORD_HASHERS=['construbot.core.hashers.Argon2PasswordHasher'], CONSTRUBOT_ARGON2=argon2):
+            company, user = poblacion.crear_tenant('benchmark-login')
+            client = Client()
+            ruta = reverse('api:token_auth')
+            credenciales = {'email': user.email, 'password': 'password'}
+            backend = LoginBackend()
+            for modo in MODOS:
+                cache.clear()
+                if modo == 'login_backend':
+                    def funcion():
+                        assert backend.authenticate(None, username=user.email, password='password') is not None
+                else:
+                    def funcion():
+                        assert client.post(ruta, credenciales).status_code == 200
+                ttl = 0 if modo == 'api_token_auth' else settings.CONSTRUBOT_API_CREDENCIALES_TTL
+                with override_settings(CONSTRUBOT_API_CREDENCIALES_TTL=ttl):
+                    modos[modo] = medir(funcion, args.logins)
+                sys.stderr.write('{}: {}\n'.format(modo, modos[modo]))
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+    reporte = {
+        'commit': get_commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'nucleos': os.cpu_count(),
+        'argon2': argon2,
+        'modos': modos,
+    }
+    contenido = json.dumps(reporte, indent=2, sort_keys=True)
+    if args.salida:
+        Path(args.salida).write_text(contenido + '\n')
+    else:
+        print(contenido)
+
+
+if __name__ == '__main__':
+    main()
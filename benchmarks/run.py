@@ -0,0 +1,170 @@
+"""
+Suite de rendimiento de construbot.
+
+Genera un tenant sintético con construbot.proyectos.poblacion en una base de
+datos de pruebas (``test_<NAME>`` de la base configurada, nunca la de
+desarrollo) y mide las vistas de benchmarks/escenarios.py con el cliente de
+pruebas de Django. El resultado es un JSON con llaves ordenadas para poder
+compararlo entre commits con ``python -m benchmarks.comparar``.
+
+Uso, desde la raíz del repositorio::
+
+    DATABASE_URL=postgres://... python -m benchmarks.run --escala mediana --salida mediana.json
+    # Volver a medir sobre los datos ya generados:
+    python -m benchmarks.run --escala mediana --reusar --salida despues.json
+
+Sin ``--con-cache`` el cache se vacía antes de cada petición, así se mide el
+trabajo completo de la vista y no las respuestas 304 ni los fragmentos en cache.
+"""
+import argparse
+import atexit
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def configurar_django():
+    sys.path.append(str(RAIZ / 'construbot'))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.test')
+    import django
+    from django.conf import settings
+    django.setup()
+    # La base de pruebas se destruye al terminar; sus archivos (imágenes de los
+    # generadores, PDFs) van a un directorio temporal que también se borra.
+    settings.MEDIA_ROOT = tempfile.mkdtemp(prefix='construbot-benchmark-')
+    atexit.register(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def medir(client, ruta, repeticiones, con_cache):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    tiempos = []
+    consultas = []
+    status = None
+    # La primera petición calienta conexiones, templates y el cache de rutas de archivos.
+    for i in range(repeticiones + 1):
+        if not con_cache:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            inicio = time.perf_counter()
+            response = client.get(ruta)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            transcurrido = time.perf_counter() - inicio
+        status = response.status_code
+        if i:
+            tiempos.append(transcurrido * 1000)
+            consultas.append(len(context))
+    return {
+        'url': ruta,
+        'status': status,
+        'consultas': max(consultas),
+        'mediana_ms': round(statistics.median(tiempos), 2),
+        'p95_ms': round(percentil(tiempos, 95), 2),
+        'min_ms': round(min(tiempos), 2),
+    }
+
+
+def get_tenant(nombre, escala, reusar, reportar):
+    from construbot.proyectos import poblacion
+    from construbot.users.models import Company
+    company = Company.objects.filter(company_name=nombre).first()
+    if company is not None:
+        if not reusar:
+            raise SystemExit('La base de pruebas ya tiene el tenant "{}", usa --reusar.'.format(nombre))
+        return company, company.user_set.get(username=nombre), None, 0
+    company, user = poblacion.crear_tenant(nombre)
+    inicio = time.perf_counter()
+    resumen = poblacion.GeneradorMasivo(company, user, reportar=reportar, **poblacion.ESCALAS[escala]).generar()
+    return company, user, resumen, round(time.perf_counter() - inicio, 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mide las vistas principales sobre un tenant sintético.')
+    parser.add_argument('--escala', default='chica', choices=['chica', 'mediana', 'grande'])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--salida', help='Archivo JSON del reporte; si no se da se imprime.')
+    parser.add_argument('--reusar', action='store_true', help='Conserva la base de pruebas y sus datos.')
+    parser.add_argument('--con-cache', action='store_true', help='No vacía el cache entre peticiones.')
+    parser.add_argument('--solo', nargs='*', help='Nombres de los escenarios a medir.')
+    args = parser.parse_args(argv)
+
+    configurar_django()
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from benchmarks.escenarios import ESCENARIOS, get_referencias
+    from construbot.proyectos import poblacion
+
+    def reportar(etapa, hechos, total):
+        sys.stderr.write('\r{}: {}/{}'.format(etapa, hechos, total) + ('\n' if hechos == total else ''))
+
+    setup_test_environment()
+    nombre_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, keepdb=args.reusar, serialize=False)
+    try:
+        nombre = 'benchmark-{}'.format(args.escala)
+        company, user, resumen, generacion = get_tenant(nombre, args.escala, args.reusar, reportar)
+        referencias = get_referencias(company)
+        client = Client()
+        client.force_login(user)
+        vistas = {}
+        for escenario, construir in ESCENARIOS:
+            if args.solo and escenario not in args.solo:
+                continue
+            ruta = construir(referencias)
+            try:
+                vistas[escenario] = medir(client, ruta, args.repeticiones, args.con_cache)
+            except Exception as e:
+                # P. ej. los autocompletes usan UNACCENT, que solo existe en PostgreSQL.
+                vistas[escenario] = {'url': ruta, 'error': '{}: {}'.format(type(e).__name__, e)}
+                sys.stderr.write('{}: {}\n'.format(escenario, vistas[escenario]['error']))
+                continue
+            sys.stderr.write('{}: {consultas} consultas, {mediana_ms} ms\n'.format(escenario, **vistas[escenario]))
+    finally:
+        if not args.reusar:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+    reporte = {
+        'commit': get_commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'base_de_datos': connection.vendor,
+        'escala': args.escala,
+        'parametros': poblacion.ESCALAS[args.escala],
+        'repeticiones': args.repeticiones,
+        'con_cache': args.con_cache,
+        'generacion_s': generacion,
+        'generados': resumen,
+        'vistas': vistas,
+    }
+    contenido = json.dumps(reporte, indent=2, sort_keys=True)
+    if args.salida:
+        Path(args.salida).write_text(contenido + '\n')
+    else:
+        print(contenido)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'construbot.api'
+
+    def ready(self):
+        from construbot.api.signals import handlers  # noqa: F401
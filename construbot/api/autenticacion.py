@@ -0,0 +1,112 @@
+"""
+Tokens JWT para los clientes del API.
+
+Los clientes de migración piden un token en api-token-auth por cada lote.
+Verificar la contraseña con Argon2 es lento a propósito, así que unas
+credenciales correctas se recuerdan CONSTRUBOT_API_CREDENCIALES_TTL segundos:
+la llave del cache es un HMAC del usuario y la contraseña con SECRET_KEY, nunca
+la contraseña, y guarda el id del usuario y el hash de su contraseña. Si la
+contraseña cambia o el usuario se desactiva el cache ya no sirve y se vuelve a
+autenticar completo. Las credenciales incorrectas nunca se guardan.
+
+Los tokens llevan además el customer, la compañía actual y el nivel de acceso
+del usuario al emitirse. UsuarioEnCacheJWTAuthentication toma el usuario de un
+cache de CONSTRUBOT_API_USUARIO_TTL segundos con la llave del id del usuario y
+su versión, ya con customer, compañía actual, nivel de acceso, compañías y
+grupos, así las llamadas seguidas no consultan la base de datos para
+autenticar. Cualquier cambio al usuario (signals/handlers.py) cambia la versión.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from construbot.proyectos.utils import get_version, reset_versions
+
+
+def get_llave_credenciales(username, password):
+    digest = salted_hmac('construbot.api.credenciales', '{}\x00{}'.format(username, password)).hexdigest()
+    return 'construbot:api-credenciales:{}'.format(digest)
+
+
+def get_usuario_en_cache(llave):
+    credenciales = cache.get(llave)
+    if credenciales is None:
+        return None
+    pk, password = credenciales
+    user = get_user_model()._default_manager.select_related('nivel_acceso').filter(pk=pk, password=password).first()
+    if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+        cache.delete(llave)
+        return None
+    return user
+
+
+def get_usuario_version_key(user_id):
+    return 'construbot:api-usuario-version:{}'.format(user_id)
+
+
+def reset_usuario_version(*user_ids):
+    # Al confirmar la transacción: antes, otra petición volvería a guardar al usuario sin el cambio con la
+    # versión nueva.
+    reset_versions(*[get_usuario_version_key(user_id) for user_id in user_ids])
+
+
+def get_usuario(user_id):
+    """Usuario activo o no con `user_id`, del cache si está; None si no existe."""
+    llave = 'construbot:api-usuario:{}:{}'.format(user_id, get_version(get_usuario_version_key(user_id)))
+    user = cache.get(llave)
+    if user is None:
+        user = get_user_model()._default_manager.select_related(
+            'customer', 'currently_at', 'nivel_acceso').prefetch_related(
+            'company', 'groups').filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is not None:
+            cache.set(llave, user, settings.CONSTRUBOT_API_USUARIO_TTL)
+    return user
+
+
+class UsuarioEnCacheJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+        user = get_usuario(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
+
+
+class CredencialesTokenSerializer(TokenObtainPairSerializer):
+
+    @classmethod
+    def get_token(cls, user):
+        token = super(CredencialesTokenSerializer, cls).get_token(user)
+        token['customer'] = user.customer_id
+        token['company'] = user.currently_at_id
+        token['nivel'] = user.nivel_acceso.nivel
+        return token
+
+    def validate(self, attrs):
+        ttl = settings.CONSTRUBOT_API_CREDENCIALES_TTL
+        if not ttl:
+            return super(CredencialesTokenSerializer, self).validate(attrs)
+        llave = get_llave_credenciales(attrs[self.username_field], attrs['password'])
+        self.user = get_usuario_en_cache(llave)
+        if self.user is None:
+            data = super(CredencialesTokenSerializer, self).validate(attrs)
+            # Después de authenticate(), por si el login actualizó el hash.
+            cache.set(llave, (self.user.pk, self.user.password), ttl)
+            return data
+        refresh = self.get_token(self.user)
+        return {'refresh': str(refresh), 'access': str(refresh.access_token)}
@@ -0,0 +1,295 @@
+"""
+Migración masiva de contratos, conceptos y estimaciones desde el sistema anterior.
+
+El payload se recorre una sola vez para juntar los nombres de compañías,
+clientes, sitios, unidades y destinatarios. Cada uno se resuelve con una sola
+consulta por tipo y lo que falta se inserta con `bulk_create`. Los contratos se
+insertan por lotes de `batch_size`, con las rutas de treebeard calculadas en
+memoria, y todo corre dentro de una sola transacción.
+
+`MigracionStream` aplica lo mismo a un flujo NDJSON de contratos: cada lote de
+líneas se migra en su propia transacción y se regresa el resultado de cada línea.
+
+`bulk_create` no manda post_save, así que las versiones de los listados y
+detalles (proyectos/signals/handlers.py) se invalidan al confirmar la transacción.
+"""
+from collections import defaultdict
+from itertools import islice
+from operator import itemgetter
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from construbot.users.models import Company
+from construbot.proyectos.models import Contraparte, Sitio, Destinatario, \
+    Contrato, Estimate, Concept, Units, EstimateConcept
+from construbot.proyectos.utils import reset_company_version, reset_contrato_version, reset_unidades_version
+
+
+def lotes(iterable, tamano):
+    iterable = iter(iterable)
+    while True:
+        lote = list(islice(iterable, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+class MigracionContratos(object):
+    batch_size = 500
+
+    def __init__(self, user, reportar=None):
+        self.user = user
+        self.reportar = reportar or (lambda etapa, procesados, total: None)
+        self.resumen = defaultdict(int)
+        # (compañía, folio) de los contratos que ya existían y no se insertaron.
+        self.omitidos = set()
+        self.paths = []
+
+    def migrar(self, payload):
+        """Inserta los contratos de `payload` que aún no existen y regresa
+        cuántos objetos se crearon de cada tipo."""
+        contratos = sorted(payload, key=itemgetter('folio'))
+        with transaction.atomic():
+            self.resolver_companies(contratos)
+            self.resolver_clientes(contratos)
+            self.resolver_sitios(contratos)
+            self.resolver_unidades(contratos)
+            nuevos = self.filtrar_existentes(contratos)
+            self.resolver_destinatarios(nuevos)
+            siguiente = Contrato.get_siguiente_posicion_raiz()
+            procesados = 0
+            for lote in lotes(nuevos, self.batch_size):
+                self.crear_contratos(lote, siguiente + procesados)
+                procesados += len(lote)
+                self.reportar('contratos', procesados, len(nuevos))
+            transaction.on_commit(self.reset_versiones)
+        return dict(self.resumen)
+
+    def reset_versiones(self):
+        company_ids = [company.pk for company in self.companies.values()]
+        reset_company_version(*company_ids)
+        for company_id in company_ids:
+            reset_unidades_version(company_id)
+        for path in self.paths:
+            reset_contrato_version(path)
+
+    def crear_faltantes(self, model, existentes, faltantes, etapa):
+        """Inserta `faltantes` ({llave: instancia sin guardar}) y los agrega a `existentes`."""
+        model.objects.bulk_create(faltantes.values(), batch_size=self.batch_size)
+        existentes.update(faltantes)
+        self.resumen[etapa] += len(faltantes)
+        self.reportar(etapa, len(faltantes), len(faltantes))
+
+    def resolver_companies(self, contratos):
+        nombres = {obj['company'] for obj in contratos}
+        self.companies = {
+            company.company_name: company for company in Company.objects.filter(
+                customer=self.user.customer, company_name__in=nombres)
+        }
+        faltantes = {
+            nombre: Company(company_name=nombre, customer=self.user.customer)
+            for nombre in nombres if nombre not in self.companies
+        }
+        self.crear_faltantes(Company, self.companies, faltantes, 'companies')
+        self.user.company.add(*self.companies.values())
+
+    def resolver_clientes(self, contratos):
+        # cliente_name es único en toda la tabla, no solo por compañía.
+        nombres = {obj['cliente']: self.companies[obj['company']] for obj in contratos}
+        self.clientes = {
+            cliente.cliente_name: cliente for cliente in Contraparte.objects.filter(cliente_name__in=nombres)
+        }
+        for nombre, cliente in self.clientes.items():
+            if cliente.company_id != nombres[nombre].pk:
+                raise ValidationError('El cliente {} pertenece a otra compañía.'.format(nombre))
+        faltantes = {
+            nombre: Contraparte(cliente_name=nombre, company=company, tipo='CLIENTE')
+            for nombre, company in nombres.items() if nombre not in self.clientes
+        }
+        self.crear_faltantes(Contraparte, self.clientes, faltantes, 'clientes')
+
+    def resolver_sitios(self, contratos):
+        self.sitios = {
+            (sitio.cliente_id, sitio.sitio_name): sitio for sitio in Sitio.objects.filter(
+                cliente__in=self.clientes.values(), sitio_name__in={obj['sitio_name'] for obj in contratos})
+        }
+        faltantes = {}
+        for obj in contratos:
+            cliente = self.clientes[obj['cliente']]
+            llave = (cliente.pk, obj['sitio_name'])
+            if llave not in self.sitios and llave not in faltantes:
+                faltantes[llave] = Sitio(
+                    cliente=cliente, sitio_name=obj['sitio_name'], sitio_location=obj['sitio_location'])
+        self.crear_faltantes(Sitio, self.sitios, faltantes, 'sitios')
+
+    def resolver_unidades(self, contratos):
+        requeridas = {
+            (self.companies[obj['company']].pk, concept['unit'])
+            for obj in contratos for concept in obj['concepts']
+        }
+        self.unidades = {
+            (unit.company_id, unit.unit): unit for unit in Units.objects.filter(
+                company__in=self.companies.values(), unit__in={unit for company, unit in requeridas})
+        }
+        faltantes = {
+            (company, unit): Units(company_id=company, unit=unit)
+            for company, unit in requeridas if (company, unit) not in self.unidades
+        }
+        self.crear_faltantes(Units, self.unidades, faltantes, 'unidades')
+
+    def filtrar_existentes(self, contratos):
+        existentes = set(Contrato.objects.filter(
+            contraparte__company__in=self.companies.values(), folio__in={obj['folio'] for obj in contratos}
+        ).values_list('contraparte__company', 'folio'))
+        nuevos = []
+        for obj in contratos:
+            if (self.companies[obj['company']].pk, obj['folio']) in existentes:
+                self.omitidos.add((obj['company'], obj['folio']))
+            else:
+                nuevos.append(obj)
+        self.resumen['contratos_omitidos'] = len(self.omitidos)
+        return nuevos
+
+    def resolver_destinatarios(self, contratos):
+        requeridos = {
+            (self.clientes[obj['cliente']].pk, firma['destinatario_text'], firma['puesto'])
+            for obj in contratos for estimacion in obj['estimates']
+            for firma in estimacion['auth_by'] + estimacion['auth_by_gen']
+        }
+        self.destinatarios = {
+            (destinatario.contraparte_id, destinatario.destinatario_text, destinatario.puesto): destinatario
+            for destinatario in Destinatario.objects.filter(
+                contraparte__in=self.clientes.values(),
+                destinatario_text__in={texto for cliente, texto, puesto in requeridos})
+        }
+        faltantes = {
+            (cliente, texto, puesto): Destinatario(contraparte_id=cliente, destinatario_text=texto, puesto=puesto)
+            for cliente, texto, puesto in requeridos if (cliente, texto, puesto) not in self.destinatarios
+        }
+        self.crear_faltantes(Destinatario, self.destinatarios, faltantes, 'destinatarios')
+
+    def crear_contratos(self, lote, posicion):
+        contratos = []
+        for i, obj in enumerate(lote):
+            cliente = self.clientes[obj['cliente']]
+            contratos.append(Contrato(
+                path=Contrato._get_path(None, 1, posicion + i), depth=1, numchild=0,
+                folio=obj['folio'], code=obj['code'], fecha=obj['fecha'],
+                contrato_name=obj['contrato_name'], contrato_shortName=obj['contrato_shortName'],
+                contraparte=cliente, sitio=self.sitios[(cliente.pk, obj['sitio_name'])],
+                status=obj['status'], monto=obj['monto'], anticipo=0,
+            ))
+        Contrato.objects.bulk_create(contratos)
+        self.paths.extend(contrato.path for contrato in contratos)
+        Contrato.users.through.objects.bulk_create([
+            Contrato.users.through(contrato_id=contrato.pk, user_id=self.user.pk) for contrato in contratos
+        ])
+        self.resumen['contratos'] += len(contratos)
+        conceptos = self.crear_conceptos(lote, contratos)
+        self.crear_estimaciones(lote, contratos, conceptos)
+
+    def crear_conceptos(self, lote, contratos):
+        conceptos = {}
+        for obj, contrato in zip(lote, contratos):
+            company_id = self.companies[obj['company']].pk
+            for concept in obj['concepts']:
+                conceptos[(contrato.pk, concept['concept_text'])] = Concept(
+                    code=concept['code'], concept_text=concept['concept_text'], project=contrato,
+                    unit=self.unidades[(company_id, concept['unit'])],
+                    total_cuantity=concept['total_cuantity'], unit_price=concept['unit_price'],
+                )
+        Concept.objects.bulk_create(conceptos.values(), batch_size=self.batch_size)
+        self.resumen['conceptos'] += len(conceptos)
+        return conceptos
+
+    def crear_estimaciones(self, lote, contratos, conceptos):
+        estimaciones = []
+        for obj, contrato in zip(lote, contratos):
+            for estimacion in sorted(obj['estimates'], key=itemgetter('consecutive')):
+                estimaciones.append((obj, estimacion, Estimate(
+                    project=contrato, consecutive=estimacion['consecutive'],
+                    draft_by=self.user, supervised_by=self.user,
+                    start_date=estimacion['start_date'], finish_date=estimacion['finish_date'],
+                    auth_date=estimacion['auth_date'], paid=estimacion['paid'],
+                    invoiced=estimacion['invoiced'], payment_date=estimacion['payment_date'],
+                )))
+        Estimate.objects.bulk_create([estimate for obj, data, estimate in estimaciones], batch_size=self.batch_size)
+        self.resumen['estimaciones'] += len(estimaciones)
+        estimate_concepts = []
+        auth_by = []
+        auth_by_gen = []
+        for obj, data, estimate in estimaciones:
+            for ec in sorted(data['estimate_concepts'], key=itemgetter('id')):
+                try:
+                    concepto = conceptos[(estimate.project.pk, ec['concept'])]
+                except KeyError:
+                    raise ValidationError('El concepto "{}" de la estimación {} del contrato {} no existe.'.format(
+                        ec['concept'], data['consecutive'], obj['folio']))
+                estimate_concepts.append(EstimateConcept(
+                    estimate=estimate, concept=concepto,
+                    cuantity_estimated=ec['cuantity_estimated'], observations=ec['observations'],
+                ))
+            cliente_id = self.clientes[obj['cliente']].pk
+            for firmas, through in ((data['auth_by'], auth_by), (data['auth_by_gen'], auth_by_gen)):
+                ids = {
+                    self.destinatarios[(cliente_id, firma['destinatario_text'], firma['puesto'])].pk
+                    for firma in firmas
+                }
+                through.extend((estimate.pk, destinatario_id) for destinatario_id in ids)
+        EstimateConcept.objects.bulk_create(estimate_concepts, batch_size=self.batch_size)
+        self.resumen['estimate_concepts'] += len(estimate_concepts)
+        for campo, relaciones in (('auth_by', auth_by), ('auth_by_gen', auth_by_gen)):
+            Through = getattr(Estimate, campo).through
+            Through.objects.bulk_create([
+                Through(estimate_id=estimate_id, destinatario_id=destinatario_id)
+                for estimate_id, destinatario_id in relaciones
+            ], batch_size=self.batch_size)
+
+
+ERRORES_MIGRACION = (ValidationError, KeyError, TypeError, ValueError, DatabaseError)
+
+
+def describir_error(error):
+    if isinstance(error, ValidationError):
+        return '; '.join(error.messages)
+    if isinstance(error, KeyError):
+        return 'Falta el campo {}'.format(error)
+    return str(error)
+
+
+class MigracionStream(object):
+    """Migra contratos que llegan como (línea, objeto, error) desde
+    `parsers.leer_lineas`, confirmando cada `lote` líneas."""
+    lote_default = 100
+    lote_maximo = 1000
+
+    def __init__(self, user, lote=None):
+        self.user = user
+        self.lote = max(1, min(lote or self.lote_default, self.lote_maximo))
+
+    def procesar(self, lineas):
+        for lote in lotes(lineas, self.lote):
+            yield from self.procesar_lote(lote)
+
+    def procesar_lote(self, lote):
+        validas = [(numero, obj) for numero, obj, error in lote if error is None]
+        try:
+            migracion = MigracionContratos(self.user)
+            migracion.migrar([obj for numero, obj in validas])
+            resultados = {numero: self.resultado(numero, obj, migracion) for numero, obj in validas}
+        except ERRORES_MIGRACION:
+            # Se repite línea por línea para que solo se pierdan las que fallan.
+            resultados = {numero: self.migrar_linea(numero, obj) for numero, obj in validas}
+        for numero, obj, error in lote:
+            yield resultados.get(numero) or {'linea': numero, 'estado': 'error', 'error': error}
+
+    def migrar_linea(self, numero, obj):
+        migracion = MigracionContratos(self.user)
+        try:
+            migracion.migrar([obj])
+        except ERRORES_MIGRACION as e:
+            return {'linea': numero, 'estado': 'error', 'error': describir_error(e)}
+        return self.resultado(numero, obj, migracion)
+
+    def resultado(self, numero, obj, migracion):
+        estado = 'omitido' if (obj['company'], obj['folio']) in migracion.omitidos else 'creado'
+        return {'linea': numero, 'folio': obj['folio'], 'estado': estado}
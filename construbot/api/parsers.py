@@ -0,0 +1,25 @@
+import json
+from rest_framework.parsers import BaseParser
+
+
+def leer_lineas(stream):
+    """Genera (número de línea, objeto, error) leyendo el cuerpo línea por línea."""
+    for numero, linea in enumerate(iter(stream.readline, b''), 1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield numero, json.loads(linea), None
+        except ValueError as e:
+            yield numero, None, 'JSON inválido: {}'.format(e)
+
+
+class NDJSONParser(BaseParser):
+    """JSON delimitado por saltos de línea. En lugar de cargar el cuerpo completo
+    regresa un generador, así que `request.data` solo puede recorrerse una vez."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        return leer_lineas(stream)
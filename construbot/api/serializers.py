@@ -1,6 +1,7 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from construbot.users.models import Customer
+from construbot.proyectos.models import Contrato, Estimate, Concept, EstimateConcept
 
 User = get_user_model()
 
@@ -14,3 +15,83 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         exclude = ['password']
+
+
+class SparseFieldsetSerializer(serializers.ModelSerializer):
+    """Permite pedir solo algunos campos con `?fields=campo1,campo2`.
+
+    `select_related` y `prefetch_related` relacionan cada campo del serializer
+    con la relación que necesita, así `optimizar_queryset` solo hace los joins
+    de los campos que se van a regresar."""
+    select_related = {}
+    prefetch_related = {}
+
+    def __init__(self, *args, **kwargs):
+        super(SparseFieldsetSerializer, self).__init__(*args, **kwargs)
+        campos = self.get_campos_solicitados(self.context.get('request'))
+        if campos:
+            for nombre in set(self.fields) - campos:
+                self.fields.pop(nombre)
+
+    @staticmethod
+    def get_campos_solicitados(request):
+        if request is None or not request.query_params.get('fields'):
+            return set()
+        return {campo.strip() for campo in request.query_params['fields'].split(',') if campo.strip()}
+
+    @classmethod
+    def optimizar_queryset(cls, queryset, request=None):
+        campos = cls.get_campos_solicitados(request) or set(cls.Meta.fields)
+        select = [ruta for campo, ruta in cls.select_related.items() if campo in campos]
+        prefetch = [ruta for campo, ruta in cls.prefetch_related.items() if campo in campos]
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+class ContratoSerializer(SparseFieldsetSerializer):
+    contraparte = serializers.CharField(source='contraparte.cliente_name', read_only=True)
+    sitio = serializers.CharField(source='sitio.sitio_name', read_only=True)
+    select_related = {'contraparte': 'contraparte', 'sitio': 'sitio'}
+
+    class Meta:
+        model = Contrato
+        fields = (
+            'id', 'folio', 'code', 'fecha', 'contrato_name', 'contrato_shortName', 'contraparte', 'sitio',
+            'status', 'monto', 'anticipo', 'depth',
+        )
+
+
+class EstimateSerializer(SparseFieldsetSerializer):
+    total_estimacion = serializers.DecimalField(max_digits=20, decimal_places=2, read_only=True)
+    auth_by = serializers.SlugRelatedField(slug_field='destinatario_text', many=True, read_only=True)
+    prefetch_related = {'auth_by': 'auth_by'}
+
+    class Meta:
+        model = Estimate
+        fields = (
+            'id', 'project', 'consecutive', 'start_date', 'finish_date', 'draft_date', 'auth_date',
+            'paid', 'invoiced', 'payment_date', 'auth_by', 'total_estimacion',
+        )
+
+
+class ConceptSerializer(SparseFieldsetSerializer):
+    unit = serializers.CharField(source='unit.unit', read_only=True)
+    select_related = {'unit': 'unit'}
+
+    class Meta:
+        model = Concept
+        fields = ('id', 'project', 'code', 'concept_text', 'unit', 'total_cuantity', 'unit_price')
+
+
+class EstimateConceptSerializer(SparseFieldsetSerializer):
+    concept_text = serializers.CharField(source='concept.concept_text', read_only=True)
+    unit_price = serializers.DecimalField(
+        source='concept.unit_price', max_digits=12, decimal_places=2, read_only=True)
+    select_related = {'concept_text': 'concept', 'unit_price': 'concept'}
+
+    class Meta:
+        model = EstimateConcept
+        fields = ('id', 'estimate', 'concept', 'concept_text', 'unit_price', 'cuantity_estimated', 'observations')
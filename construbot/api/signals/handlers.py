@@ -0,0 +1,27 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from construbot.api.autenticacion import reset_usuario_version
+from construbot.users.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def reset_api_usuario_version(sender, instance, **kwargs):
+    reset_usuario_version(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.company.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def reset_api_usuario_relaciones_version(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # post_clear del lado de la compañía o el grupo llega sin pk_set: los
+        # usuarios se toman antes de quitar las relaciones.
+        instance._usuarios_por_limpiar = list(instance.user_set.values_list('pk', flat=True))
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        reset_usuario_version(instance.pk)
+    elif action == 'post_clear':
+        reset_usuario_version(*instance.__dict__.pop('_usuarios_por_limpiar', []))
+    elif pk_set:
+        reset_usuario_version(*pk_set)
@@ -0,0 +1,122 @@
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+from construbot.users.tests import factories, utils
+
+
+class CredencialesTokenTest(utils.BaseTestCase):
+
+    def setUp(self):
+        super(CredencialesTokenTest, self).setUp()
+        cache.clear()
+
+    def pedir_token(self, password='password'):
+        return self.client.post(reverse('api:token_auth'), {'email': self.user.email, 'password': password})
+
+    def test_verified_credentials_skip_password_check(self):
+        self.assertEqual(self.pedir_token().status_code, 200)
+        with mock.patch('construbot.users.models.User.check_password') as check_password:
+            with CaptureQueriesContext(connection) as context:
+                response = self.pedir_token()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+        check_password.assert_not_called()
+        self.assertEqual(len([q for q in context.captured_queries if q['sql'].startswith('SELECT')]), 1)
+
+    def test_wrong_password_is_not_cached(self):
+        self.assertEqual(self.pedir_token().status_code, 200)
+        self.assertEqual(self.pedir_token('otra').status_code, 401)
+        self.assertEqual(self.pedir_token('otra').status_code, 401)
+
+    def test_password_change_invalidates_cached_credentials(self):
+        self.assertEqual(self.pedir_token().status_code, 200)
+        self.user.set_password('nueva')
+        self.user.save()
+        self.assertEqual(self.pedir_token().status_code, 401)
+        self.assertEqual(self.pedir_token('nueva').status_code, 200)
+
+    def test_inactive_user_is_rejected_from_cache(self):
+        self.assertEqual(self.pedir_token().status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.pedir_token().status_code, 401)
+
+    @override_settings(CONSTRUBOT_API_CREDENCIALES_TTL=0)
+    def test_cache_can_be_disabled(self):
+        self.assertEqual(self.pedir_token().status_code, 200)
+        with mock.patch('construbot.users.models.User.check_password', return_value=True) as check_password:
+            self.assertEqual(self.pedir_token().status_code, 200)
+        check_password.assert_called_once()
+
+
+class UsuarioEnCacheJWTAuthenticationTest(utils.BaseTestCase):
+
+    def setUp(self):
+        super(UsuarioEnCacheJWTAuthenticationTest, self).setUp()
+        cache.clear()
+        self.company = factories.CompanyFactory(customer=self.user.customer)
+        self.user.nivel_acceso = self.director_permission
+        self.user.company.add(self.company)
+        self.user.currently_at = self.company
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+        response = self.client.post(reverse('api:token_auth'), {'email': self.user.email, 'password': 'password'})
+        self.access = response.json()['access']
+
+    def consultas_de_autenticacion(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('api:contratos'), HTTP_AUTHORIZATION='Bearer ' + self.access)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in context.captured_queries
+                if 'FROM "users_user"' in q['sql'] or 'FROM "auth_group"' in q['sql']]
+
+    def test_token_has_customer_company_and_level_claims(self):
+        token = AccessToken(self.access)
+        self.assertEqual(token['customer'], self.user.customer_id)
+        self.assertEqual(token['company'], self.company.pk)
+        self.assertEqual(token['nivel'], 3)
+
+    def test_steady_state_does_no_auth_queries(self):
+        self.assertNotEqual(self.consultas_de_autenticacion(), [])
+        self.assertEqual(self.consultas_de_autenticacion(), [])
+
+    def test_user_change_invalidates_cached_user(self):
+        self.consultas_de_autenticacion()
+        otra = factories.CompanyFactory(customer=self.user.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.company.add(otra)
+        self.assertNotEqual(self.consultas_de_autenticacion(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.establecer_compania(otra)
+        response = self.client.get(reverse('api:contratos'), HTTP_AUTHORIZATION='Bearer ' + self.access)
+        self.assertEqual(response.wsgi_request.user.currently_at, otra)
+
+    def test_cached_user_is_kept_until_commit(self):
+        self.consultas_de_autenticacion()
+        otra = factories.CompanyFactory(customer=self.user.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.company.add(otra)
+            self.user.currently_at = otra
+            self.user.save()
+            self.assertEqual(self.consultas_de_autenticacion(), [])
+        response = self.client.get(reverse('api:contratos'), HTTP_AUTHORIZATION='Bearer ' + self.access)
+        self.assertEqual(response.wsgi_request.user.currently_at, otra)
+
+    def test_clearing_users_from_group_invalidates_cached_user(self):
+        self.consultas_de_autenticacion()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.proyectos_group.user_set.clear()
+        response = self.client.get(reverse('api:contratos'), HTTP_AUTHORIZATION='Bearer ' + self.access)
+        self.assertEqual(response.status_code, 403)
+
+    def test_inactive_user_is_rejected(self):
+        self.consultas_de_autenticacion()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get(reverse('api:contratos'), HTTP_AUTHORIZATION='Bearer ' + self.access)
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,80 @@
+from django.urls import reverse
+from construbot.users.tests import utils
+from construbot.proyectos.tests import factories
+
+
+class LecturaApiTest(utils.ConsultasConstantesMixin, utils.BaseTestCase):
+
+    def setUp(self):
+        super(LecturaApiTest, self).setUp()
+        self.company = factories.CompanyFactory(customer=self.user.customer)
+        self.user.nivel_acceso = self.director_permission
+        self.user.company.add(self.company)
+        self.user.currently_at = self.company
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+        self.client.login(username=self.user.username, password='password')
+        self.contrato = factories.ContratoFactory(contraparte__company=self.company)
+        self.unit = factories.UnitFactory(company=self.company)
+
+    def crear_estimaciones(self, cantidad):
+        estimaciones = []
+        for i in range(cantidad):
+            estimate = factories.EstimateFactory(
+                project=self.contrato, draft_by=self.user, supervised_by=self.user, consecutive=i + 1)
+            estimate.auth_by.add(factories.DestinatarioFactory(contraparte=self.contrato.contraparte))
+            concepto = factories.ConceptoFactory(project=self.contrato, unit=self.unit, unit_price=12.5)
+            factories.EstimateConceptFactory(estimate=estimate, concept=concepto, cuantity_estimated=3)
+            estimaciones.append(estimate)
+        return estimaciones
+
+    def test_contratos_only_from_current_company(self):
+        factories.ContratoFactory(contraparte__company=factories.CompanyFactory(customer=self.user.customer))
+        response = self.client.get(reverse('api:contratos'))
+        self.assertEqual([contrato['id'] for contrato in response.data['results']], [self.contrato.pk])
+        self.assertEqual(response.data['results'][0]['contraparte'], self.contrato.contraparte.cliente_name)
+
+    def test_contratos_restricted_to_assigned_for_lower_levels(self):
+        self.user.nivel_acceso = self.auxiliar_permission
+        self.user.save()
+        response = self.client.get(reverse('api:contratos'))
+        self.assertEqual(response.data['results'], [])
+        self.contrato.users.add(self.user)
+        response = self.client.get(reverse('api:contrato', kwargs={'pk': self.contrato.pk}))
+        self.assertEqual(response.data['id'], self.contrato.pk)
+
+    def test_requires_proyectos_group(self):
+        self.user.groups.remove(self.proyectos_group)
+        response = self.client.get(reverse('api:contratos'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get(reverse('api:contratos'), {'fields': 'id,folio'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'folio'})
+
+    def test_estimaciones_total_matches_model(self):
+        estimate = self.crear_estimaciones(1)[0]
+        response = self.client.get(reverse('api:estimacion', kwargs={'pk': estimate.pk}))
+        self.assertEqual(response.data['total_estimacion'], '{:.2f}'.format(estimate.total_estimate()['total']))
+        self.assertEqual(len(response.data['auth_by']), 1)
+
+    def test_estimaciones_filter_by_contrato(self):
+        self.crear_estimaciones(1)
+        response = self.client.get(reverse('api:estimaciones'), {'contrato': self.contrato.pk + 1000})
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get(reverse('api:estimaciones'), {'contrato': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        self.crear_estimaciones(3)
+        response = self.client.get(reverse('api:estimaciones'), {'limite': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for nombre in ('estimaciones', 'conceptos', 'estimaciones_conceptos', 'contratos'):
+            with self.subTest(nombre):
+                self.assertConsultasConstantes(
+                    lambda datos: self.client.get(reverse('api:' + nombre)), self.crear_estimaciones, (2, 10))
@@ -0,0 +1,157 @@
+import io
+import json
+from unittest import mock
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from construbot.users.tests import utils
+from construbot.api.migracion import MigracionContratos
+from construbot.api.parsers import NDJSONParser
+from construbot.proyectos.models import Contrato, Estimate, EstimateConcept, Destinatario, Units
+from construbot.proyectos.tests import factories
+from construbot.proyectos.utils import get_company_version_key, get_version
+
+
+def contrato_payload(folio, company='Migrada', cliente='Cliente migrado'):
+    return {
+        'company': company, 'cliente': cliente, 'sitio_name': 'Sitio migrado', 'sitio_location': 'CDMX',
+        'folio': folio, 'code': 'C-{}'.format(folio), 'fecha': '2017-01-15',
+        'contrato_name': 'Contrato {}'.format(folio), 'contrato_shortName': 'C{}'.format(folio),
+        'status': True, 'monto': '150000.00',
+        'concepts': [
+            {'code': '1', 'concept_text': 'Excavación', 'unit': 'm3', 'total_cuantity': '100', 'unit_price': '50'},
+            {'code': '2', 'concept_text': 'Relleno', 'unit': 'm3', 'total_cuantity': '80', 'unit_price': '30'},
+        ],
+        'estimates': [{
+            'consecutive': 1, 'start_date': '2017-02-01', 'finish_date': '2017-02-15', 'draft_date': '2017-02-16',
+            'auth_date': None, 'paid': False, 'invoiced': True, 'payment_date': None,
+            'estimate_concepts': [
+                {'id': 2, 'concept': 'Relleno', 'cuantity_estimated': '10', 'observations': ''},
+                {'id': 1, 'concept': 'Excavación', 'cuantity_estimated': '20', 'observations': 'ok'},
+            ],
+            'auth_by': [{'destinatario_text': 'Ing. Pérez', 'puesto': 'Residente'}],
+            'auth_by_gen': [{'destinatario_text': 'Ing. Pérez', 'puesto': 'Residente'}],
+        }],
+    }
+
+
+class MigracionContratosTest(utils.BaseTestCase):
+
+    def test_migrar_creates_contracts_with_concepts_and_estimates(self):
+        reportes = []
+        resumen = MigracionContratos(self.user, reportar=lambda *args: reportes.append(args)).migrar(
+            [contrato_payload(2), contrato_payload(1)])
+        self.assertEqual(resumen['contratos'], 2)
+        self.assertEqual(resumen['conceptos'], 4)
+        self.assertEqual(resumen['estimate_concepts'], 4)
+        self.assertEqual(resumen['unidades'], 1)
+        self.assertEqual(resumen['destinatarios'], 1)
+        self.assertIn(('contratos', 2, 2), reportes)
+        contratos = Contrato.objects.filter(contraparte__cliente_name='Cliente migrado').order_by('path')
+        self.assertEqual([contrato.folio for contrato in contratos], [1, 2])
+        self.assertTrue(all(contrato.users.filter(pk=self.user.pk).exists() for contrato in contratos))
+        self.assertEqual(Contrato.find_problems(), ([], [], [], [], []))
+        self.assertEqual(self.user.company.get().company_name, 'Migrada')
+        estimate = Estimate.objects.get(project=contratos[0])
+        self.assertEqual(estimate.auth_by.get().destinatario_text, 'Ing. Pérez')
+        self.assertEqual(estimate.auth_by_gen.get(), estimate.auth_by.get())
+        self.assertEqual(
+            EstimateConcept.objects.get(estimate=estimate, concept__concept_text='Excavación').cuantity_estimated, 20)
+
+    def test_migrar_query_count_does_not_grow_with_contracts(self):
+        queries = []
+        for folios in (range(1, 3), range(3, 13)):
+            company = 'Compañía {}'.format(folios[0])
+            payload = [contrato_payload(folio, company, 'Cliente {}'.format(company)) for folio in folios]
+            with CaptureQueriesContext(connection) as context:
+                MigracionContratos(self.user).migrar(payload)
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+
+    def test_migrar_skips_existing_contracts_and_reuses_catalogs(self):
+        MigracionContratos(self.user).migrar([contrato_payload(1)])
+        resumen = MigracionContratos(self.user).migrar([contrato_payload(1), contrato_payload(2)])
+        self.assertEqual(resumen['contratos'], 1)
+        self.assertEqual(resumen['contratos_omitidos'], 1)
+        self.assertEqual(resumen['clientes'], 0)
+        self.assertEqual(resumen['unidades'], 0)
+        self.assertEqual(Units.objects.filter(unit='m3').count(), 1)
+        self.assertEqual(Destinatario.objects.filter(destinatario_text='Ing. Pérez').count(), 1)
+
+    def test_migrar_paths_follow_existing_root_nodes(self):
+        existente = factories.ContratoFactory()
+        MigracionContratos(self.user).migrar([contrato_payload(1)])
+        nuevo = Contrato.add_root(
+            folio=2, fecha='2018-01-01', contrato_name='nuevo', contrato_shortName='nuevo',
+            contraparte=existente.contraparte, sitio=existente.sitio
+        )
+        migrado = Contrato.objects.get(contraparte__cliente_name='Cliente migrado')
+        self.assertLess(existente.path, migrado.path)
+        self.assertLess(migrado.path, nuevo.path)
+
+    def test_migrar_resets_versions_of_existing_company(self):
+        company = factories.CompanyFactory(customer=self.user.customer, company_name='Migrada')
+        key = get_company_version_key(company.pk)
+        get_version(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            MigracionContratos(self.user).migrar([contrato_payload(1)])
+        self.assertIsNone(cache.get(key))
+
+    def test_migrar_rolls_back_on_unknown_concept(self):
+        payload = contrato_payload(1)
+        payload['estimates'][0]['estimate_concepts'][0]['concept'] = 'No existe'
+        with self.assertRaises(ValidationError):
+            MigracionContratos(self.user).migrar([payload])
+        self.assertFalse(Contrato.objects.filter(folio=1, contraparte__cliente_name='Cliente migrado').exists())
+
+    def test_migration_endpoint(self):
+        self.client.login(username=self.user.username, password='password')
+        response = self.client.post(
+            reverse('api:migracion_de_contratos'), data=json.dumps({'payload': [contrato_payload(1)]}),
+            content_type='application/json'
+        )
+        self.assertTrue(response.data['exito'])
+        self.assertEqual(response.data['resumen']['contratos'], 1)
+
+
+class MigracionStreamTest(utils.BaseTestCase):
+
+    def post_ndjson(self, lineas, **params):
+        self.client.login(username=self.user.username, password='password')
+        response = self.client.post(
+            reverse('api:migracion_stream') + ('?lote={}'.format(params['lote']) if params else ''),
+            data='\n'.join(lineas), content_type='application/x-ndjson'
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(linea) for linea in b''.join(response.streaming_content).splitlines()]
+
+    def test_parser_reads_lines_lazily(self):
+        cuerpo = io.BytesIO(b'{"folio": 1}\n\nno es json\n')
+        lineas = NDJSONParser().parse(cuerpo)
+        self.assertEqual(next(lineas), (1, {'folio': 1}, None))
+        self.assertEqual(cuerpo.tell(), len(b'{"folio": 1}\n'))
+        numero, obj, error = next(lineas)
+        self.assertEqual((numero, obj), (3, None))
+        self.assertIn('JSON inválido', error)
+
+    def test_stream_reports_each_line_and_keeps_valid_ones(self):
+        roto = contrato_payload(2)
+        roto['estimates'][0]['estimate_concepts'][0]['concept'] = 'No existe'
+        resultados = self.post_ndjson([
+            json.dumps(contrato_payload(1)), '{roto', json.dumps(roto), json.dumps(contrato_payload(3)),
+        ])
+        self.assertEqual([resultado['estado'] for resultado in resultados], ['creado', 'error', 'error', 'creado'])
+        self.assertEqual([resultado['linea'] for resultado in resultados], [1, 2, 3, 4])
+        self.assertIn('No existe', resultados[2]['error'])
+        folios = Contrato.objects.filter(contraparte__cliente_name='Cliente migrado').values_list('folio', flat=True)
+        self.assertEqual(sorted(folios), [1, 3])
+
+    def test_stream_commits_in_batches_and_skips_existing(self):
+        MigracionContratos(self.user).migrar([contrato_payload(1)])
+        migrar = MigracionContratos.migrar
+        with mock.patch.object(MigracionContratos, 'migrar', autospec=True, side_effect=migrar) as mock_migrar:
+            resultados = self.post_ndjson([json.dumps(contrato_payload(folio)) for folio in (1, 2, 3)], lote=2)
+        self.assertEqual([resultado['estado'] for resultado in resultados], ['omitido', 'creado', 'creado'])
+        self.assertEqual([len(call.args[1]) for call in mock_migrar.call_args_list], [2, 1])
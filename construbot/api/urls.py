@@ -1,5 +1,5 @@
 from django.urls import re_path
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
+from rest_framework_simplejwt.views import TokenRefreshView, TokenVerifyView
 
 from . import views
 
@@ -7,9 +7,15 @@ app_name = 'construbot.api'
 
 urlpatterns = [
     re_path('customer/list/', views.CustomerList.as_view(), name='customerlist'),
-    re_path(r'^api-token-auth/', TokenObtainPairView.as_view()),
+    re_path(r'^api-token-auth/', views.CredencialesTokenView.as_view(), name='token_auth'),
     re_path(r'^api-token-refresh/', TokenRefreshView.as_view()),
     re_path(r'^api-token-verify/', TokenVerifyView.as_view()),
+    re_path(r'^contratos/$', views.ContratoList.as_view(), name='contratos'),
+    re_path(r'^contratos/(?P<pk>\d+)/$', views.ContratoRetrieve.as_view(), name='contrato'),
+    re_path(r'^estimaciones/$', views.EstimateList.as_view(), name='estimaciones'),
+    re_path(r'^estimaciones/(?P<pk>\d+)/$', views.EstimateRetrieve.as_view(), name='estimacion'),
+    re_path(r'^conceptos/$', views.ConceptList.as_view(), name='conceptos'),
+    re_path(r'^estimaciones-conceptos/$', views.EstimateConceptList.as_view(), name='estimaciones_conceptos'),
     re_path(r'^users/unique/$', views.email_uniqueness, name='get_user'
     ),
     re_path(r'^create/$', views.create_customer_user_and_company, name='creation'
@@ -22,6 +28,8 @@ urlpatterns = [
     ),
     re_path(r'^migraciones/Destinatario/$', views.DataMigration.destinatario_migration, name='migracion_de_sitios'
     ),
+    re_path(r'^migraciones/stream/$', views.DataMigration.contrato_stream_migration, name='migracion_stream'
+    ),
     re_path(r'^migraciones/Contrato/$', views.DataMigration.contrato_concept_and_estimate_migration, name='migracion_de_contratos'
     ),
 ]
@@ -1,18 +1,28 @@
 import json
-from operator import itemgetter
+import logging
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.core.exceptions import ValidationError
-from rest_framework import generics
-from rest_framework.permissions import IsAdminUser
-from rest_framework.decorators import api_view
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from rest_framework import generics, serializers
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import BasePermission, IsAdminUser
+from rest_framework.decorators import api_view, parser_classes
 from rest_framework.response import Response
+from rest_framework_simplejwt.views import TokenObtainPairView
 from construbot.users.models import Company, Customer, NivelAcceso
-from construbot.api.serializers import CustomerSerializer, UserSerializer
-from construbot.proyectos.models import Contraparte, Sitio, Destinatario, \
-    Contrato, Estimate, Concept, Units, EstimateConcept
+from construbot.api.autenticacion import CredencialesTokenSerializer
+from construbot.api.serializers import CustomerSerializer, UserSerializer, ContratoSerializer, \
+    EstimateSerializer, ConceptSerializer, EstimateConceptSerializer
+from construbot.api.migracion import MigracionContratos, MigracionStream
+from construbot.api.parsers import NDJSONParser
+from construbot.proyectos.apps import ProyectosConfig
+from construbot.proyectos.models import Contraparte, Sitio, Destinatario, Estimate
+from construbot.proyectos.views import ProyectosMenuMixin
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 class CustomerList(generics.ListCreateAPIView):
@@ -21,6 +31,10 @@ class CustomerList(generics.ListCreateAPIView):
     queryset = Customer.objects.all()
 
 
+class CredencialesTokenView(TokenObtainPairView):
+    serializer_class = CredencialesTokenSerializer
+
+
 class UserRetrive(generics.RetrieveAPIView):
     permission_classes = (IsAdminUser,)
     serializer_class = UserSerializer
@@ -28,6 +42,91 @@ class UserRetrive(generics.RetrieveAPIView):
     lookup_field = 'email'
 
 
+class ProyectosPermission(BasePermission):
+    """Igual que en las vistas de proyectos, el usuario debe pertenecer al grupo de la aplicación."""
+
+    def has_permission(self, request, view):
+        # Con UsuarioEnCacheJWTAuthentication los grupos ya vienen en el usuario.
+        nombre = ProyectosConfig.verbose_name.lower()
+        return any(group.name.lower() == nombre for group in request.user.groups.all())
+
+
+class ProyectosPagination(CursorPagination):
+    ordering = 'pk'
+    page_size = 100
+    page_size_query_param = 'limite'
+    max_page_size = 1000
+
+
+class ProyectosReadMixin(object):
+    """Lectura de los modelos de proyectos limitada a la compañía actual del
+    usuario. Los usuarios con nivel menor a Director solo ven lo de los
+    contratos que tienen asignados, como en los listados HTML."""
+    permission_classes = (ProyectosPermission,)
+    pagination_class = ProyectosPagination
+    asignacion = None
+    filtros = {}
+
+    def get_company_query(self, opcion):
+        return ProyectosMenuMixin.get_company_query(self, opcion)
+
+    def get_base_queryset(self):
+        return self.serializer_class.Meta.model.objects.all()
+
+    def get_queryset(self):
+        queryset = self.get_base_queryset().filter(
+            **self.get_company_query(self.serializer_class.Meta.model.__name__))
+        if self.request.user.nivel_acceso.nivel < 3:
+            queryset = queryset.filter(**{self.asignacion: self.request.user})
+        for param, lookup in self.filtros.items():
+            valor = self.request.query_params.get(param)
+            if valor is None:
+                continue
+            if not valor.isdigit():
+                raise serializers.ValidationError({param: 'Debe ser un número.'})
+            queryset = queryset.filter(**{lookup: valor})
+        return self.serializer_class.optimizar_queryset(queryset, self.request)
+
+
+class ContratoList(ProyectosReadMixin, generics.ListAPIView):
+    serializer_class = ContratoSerializer
+    asignacion = 'users'
+
+
+class ContratoRetrieve(ProyectosReadMixin, generics.RetrieveAPIView):
+    serializer_class = ContratoSerializer
+    asignacion = 'users'
+
+
+class EstimateReadMixin(ProyectosReadMixin):
+    serializer_class = EstimateSerializer
+    asignacion = 'project__users'
+    filtros = {'contrato': 'project'}
+
+    def get_base_queryset(self):
+        return Estimate.especial.con_totales()
+
+
+class EstimateList(EstimateReadMixin, generics.ListAPIView):
+    pass
+
+
+class EstimateRetrieve(EstimateReadMixin, generics.RetrieveAPIView):
+    pass
+
+
+class ConceptList(ProyectosReadMixin, generics.ListAPIView):
+    serializer_class = ConceptSerializer
+    asignacion = 'project__users'
+    filtros = {'contrato': 'project'}
+
+
+class EstimateConceptList(ProyectosReadMixin, generics.ListAPIView):
+    serializer_class = EstimateConceptSerializer
+    asignacion = 'estimate__project__users'
+    filtros = {'estimacion': 'estimate', 'concepto': 'concept'}
+
+
 @api_view(['POST'])
 def email_uniqueness(request):
     if request.method == 'POST':
@@ -138,109 +237,30 @@ class DataMigration(object):
 
     @api_view(['POST'])
     def contrato_concept_and_estimate_migration(request):
-        json_data = json.loads(request.data)
-        data = sorted(json_data['payload'], key=itemgetter('folio'))
-        for obj in data:
-            company, company_created = Company.objects.get_or_create(
-                company_name=obj['company'],
-                customer=request.user.customer
-            )
-            request.user.company.add(company)
-            cliente, cliente_created = Contraparte.objects.get_or_create(
-                company=company,
-                cliente_name=obj['cliente'],
-                tipo='CLIENTE'
-            )
-            try:
-                sitio = Sitio.objects.get(sitio_name=obj['sitio_name'])
-            except Sitio.DoesNotExist:
-                sitio = Sitio.objects.create(
-                    cliente=cliente,
-                    sitio_name=obj['sitio_name'],
-                    sitio_location=obj['sitio_location']
-                )
-            contrato, contrato_created = Contrato.objects.get_or_create(
-                folio=obj['folio'],
-                code=obj['code'],
-                fecha=obj['fecha'],
-                contrato_name=obj['contrato_name'],
-                contrato_shortName=obj['contrato_shortName'],
-                cliente=cliente,
-                sitio=sitio,
-                status=obj['status'],
-                monto=obj['monto'],
-                anticipo=0,
-            )
-            contrato.users.add(User.objects.get(username=request.user.username))
-            contrato.save()
-            get_concepts(contrato, obj['concepts'])
-            get_estimates(contrato, obj['estimates'], request.user.username)
-        return Response({'exito': True})
-
-
-def get_concepts(contrato, concept_data):
-    for concept in concept_data:
-        unit, unit_created = Units.objects.get_or_create(
-           unit=concept['unit'],
-           company=contrato.cliente.company
+        json_data = json.loads(request.data) if isinstance(request.data, str) else request.data
+        migracion = MigracionContratos(
+            request.user,
+            reportar=lambda etapa, procesados, total: logger.info(
+                'Migración de %s: %s de %s', etapa, procesados, total)
         )
-        concepto, concepto_created = Concept.objects.get_or_create(
-            code=concept['code'],
-            concept_text=concept['concept_text'],
-            project=contrato,
-            unit=unit,
-            total_cuantity=concept['total_cuantity'],
-            unit_price=concept['unit_price']
-        )
-
-
-def get_estimate_concepts(estimate, estimate_concepts):
-    estimate_concepts_ordenados = sorted(estimate_concepts, key=itemgetter('id'))
-    for estimate_concept_data in estimate_concepts_ordenados:
-        concept, c_created = Concept.objects.get_or_create(
-            concept_text=estimate_concept_data['concept'],
-            project=estimate.project,
-        )
-        estimate_concept, ec_created = EstimateConcept.objects.get_or_create(
-            estimate=estimate,
-            concept=concept,
-            cuantity_estimated=estimate_concept_data['cuantity_estimated'],
-            observations=estimate_concept_data['observations']
-        )
-
-
-def get_estimates(contrato, estimate_data, username):
-    estimaciones_ordenadas = sorted(estimate_data, key=itemgetter('consecutive'))
-    for estimacion in estimaciones_ordenadas:
-        estimate, estimate_created = Estimate.objects.get_or_create(
-            project=contrato,
-            consecutive=estimacion['consecutive'],
-            draft_by=User.objects.get(username=username),
-            supervised_by=User.objects.get(username=username),
-            start_date=estimacion['start_date'],
-            finish_date=estimacion['finish_date'],
-            draft_date=estimacion['draft_date'],
-            auth_date=estimacion['auth_date'],
-            paid=estimacion['paid'],
-            invoiced=estimacion['invoiced'],
-            payment_date=estimacion['payment_date'],
-        )
-        get_estimate_concepts(estimate, estimacion['estimate_concepts'])
-        get_auth_by(estimate, estimacion['auth_by'], estimacion['auth_by_gen'])
-
+        try:
+            resumen = migracion.migrar(json_data['payload'])
+        except ValidationError as e:
+            return Response({'exito': False, 'errores': e.messages}, status=400)
+        return Response({'exito': True, 'resumen': resumen})
 
-def get_auth_by(estimate, auth_by_data, auth_by_gen_data):
-    for auth_by_d in auth_by_data:
-        auth_by, auth_by_created = Destinatario.objects.get_or_create(
-            destinatario_text=auth_by_d['destinatario_text'],
-            puesto=auth_by_d['puesto'],
-            cliente=estimate.project.cliente
-        )
-        estimate.auth_by.add(auth_by)
-    for auth_by_gen_d in auth_by_gen_data:
-        auth_by_gen, auth_by_gen_created = Destinatario.objects.get_or_create(
-            destinatario_text=auth_by_gen_d['destinatario_text'],
-            puesto=auth_by_gen_d['puesto'],
-            cliente=estimate.project.cliente
+    @transaction.non_atomic_requests
+    @api_view(['POST'])
+    @parser_classes([NDJSONParser])
+    def contrato_stream_migration(request):
+        """Recibe un contrato por línea (NDJSON) y responde, también en NDJSON,
+        el resultado de cada línea conforme se confirma cada lote."""
+        try:
+            lote = int(request.query_params.get('lote', MigracionStream.lote_default))
+        except ValueError:
+            lote = MigracionStream.lote_default
+        resultados = MigracionStream(request.user, lote).procesar(request.data)
+        return StreamingHttpResponse(
+            (json.dumps(resultado) + '\n' for resultado in resultados),
+            content_type='application/x-ndjson'
         )
-        estimate.auth_by_gen.add(auth_by_gen)
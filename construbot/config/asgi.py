@@ -0,0 +1,25 @@
+"""
+ASGI config for construbot project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Las vistas async (los autocompletes) atienden muchas peticiones concurrentes
+en un solo proceso; el resto de las vistas corre en el pool de hilos de
+Django. Con gunicorn::
+
+    gunicorn construbot.config.asgi -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:5000 --chdir=/app
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+import sys
+from django.core.asgi import get_asgi_application
+
+app_path = os.path.abspath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+sys.path.append(os.path.join(app_path, "construbot"))
+
+
+application = get_asgi_application()
@@ -85,6 +85,8 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 # MIDDLEWARE CONFIGURATION
 # ------------------------------------------------------------------------------
 MIDDLEWARE = [
+    'construbot.core.middleware.ProfilingMiddleware',
+    'construbot.core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -102,7 +104,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'construbot.api.autenticacion.UsuarioEnCacheJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
@@ -149,6 +151,10 @@ DATABASES = {
     'default': env.db('DATABASE_URL', default='postgres:///construbot'),
 }
 DATABASES['default']['ATOMIC_REQUESTS'] = True
+# Réplica de lectura opcional para las vistas de consulta, ver construbot/core/replica.py
+if env('DATABASE_REPLICA_URL', default=''):
+    DATABASES['replica'] = env.db('DATABASE_REPLICA_URL')
+DATABASE_ROUTERS = ['construbot.core.replica.ReplicaRouter']
 
 
 # GENERAL CONFIGURATION
@@ -254,13 +260,21 @@ WSGI_APPLICATION = 'construbot.config.wsgi.application'
 # ------------------------------------------------------------------------------
 # See https://docs.djangoproject.com/en/dev/topics/auth/passwords/#using-argon2-with-django
 PASSWORD_HASHERS = [
-    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'construbot.core.hashers.Argon2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
     'django.contrib.auth.hashers.BCryptPasswordHasher',
 ]
 
+# Parámetros de Argon2, ver construbot/core/hashers.py. Los valores por omisión
+# son los de Django; memory_cost está en KiB.
+CONSTRUBOT_ARGON2 = {
+    'time_cost': env.int('ARGON2_TIME_COST', 2),
+    'memory_cost': env.int('ARGON2_MEMORY_COST', 102400),
+    'parallelism': env.int('ARGON2_PARALLELISM', 8),
+}
+
 # PASSWORD VALIDATION
 # https://docs.djangoproject.com/en/dev/ref/settings/#auth-password-validators
 # ------------------------------------------------------------------------------
@@ -283,7 +297,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # AUTHENTICATION CONFIGURATION
 # ------------------------------------------------------------------------------
 AUTHENTICATION_BACKENDS = [
-    'construbot.core.backends.ModelBackend',
+    'construbot.core.backends.LoginBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
 ]
 
@@ -352,6 +366,36 @@ CONSTRUBOT_AS_LIBRARY = env.bool('CONSTRUBOT_AS_LIBRARY', False)
 
 CONSTRUBOT_AUTHORIZATION_CLASS = env('CONSTRUBOT_AUTHORIZATION_CLASS', default='construbot.users.auth')
 
+# Medición de consultas y tiempos por vista, ver construbot/core/profiling.py
+CONSTRUBOT_PROFILING = env.bool('CONSTRUBOT_PROFILING', False)
+CONSTRUBOT_PROFILING_MEMORY = env.bool('CONSTRUBOT_PROFILING_MEMORY', False)
+CONSTRUBOT_PROFILING_SAMPLES = env.int('CONSTRUBOT_PROFILING_SAMPLES', 500)
+CONSTRUBOT_PROFILING_APPS = ['construbot.proyectos', 'construbot.users', 'construbot.api']
+# Número máximo de consultas por vista antes de registrar una advertencia. Se
+# puede ajustar por vista con su nombre completo, p. ej.
+# {'construbot.proyectos.views.ContratoDetailView': 40}
+CONSTRUBOT_QUERY_BUDGET = env.int('CONSTRUBOT_QUERY_BUDGET', 50)
+CONSTRUBOT_QUERY_BUDGETS = {}
+
+# Subidas por fragmentos, ver construbot/core/models.py. Las subidas que no se
+# completan en CONSTRUBOT_CHUNKED_UPLOAD_EXPIRATION horas se borran con el
+# comando limpiar_subidas.
+CONSTRUBOT_CHUNKED_UPLOAD_EXPIRATION = env.int('CONSTRUBOT_CHUNKED_UPLOAD_EXPIRATION', 24)
+CONSTRUBOT_CHUNKED_UPLOAD_MAX_BYTES = env.int('CONSTRUBOT_CHUNKED_UPLOAD_MAX_BYTES', 100 * 1024 * 1024)
+
+# Alias de DATABASES de la réplica de lectura; si no existe se lee de la
+# primaria. Después de escribir, el usuario lee de la primaria durante
+# CONSTRUBOT_REPLICA_STICKY segundos.
+CONSTRUBOT_DATABASE_REPLICA = 'replica'
+CONSTRUBOT_REPLICA_STICKY = env.int('CONSTRUBOT_REPLICA_STICKY', 10)
+
+# Segundos que api-token-auth recuerda unas credenciales correctas, así los
+# clientes que piden un token por cada lote no calculan Argon2 cada vez. Ver
+# construbot/api/autenticacion.py; 0 lo desactiva.
+CONSTRUBOT_API_CREDENCIALES_TTL = env.int('CONSTRUBOT_API_CREDENCIALES_TTL', 300)
+# Segundos que el API guarda en cache al usuario de un token JWT.
+CONSTRUBOT_API_USUARIO_TTL = env.int('CONSTRUBOT_API_USUARIO_TTL', 60)
+
 NIVELES_ACCESO = [
     {'nombre': 'Auxiliar', 'nivel': 1},
     {'nombre': 'Coordinador', 'nivel': 2},
@@ -16,6 +16,7 @@ import logging
 import importlib
 
 from .base import *  # noqa
+from construbot.core.pool import configurar_conexiones
 import sentry_sdk
 from sentry_sdk.integrations.django import DjangoIntegration
 from sentry_sdk.integrations.celery import CeleryIntegration
@@ -125,7 +126,11 @@ TEMPLATES[0]['OPTIONS']['loaders'] = [
 # Use the Heroku-style specification
 # Raises ImproperlyConfigured exception if DATABASE_URL not in os.environ
 DATABASES['default'] = env.db('DATABASE_URL')
-DATABASES['default']['CONN_MAX_AGE'] = env.int('CONN_MAX_AGE', default=60)
+DATABASES['default']['ATOMIC_REQUESTS'] = True
+# Pool de conexiones de psycopg 3, o conexiones persistentes con DATABASE_POOL=False.
+# Ver construbot/core/pool.py
+for base_de_datos in DATABASES.values():
+    configurar_conexiones(base_de_datos, env)
 
 # CACHING
 # ------------------------------------------------------------------------------
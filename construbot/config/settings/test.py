@@ -38,11 +38,25 @@ CACHES = {
     }
 }
 
+# DATABASE
+# ------------------------------------------------------------------------------
+# Una réplica que apunta a la misma base de datos. Está apagada; las pruebas de
+# construbot/core/replica.py la activan con CONSTRUBOT_DATABASE_REPLICA.
+DATABASES['replica'] = dict(DATABASES['default'], ATOMIC_REQUESTS=False, TEST={'MIRROR': 'default'})
+CONSTRUBOT_DATABASE_REPLICA = None
+
 # TESTING
 # ------------------------------------------------------------------------------
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 
 
+# CELERY
+# ------------------------------------------------------------------------------
+# Tasks run in the test process so no broker is needed
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True
+
+
 # PASSWORD HASHING
 # ------------------------------------------------------------------------------
 # Use fast password hasher so tests run faster
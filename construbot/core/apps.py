@@ -10,4 +10,6 @@ class CoreConfig(AppConfig):  # pragma: no cover
             Users system checks
             Users signal registration
         """
-        pass
+        from django.db.backends.signals import connection_created
+        from construbot.core.replica import instalar_detector
+        connection_created.connect(instalar_detector)
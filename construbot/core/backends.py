@@ -1,21 +1,34 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.db.models import Q
+
 
 class LoginBackend(ModelBackend):
+    """Autentica con el correo o con el nombre de usuario. Los dos campos son
+    únicos, así que una sola consulta los busca por sus índices; no se cambia
+    USERNAME_FIELD, que es del modelo y lo comparten todos los hilos."""
 
-  def authenticate(self, username=None, password=None, **kwargs):
-    UserModel = get_user_model()
-    if username is None:
-        username = kwargs.get(UserModel.USERNAME_FIELD)
-    try:
-        if '@' in username:
-            UserModel.USERNAME_FIELD = 'email'
-        else:
-            UserModel.USERNAME_FIELD = 'username'
+    def get_usuario(self, UserModel, username):
+        email = UserModel._default_manager.normalize_email(username)
+        usuarios = list(UserModel._default_manager.filter(Q(email=email) | Q(username=username))[:2])
+        # Un nombre de usuario puede contener '@': se prefiere el campo que corresponde a la forma del texto.
+        campo, valor = ('email', email) if '@' in username else ('username', username)
+        for usuario in usuarios:
+            if getattr(usuario, campo) == valor:
+                return usuario
+        return usuarios[0] if usuarios else None
 
-        user = UserModel._default_manager.get_by_natural_key(username)
-    except UserModel.DoesNotExist:
-        UserModel().set_password(password)
-    else:
-        if user.check_password(password) and self.user_can_authenticate(user):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = self.get_usuario(UserModel, username)
+        if user is None:
+            # Se calcula el hash de todos modos para que no se note por el
+            # tiempo de respuesta si el usuario existe.
+            UserModel().set_password(password)
+        elif user.check_password(password) and self.user_can_authenticate(user):
             return user
+        return None
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2 con los parámetros de CONSTRUBOT_ARGON2, para ajustar el costo
+    de cada login al hardware de la instalación. Cuando cambian, la contraseña
+    se vuelve a calcular con los nuevos en el siguiente login correcto
+    (must_update compara los parámetros del hash guardado)."""
+
+    @property
+    def time_cost(self):
+        return settings.CONSTRUBOT_ARGON2['time_cost']
+
+    @property
+    def memory_cost(self):
+        return settings.CONSTRUBOT_ARGON2['memory_cost']
+
+    @property
+    def parallelism(self):
+        return settings.CONSTRUBOT_ARGON2['parallelism']
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from construbot.core.models import ChunkedCoreUpload
+
+
+class Command(BaseCommand):
+    help = 'Borra las subidas por fragmentos que no se completaron y sus fragmentos.'
+
+    def handle(self, *args, **options):
+        expiradas = ChunkedCoreUpload.especial.expiradas()
+        total = 0
+        for upload in expiradas.iterator():
+            upload.descartar()
+            total += 1
+        self.stdout.write('Subidas eliminadas: {}'.format(total))
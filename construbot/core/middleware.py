@@ -0,0 +1,111 @@
+import logging
+import time
+import tracemalloc
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from . import profiling, replica
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware(object):
+    """Registra por vista el número de consultas, el tiempo en SQL, el tiempo
+    de render del template, el tiempo total y, si se activa
+    CONSTRUBOT_PROFILING_MEMORY, el pico de memoria de Python.
+
+    Se activa con CONSTRUBOT_PROFILING; si no, Django la quita de la cadena de
+    middlewares. El contenido de las respuestas en streaming se genera después
+    de la vista y no entra en la medición."""
+
+    def __init__(self, get_response):
+        if not settings.CONSTRUBOT_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.memoria = settings.CONSTRUBOT_PROFILING_MEMORY
+        if self.memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, request):
+        request.perfil_render = 0.0
+        if self.memoria:
+            # El pico es del proceso: con varios hilos atendiendo es una cota superior.
+            tracemalloc.reset_peak()
+            memoria_inicial = tracemalloc.get_traced_memory()[0]
+        inicio = time.perf_counter()
+        with profiling.MedidorConsultas() as medidor:
+            response = self.get_response(request)
+        total = time.perf_counter() - inicio
+        memoria = tracemalloc.get_traced_memory()[1] - memoria_inicial if self.memoria else 0
+        if request.resolver_match is None:
+            return response
+        vista = profiling.get_nombre_vista(request.resolver_match)
+        if not profiling.es_vista_perfilada(vista):
+            return response
+        profiling.registrar_muestra(vista, {
+            'consultas': medidor.consultas,
+            'sql_ms': round(medidor.tiempo * 1000, 2),
+            'render_ms': round(request.perfil_render * 1000, 2),
+            'memoria_kb': round(memoria / 1024, 1),
+            'total_ms': round(total * 1000, 2),
+        })
+        presupuesto = profiling.get_presupuesto(vista)
+        if presupuesto is not None and medidor.consultas > presupuesto:
+            logger.warning(
+                '%s hizo %d consultas, su presupuesto es de %d (%s %s)',
+                vista, medidor.consultas, presupuesto, request.method, request.path
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        inicio = time.perf_counter()
+
+        def fin_render(response):
+            request.perfil_render = time.perf_counter() - inicio
+        response.add_post_render_callback(fin_render)
+        return response
+
+
+class ReplicaMiddleware(object):
+    """Limpia la base de datos de lectura que eligió la vista y, después de
+    una petición que escribió en la primaria, manda al navegador a leer de ella.
+    Funciona con WSGI y con ASGI sin pasar las vistas async a un hilo."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        peticion = {'escribio': False}
+        token = replica.alias_lectura.set(None)
+        token_escrituras = replica.escrituras.set(peticion)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica.alias_lectura.reset(token)
+            replica.escrituras.reset(token_escrituras)
+        return self.marcar_primaria(peticion, response)
+
+    async def __acall__(self, request):
+        peticion = {'escribio': False}
+        token = replica.alias_lectura.set(None)
+        token_escrituras = replica.escrituras.set(peticion)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica.alias_lectura.reset(token)
+            replica.escrituras.reset(token_escrituras)
+        return self.marcar_primaria(peticion, response)
+
+    def marcar_primaria(self, peticion, response):
+        if peticion['escribio'] and response.status_code < 400 and replica.get_replica():
+            response.set_cookie(
+                replica.COOKIE_PRIMARIA, '1', max_age=settings.CONSTRUBOT_REPLICA_STICKY, httponly=True,
+                samesite='Lax'
+            )
+        return response
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.10 on 2026-10-19 19:43
+
+import construbot.core.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_delete_chunkedcoreupload'),
+        ('users', '0013_alter_user_first_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedCoreUpload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.CharField(default=construbot.core.models.generate_upload_id, editable=False, max_length=32, unique=True)),
+                ('file', models.FileField(blank=True, max_length=255, upload_to='')),
+                ('filename', models.CharField(max_length=255)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('md5', models.CharField(blank=True, db_index=True, max_length=32)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Uploading'), (2, 'Complete')], default=1)),
+                ('completed_on', models.DateTimeField(blank=True, null=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.company')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'ChunkedCoreUpload',
+                'verbose_name_plural': 'ChunkedCoreUploads',
+            },
+        ),
+    ]
@@ -1 +1,146 @@
+import hashlib
+import tempfile
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import models
+from django.utils import timezone
+from construbot.users.models import Company
+from .utils import get_company_path_prefix, get_content_path
 
+
+def generate_upload_id():
+    return uuid.uuid4().hex
+
+
+class SubidaError(Exception):
+    """Fragmento o subida inválida; `status` es el código HTTP de la respuesta."""
+
+    def __init__(self, mensaje, status=400):
+        super(SubidaError, self).__init__(mensaje)
+        self.status = status
+
+
+class ChunkedCoreUploadSet(models.QuerySet):
+
+    def completas(self, company):
+        return self.filter(company=company, status=ChunkedCoreUpload.COMPLETE)
+
+    def expiradas(self):
+        limite = timezone.now() - timedelta(hours=settings.CONSTRUBOT_CHUNKED_UPLOAD_EXPIRATION)
+        return self.filter(status=ChunkedCoreUpload.UPLOADING, created_on__lt=limite)
+
+
+class ChunkedCoreUpload(models.Model):
+    """Subida reanudable por fragmentos. Cada fragmento se guarda como un
+    archivo aparte en el storage (S3 no permite agregar a un archivo); al
+    completar se unen, se verifica el MD5 que calcula el navegador y el
+    resultado se guarda en la ruta de su MD5, así el mismo contenido subido
+    varias veces en una compañía se guarda una sola vez."""
+    UPLOADING = 1
+    COMPLETE = 2
+    STATUS_CHOICES = (
+        (UPLOADING, 'Uploading'),
+        (COMPLETE, 'Complete'),
+    )
+    upload_id = models.CharField(max_length=32, unique=True, editable=False, default=generate_upload_id)
+    file = models.FileField(max_length=255, blank=True)
+    filename = models.CharField(max_length=255)
+    offset = models.BigIntegerField(default=0)
+    md5 = models.CharField(max_length=32, blank=True, db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='chunked_uploads', on_delete=models.CASCADE)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    created_on = models.DateTimeField(auto_now_add=True)
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=UPLOADING)
+    completed_on = models.DateTimeField(null=True, blank=True)
+
+    objects = models.Manager()
+    especial = ChunkedCoreUploadSet.as_manager()
+
+    class Meta:
+        verbose_name = 'ChunkedCoreUpload'
+        verbose_name_plural = 'ChunkedCoreUploads'
+
+    def __str__(self):
+        return '{} ({})'.format(self.filename, self.upload_id)
+
+    def get_directorio(self):
+        return '{}/Subidas/{}'.format(get_company_path_prefix(self.company_id), self.upload_id)
+
+    def get_fragmento_name(self, inicio):
+        # Con ceros a la izquierda el orden alfabético es el orden del archivo.
+        return '{}/{:012d}.part'.format(self.get_directorio(), inicio)
+
+    def get_fragmentos(self, todos=False):
+        """Nombres de los fragmentos en orden. Un fragmento guardado cuya
+        transacción se revirtió queda en `offset` y se ignora."""
+        try:
+            nombres = sorted(default_storage.listdir(self.get_directorio())[1])
+        except FileNotFoundError:
+            return []
+        directorio = self.get_directorio()
+        return ['{}/{}'.format(directorio, nombre) for nombre in nombres
+                if todos or int(nombre.split('.')[0]) < self.offset]
+
+    def agregar(self, contenido, inicio):
+        if self.status == self.COMPLETE:
+            raise SubidaError('La subida ya está completa.')
+        if inicio != self.offset:
+            raise SubidaError('El fragmento inicia en {} y se esperaba {}.'.format(inicio, self.offset), status=409)
+        if self.offset + contenido.size > settings.CONSTRUBOT_CHUNKED_UPLOAD_MAX_BYTES:
+            raise SubidaError('El archivo excede el tamaño máximo permitido.', status=413)
+        nombre = self.get_fragmento_name(inicio)
+        # Un reintento del mismo fragmento lo reemplaza en lugar de renombrarlo.
+        default_storage.delete(nombre)
+        default_storage.save(nombre, contenido)
+        self.offset += contenido.size
+        self.save(update_fields=['offset'])
+
+    def completar(self, md5):
+        md5 = md5.lower()
+        if self.status == self.COMPLETE:
+            if md5 != self.md5:
+                raise SubidaError('El MD5 no coincide con el del archivo subido.')
+            return
+        digest = hashlib.md5()
+        with tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE) as unido:
+            for nombre in self.get_fragmentos():
+                with default_storage.open(nombre) as fragmento:
+                    for bloque in fragmento.chunks():
+                        digest.update(bloque)
+                        unido.write(bloque)
+            if digest.hexdigest() != md5:
+                self.descartar()
+                raise SubidaError('El MD5 no coincide con el del archivo subido, es necesario volver a subirlo.')
+            existente = ChunkedCoreUpload.especial.completas(self.company_id).filter(md5=md5).exclude(
+                file='').values_list('file', flat=True).first()
+            nombre = existente or get_content_path(self.company_id, md5, self.filename)
+            if not existente and not default_storage.exists(nombre):
+                unido.seek(0)
+                nombre = default_storage.save(nombre, File(unido))
+        self.eliminar_fragmentos()
+        self.file.name = nombre
+        self.md5 = md5
+        self.status = self.COMPLETE
+        self.completed_on = timezone.now()
+        self.save(update_fields=['file', 'md5', 'status', 'completed_on'])
+
+    def eliminar_fragmentos(self):
+        for nombre in self.get_fragmentos(todos=True):
+            default_storage.delete(nombre)
+
+    def descartar(self):
+        """Borra la subida y sus fragmentos, no el archivo completo, que puede
+        estar en uso por otros registros."""
+        self.eliminar_fragmentos()
+        self.delete()
+
+    def as_dict(self):
+        return {
+            'upload_id': self.upload_id,
+            'offset': self.offset,
+            'completa': self.status == self.COMPLETE,
+            'archivo': self.file.name or None,
+        }
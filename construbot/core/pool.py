@@ -0,0 +1,69 @@
+"""
+Pool de conexiones de psycopg 3 para PostgreSQL.
+
+Con DATABASE_POOL cada proceso de gunicorn mantiene entre
+DATABASE_POOL_MIN_SIZE y DATABASE_POOL_MAX_SIZE conexiones que comparten sus
+hilos; una petición que no consigue conexión en DATABASE_POOL_TIMEOUT
+segundos falla en lugar de abrir otra. El pool revisa cada conexión antes de
+entregarla y la reemplaza si el servidor la cerró. Sin pool se usan
+conexiones persistentes (CONN_MAX_AGE) con CONN_HEALTH_CHECKS.
+
+Las estadísticas (tiempo de espera por una conexión, peticiones en cola,
+errores) son del proceso y se ven en la página de perfiles del admin.
+"""
+from django.db import connections
+
+
+def get_opciones_pool(env):
+    return {
+        'min_size': env.int('DATABASE_POOL_MIN_SIZE', 2),
+        'max_size': env.int('DATABASE_POOL_MAX_SIZE', 10),
+        'timeout': env.float('DATABASE_POOL_TIMEOUT', 10.0),
+        'max_idle': env.float('DATABASE_POOL_MAX_IDLE', 600.0),
+        'max_lifetime': env.float('DATABASE_POOL_MAX_LIFETIME', 3600.0),
+    }
+
+
+def configurar_conexiones(base_de_datos, env):
+    """Agrega a `base_de_datos` (un elemento de DATABASES) el pool o las
+    conexiones persistentes. En los dos casos CONN_HEALTH_CHECKS revisa la
+    conexión antes de usarla."""
+    base_de_datos['CONN_HEALTH_CHECKS'] = True
+    if env.bool('DATABASE_POOL', True) and base_de_datos['ENGINE'] == 'django.db.backends.postgresql':
+        # Django no permite conexiones persistentes junto con el pool.
+        base_de_datos['CONN_MAX_AGE'] = 0
+        base_de_datos.setdefault('OPTIONS', {})['pool'] = get_opciones_pool(env)
+    else:
+        base_de_datos['CONN_MAX_AGE'] = env.int('CONN_MAX_AGE', default=60)
+    return base_de_datos
+
+
+def resumen_pool(stats):
+    peticiones = stats.get('requests_num', 0)
+    espera = stats.get('requests_wait_ms', 0)
+    return {
+        'minimo': stats.get('pool_min', 0),
+        'maximo': stats.get('pool_max', 0),
+        'abiertas': stats.get('pool_size', 0),
+        'disponibles': stats.get('pool_available', 0),
+        'peticiones': peticiones,
+        'en_cola': stats.get('requests_queued', 0),
+        'esperando': stats.get('requests_waiting', 0),
+        'espera_promedio_ms': round(espera / peticiones, 2) if peticiones else 0,
+        'espera_total_ms': espera,
+        'errores': stats.get('requests_errors', 0),
+        'conexiones_perdidas': stats.get('connections_lost', 0) + stats.get('returns_bad', 0),
+    }
+
+
+def get_estadisticas(reiniciar=False):
+    """Resumen por alias de los pools de este proceso. Con `reiniciar` los
+    contadores vuelven a cero después de leerlos."""
+    estadisticas = {}
+    for alias in connections:
+        if 'pool' not in connections.settings[alias].get('OPTIONS', {}):
+            continue
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            estadisticas[alias] = resumen_pool(pool.pop_stats() if reiniciar else pool.get_stats())
+    return estadisticas
@@ -0,0 +1,160 @@
+"""
+Medición de consultas SQL, tiempo de render y memoria por vista.
+
+`ProfilingMiddleware` (construbot.core.middleware) guarda una muestra por
+petición con `registrar_muestra`. Cada vista conserva en el cache sus últimas
+`CONSTRUBOT_PROFILING_SAMPLES` muestras y los percentiles se calculan al
+consultarlas, así que la ventana es móvil y no crece con el tiempo.
+
+Con django-redis (producción) las muestras son una lista de Redis: cada
+petición agrega la suya con LPUSH y recorta con LTRIM en una sola
+transacción, así las peticiones simultáneas a la misma vista no se pisan.
+Con otros backends (locmem en desarrollo y pruebas) se lee y se vuelve a
+escribir la lista completa y con concurrencia se pueden perder muestras.
+"""
+import json
+import math
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from redis.exceptions import RedisError
+
+VISTAS_KEY = 'construbot:perfil:vistas'
+
+METRICAS = ('consultas', 'sql_ms', 'render_ms', 'memoria_kb', 'total_ms')
+
+PERCENTILES = (50, 95, 99)
+
+
+def get_muestras_key(vista):
+    return 'construbot:perfil:muestras:{}'.format(vista)
+
+
+def get_nombre_vista(resolver_match):
+    """Nombre completo de la clase de la vista (o de la función)."""
+    func = getattr(resolver_match.func, 'view_class', None) or getattr(resolver_match.func, 'cls', None) \
+        or resolver_match.func
+    return '{}.{}'.format(func.__module__, func.__qualname__)
+
+
+def es_vista_perfilada(nombre):
+    return any(nombre.startswith(app + '.') for app in settings.CONSTRUBOT_PROFILING_APPS)
+
+
+def get_presupuesto(vista):
+    return settings.CONSTRUBOT_QUERY_BUDGETS.get(vista, settings.CONSTRUBOT_QUERY_BUDGET)
+
+
+class MedidorConsultas(object):
+    """Cuenta las consultas y su tiempo en todas las conexiones, sin depender
+    de DEBUG, con `execute_wrapper`. Con `registrar` guarda además el SQL de
+    cada consulta en `sql`."""
+
+    def __init__(self, registrar=False):
+        self.consultas = 0
+        self.tiempo = 0.0
+        self.registrar = registrar
+        self.sql = []
+        self.pila = ExitStack()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo += time.perf_counter() - inicio
+            self.consultas += 1
+            if self.registrar:
+                self.sql.append(sql)
+
+    def __enter__(self):
+        for connection in connections.all():
+            self.pila.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.pila.__exit__(*exc_info)
+
+
+def get_redis():
+    """Cliente de Redis del cache si es django-redis; None con otros backends."""
+    if settings.CACHES['default']['BACKEND'] != 'django_redis.cache.RedisCache':
+        return None
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def registrar_muestra(vista, muestra):
+    valores = [muestra[metrica] for metrica in METRICAS]
+    redis = get_redis()
+    if redis is None:
+        nombres = cache.get(VISTAS_KEY) or set()
+        if vista not in nombres:
+            cache.set(VISTAS_KEY, nombres | {vista}, None)
+        key = get_muestras_key(vista)
+        muestras = cache.get(key) or []
+        muestras.append(tuple(valores))
+        cache.set(key, muestras[-settings.CONSTRUBOT_PROFILING_SAMPLES:], None)
+        return
+    key = cache.make_key(get_muestras_key(vista))
+    try:
+        with redis.pipeline() as pipe:
+            pipe.sadd(cache.make_key(VISTAS_KEY), vista)
+            pipe.lpush(key, json.dumps(valores))
+            pipe.ltrim(key, 0, settings.CONSTRUBOT_PROFILING_SAMPLES - 1)
+            pipe.execute()
+    except RedisError:
+        # Igual que IGNORE_EXCEPTIONS: sin Redis no se registra la muestra.
+        pass
+
+
+def get_muestras(vista):
+    redis = get_redis()
+    if redis is None:
+        return cache.get(get_muestras_key(vista)) or []
+    try:
+        return [tuple(json.loads(muestra)) for muestra in redis.lrange(cache.make_key(get_muestras_key(vista)), 0, -1)]
+    except RedisError:
+        return []
+
+
+def get_vistas():
+    redis = get_redis()
+    if redis is None:
+        return cache.get(VISTAS_KEY) or set()
+    try:
+        return {vista.decode('utf-8') for vista in redis.smembers(cache.make_key(VISTAS_KEY))}
+    except RedisError:
+        return set()
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano de una lista ordenada."""
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def resumen_vista(vista):
+    muestras = get_muestras(vista)
+    metricas = {}
+    for i, metrica in enumerate(METRICAS):
+        valores = sorted(muestra[i] for muestra in muestras)
+        metricas[metrica] = [percentil(valores, p) for p in PERCENTILES] if valores else []
+    presupuesto = get_presupuesto(vista)
+    return {
+        'vista': vista,
+        'muestras': len(muestras),
+        'presupuesto': presupuesto,
+        'excede': presupuesto is not None and bool(metricas['consultas']) and metricas['consultas'][-1] > presupuesto,
+        'metricas': metricas,
+    }
+
+
+def get_resumenes():
+    return [resumen_vista(vista) for vista in sorted(get_vistas())]
+
+
+def borrar_muestras():
+    vistas = get_vistas()
+    cache.delete_many([get_muestras_key(vista) for vista in vistas] + [VISTAS_KEY])
@@ -0,0 +1,111 @@
+"""
+Vistas de sólo lectura y lecturas en la réplica de la base de datos.
+
+Las vistas de consulta (dashboard, listados, detalles, reportes, impresiones
+y autocompletes) declaran `solo_lectura = True`. No abren la transacción de
+ATOMIC_REQUESTS, así cada consulta se confirma sola y la conexión no queda en
+una transacción mientras se arma la página; las vistas que escriben conservan
+su transacción. Además en sus GET y HEAD leen de CONSTRUBOT_DATABASE_REPLICA;
+las escrituras siempre van a la primaria. Después de una petición que escribió
+en la primaria, con cualquier método (cambiar de compañía es un GET), el
+navegador recibe la cookie COOKIE_PRIMARIA y durante CONSTRUBOT_REPLICA_STICKY
+segundos lee de la primaria, así el usuario ve sus cambios aunque la réplica
+todavía no los tenga.
+
+`request.user` siempre se carga de la primaria y los objetos relacionados se
+leen de la base de datos de la que salió el objeto. Lo que se arma con datos
+de la réplica (ETags, fragmentos de templates en cache) no se guarda: podría
+quedar atrasado bajo una versión que ya cambió.
+
+La base de datos de lectura de la petición vive en una variable de contexto
+que ReplicaMiddleware limpia al terminar, después del render del template.
+"""
+import contextvars
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+COOKIE_PRIMARIA = 'construbot_primaria'
+METODOS_LECTURA = ('GET', 'HEAD')
+SQL_ESCRITURA = ('INSERT', 'UPDATE', 'DELETE')
+
+alias_lectura = contextvars.ContextVar('alias_lectura', default=None)
+# Diccionario de la petición en curso; se modifica en lugar de reasignarse
+# para que lo vean también las vistas que ASGI corre en otro hilo.
+escrituras = contextvars.ContextVar('escrituras', default=None)
+
+
+def get_replica():
+    """Alias de la réplica o None si no está configurada."""
+    alias = settings.CONSTRUBOT_DATABASE_REPLICA
+    return alias if alias and alias in settings.DATABASES else None
+
+
+def puede_leer_replica(request):
+    return request.method in METODOS_LECTURA and COOKIE_PRIMARIA not in request.COOKIES
+
+
+def leer_de_replica(request):
+    """Manda a la réplica las lecturas del resto de la petición. Antes carga
+    de la primaria a `request.user`, que AuthenticationMiddleware deja sin
+    evaluar hasta que se usa."""
+    user = getattr(request, 'user', None)
+    if user is not None:
+        user.is_authenticated
+    alias_lectura.set(get_replica())
+
+
+def en_replica():
+    return alias_lectura.get() is not None
+
+
+def detectar_escritura(execute, sql, params, many, context):
+    peticion = escrituras.get()
+    if peticion is not None and sql.lstrip()[:6].upper() in SQL_ESCRITURA:
+        peticion['escribio'] = True
+    return execute(sql, params, many, context)
+
+
+def instalar_detector(sender, connection, **kwargs):
+    """Receptor de connection_created: registra detectar_escritura en las
+    conexiones a la primaria."""
+    if connection.alias == DEFAULT_DB_ALIAS and detectar_escritura not in connection.execute_wrappers:
+        connection.execute_wrappers.append(detectar_escritura)
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        # Los objetos relacionados se leen de donde salió el objeto, así lo
+        # que se cuelga de request.user sale de la primaria.
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return alias_lectura.get()
+
+    def db_for_write(self, model, **hints):
+        # Un objeto leído de la réplica se guarda en la primaria.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica es una copia de la primaria.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class SoloLecturaMixin(object):
+    solo_lectura = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super(SoloLecturaMixin, cls).as_view(**initkwargs)
+        if cls.solo_lectura:
+            # Lo revisa el handler de Django antes de envolver la vista en atomic().
+            view = transaction.non_atomic_requests(view)
+        return view
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.solo_lectura and puede_leer_replica(request):
+            leer_de_replica(request)
+        return super(SoloLecturaMixin, self).dispatch(request, *args, **kwargs)
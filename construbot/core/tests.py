@@ -1,12 +1,36 @@
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from io import StringIO
 from unittest import mock
+import environ
 from PIL import Image
-from django.core.exceptions import PermissionDenied
-from django.http import Http404
-from django.test import RequestFactory, tag
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.core.cache import cache
+from django.db import connections
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import Group
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.views.generic import View
+from django.urls import reverse
 from construbot.users.tests import utils, factories
+from construbot.users.models import NivelAcceso
+from . import pool, profiling, replica
+from .backends import LoginBackend
+from .models import ChunkedCoreUpload
 from .context import ContextManager
+from .middleware import ProfilingMiddleware, ReplicaMiddleware
 from .utils import BasicAutocomplete, get_directory_path, get_object_403_or_404, \
-    get_rid_of_company_kw, object_or_403, image_resize
+    get_rid_of_company_kw, object_or_403, image_resize, get_company_path_prefix
 # Create your tests here.
 
 
@@ -221,17 +245,46 @@ class Get_rid_of_company_kw(utils.BaseTestCase):
 
 class DirectoyPathTest(utils.BaseTestCase):
 
+    def setUp(self):
+        super(DirectoyPathTest, self).setUp()
+        cache.clear()
+
     @mock.patch('construbot.core.utils.strftime')
     def test_get_directory_path_returns_correct_string(self, mock_strftime):
         mock_strftime.return_value = '2018-06-15-17-28-49'
+        customer = factories.CustomerFactory(customer_name='customer')
+        company = factories.CompanyFactory(customer=customer, company_name='company')
         mock_instance = mock.MagicMock()
         mock_instance._meta.verbose_name_plural = 'models'
-        mock_instance.contraparte.company.customer.customer_name = 'customer'
-        mock_instance.contraparte.company.customer.id = '12'
-        mock_instance.contraparte.company.company_name = 'company'
+        mock_instance.upload_path_prefix = None
+        mock_instance.contraparte.company_id = company.id
         path = get_directory_path(mock_instance, 'file.txt')
+        self.assertEqual(path, '{}-customer/company/models/2018-06-15-17-28-49-file.txt'.format(customer.id))
+
+    @mock.patch('construbot.core.utils.strftime')
+    def test_get_directory_path_uses_carried_prefix(self, mock_strftime):
+        mock_strftime.return_value = '2018-06-15-17-28-49'
+        mock_instance = mock.MagicMock()
+        mock_instance._meta.verbose_name_plural = 'models'
+        mock_instance.upload_path_prefix = '12-customer/company'
+        with self.assertNumQueries(0):
+            path = get_directory_path(mock_instance, 'file.txt')
         self.assertEqual(path, '12-customer/company/models/2018-06-15-17-28-49-file.txt')
 
+    def test_company_path_prefix_is_cached(self):
+        company = factories.CompanyFactory()
+        with self.assertNumQueries(1):
+            prefix = get_company_path_prefix(company.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_company_path_prefix(company.id), prefix)
+
+    def test_company_path_prefix_resets_on_company_change(self):
+        company = factories.CompanyFactory()
+        get_company_path_prefix(company.id)
+        company.company_name = 'nuevo_nombre'
+        company.save()
+        self.assertTrue(get_company_path_prefix(company.id).endswith('/nuevo_nombre'))
+
 
 # class ImagereziseTest(utils.CBVTestCase):
 
@@ -251,3 +304,430 @@ class DirectoyPathTest(utils.BaseTestCase):
 #         mock_image.name = 'bla.jpeg'
 #         image_resize(mock_image)
 #         self.assertEqual(im_mock_save.call_count, 1)
+
+
+@override_settings(CONSTRUBOT_PROFILING=True, CONSTRUBOT_QUERY_BUDGET=None)
+class ProfilingMiddlewareTest(utils.BaseTestCase):
+    vista = 'construbot.proyectos.views.ClienteListView'
+
+    def setUp(self):
+        super(ProfilingMiddlewareTest, self).setUp()
+        cache.clear()
+        company = factories.CompanyFactory(customer=self.user.customer)
+        self.user.company.add(company)
+        self.user.currently_at = company
+        self.user.nivel_acceso = self.director_permission
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+        self.client.login(username=self.user.username, password='password')
+
+    def test_records_samples_for_profiled_views(self):
+        self.client.get(reverse('proyectos:listado_de_clientes'))
+        self.client.get(reverse('proyectos:listado_de_clientes'))
+        resumen = profiling.resumen_vista(self.vista)
+        self.assertEqual(resumen['muestras'], 2)
+        self.assertGreater(resumen['metricas']['consultas'][0], 0)
+        self.assertGreater(resumen['metricas']['render_ms'][0], 0)
+        self.assertEqual([r['vista'] for r in profiling.get_resumenes()], [self.vista])
+
+    def test_ignores_views_outside_profiled_apps(self):
+        with self.settings(CONSTRUBOT_PROFILING_APPS=['construbot.api']):
+            self.client.get(reverse('proyectos:listado_de_clientes'))
+        self.assertEqual(profiling.get_resumenes(), [])
+
+    def test_keeps_rolling_window(self):
+        with self.settings(CONSTRUBOT_PROFILING_SAMPLES=3):
+            for consultas in range(5):
+                profiling.registrar_muestra(self.vista, dict.fromkeys(profiling.METRICAS, consultas))
+        resumen = profiling.resumen_vista(self.vista)
+        self.assertEqual(resumen['muestras'], 3)
+        self.assertEqual(resumen['metricas']['consultas'], [3, 4, 4])
+
+    def test_redis_appends_samples_atomically(self):
+        redis = mock.MagicMock()
+        pipe = redis.pipeline.return_value.__enter__.return_value
+        key = cache.make_key(profiling.get_muestras_key(self.vista))
+        with mock.patch.object(profiling, 'get_redis', return_value=redis), \
+                self.settings(CONSTRUBOT_PROFILING_SAMPLES=3):
+            profiling.registrar_muestra(self.vista, dict.fromkeys(profiling.METRICAS, 1))
+            pipe.lpush.assert_called_once_with(key, json.dumps([1] * len(profiling.METRICAS)))
+            pipe.ltrim.assert_called_once_with(key, 0, 2)
+            pipe.execute.assert_called_once_with()
+            redis.lrange.return_value = [json.dumps([2] * len(profiling.METRICAS)).encode('utf-8')]
+            redis.smembers.return_value = {self.vista.encode('utf-8')}
+            self.assertEqual(profiling.resumen_vista(self.vista)['metricas']['consultas'], [2, 2, 2])
+            self.assertEqual([r['vista'] for r in profiling.get_resumenes()], [self.vista])
+
+    def test_logs_warning_over_query_budget(self):
+        with self.settings(CONSTRUBOT_QUERY_BUDGETS={self.vista: 1}):
+            with self.assertLogs('construbot.core.middleware', 'WARNING') as logs:
+                self.client.get(reverse('proyectos:listado_de_clientes'))
+            self.assertTrue(profiling.resumen_vista(self.vista)['excede'])
+        self.assertIn(self.vista, logs.output[0])
+
+    def test_disabled_by_default(self):
+        with self.settings(CONSTRUBOT_PROFILING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+    def test_admin_page_shows_connection_pool(self):
+        self.user.is_staff = True
+        self.user.save()
+        estadisticas = {'default': pool.resumen_pool({
+            'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1, 'requests_num': 8,
+            'requests_wait_ms': 20, 'requests_queued': 3,
+        })}
+        with mock.patch.object(pool, 'get_estadisticas', return_value=estadisticas):
+            response = self.client.get(reverse('core:perfiles'))
+        self.assertContains(response, 'Pool de conexiones')
+        self.assertContains(response, '<td>4 / 10</td>', html=True)
+        self.assertContains(response, '<td>2.5</td>', html=True)
+
+    def test_admin_page_for_staff(self):
+        self.client.get(reverse('proyectos:listado_de_clientes'))
+        response = self.client.get(reverse('core:perfiles'))
+        self.assertEqual(response.status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('core:perfiles'))
+        self.assertContains(response, self.vista)
+        self.client.post(reverse('core:perfiles'))
+        self.assertEqual(profiling.get_resumenes(), [])
+
+
+class PoolTest(utils.BaseTestCase):
+
+    def configurar(self, base_de_datos, **variables):
+        with mock.patch.dict(os.environ, variables):
+            return pool.configurar_conexiones(base_de_datos, environ.Env())
+
+    def test_postgresql_uses_pool_without_persistent_connections(self):
+        base_de_datos = self.configurar(
+            {'ENGINE': 'django.db.backends.postgresql', 'CONN_MAX_AGE': 60}, DATABASE_POOL_MAX_SIZE='20'
+        )
+        self.assertEqual(base_de_datos['CONN_MAX_AGE'], 0)
+        self.assertTrue(base_de_datos['CONN_HEALTH_CHECKS'])
+        self.assertEqual(base_de_datos['OPTIONS']['pool']['max_size'], 20)
+        self.assertEqual(base_de_datos['OPTIONS']['pool']['min_size'], 2)
+
+    def test_persistent_connections_without_pool(self):
+        for engine, variables in (
+            ('django.db.backends.postgresql', {'DATABASE_POOL': 'False'}),
+            ('django.db.backends.sqlite3', {}),
+        ):
+            base_de_datos = self.configurar({'ENGINE': engine}, CONN_MAX_AGE='30', **variables)
+            self.assertEqual(base_de_datos['CONN_MAX_AGE'], 30)
+            self.assertTrue(base_de_datos['CONN_HEALTH_CHECKS'])
+            self.assertNotIn('OPTIONS', base_de_datos)
+
+    def test_summary_of_pool_stats(self):
+        resumen = pool.resumen_pool({'pool_size': 3, 'requests_num': 4, 'requests_wait_ms': 10, 'returns_bad': 1})
+        self.assertEqual(resumen['abiertas'], 3)
+        self.assertEqual(resumen['espera_promedio_ms'], 2.5)
+        self.assertEqual(resumen['conexiones_perdidas'], 1)
+        self.assertEqual(pool.resumen_pool({})['espera_promedio_ms'], 0)
+
+    def test_no_stats_without_pool(self):
+        self.assertEqual(pool.get_estadisticas(), {})
+
+
+class VistaLectura(replica.SoloLecturaMixin, View):
+    solo_lectura = True
+
+    def get(self, request):
+        return HttpResponse(str(replica.alias_lectura.get()))
+
+    post = get
+
+
+class VistaEscritura(View):
+
+    def get(self, request):
+        Group.objects.create(name='Escritura')
+        return HttpResponse('ok')
+
+
+@override_settings(CONSTRUBOT_DATABASE_REPLICA='replica')
+class ReplicaRouterTest(utils.BaseTestCase):
+
+    def setUp(self):
+        super(ReplicaRouterTest, self).setUp()
+        self.router = replica.ReplicaRouter()
+
+    def alias(self, request, vista=VistaLectura):
+        # Cada petición en su propio contexto, como en el servidor.
+        return contextvars.copy_context().run(vista.as_view(), request).content.decode()
+
+    def test_read_only_views_read_from_replica(self):
+        self.assertEqual(self.alias(self.factory.get('/')), 'replica')
+        self.assertEqual(self.alias(self.factory.head('/')), 'replica')
+
+    def test_writes_and_other_views_use_primary(self):
+        self.assertEqual(self.alias(self.factory.post('/')), 'None')
+        self.assertEqual(self.alias(self.factory.get('/'), type('Vista', (VistaLectura,), {'solo_lectura': False})),
+                         'None')
+        with self.settings(CONSTRUBOT_DATABASE_REPLICA=None):
+            self.assertEqual(self.alias(self.factory.get('/')), 'None')
+
+    def test_sticky_cookie_reads_from_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[replica.COOKIE_PRIMARIA] = '1'
+        self.assertEqual(self.alias(request), 'None')
+
+    def test_router_decisions(self):
+        self.assertIsNone(self.router.db_for_read(Group))
+        token = replica.alias_lectura.set('replica')
+        try:
+            self.assertEqual(self.router.db_for_read(Group), 'replica')
+            self.assertEqual(self.router.db_for_read(Group, instance=self.user), 'default')
+            self.assertEqual(self.router.db_for_write(Group, instance=self.user), 'default')
+        finally:
+            replica.alias_lectura.reset(token)
+        self.assertTrue(self.router.allow_migrate('default', 'users'))
+        self.assertFalse(self.router.allow_migrate('replica', 'users'))
+
+    def test_middleware_sets_sticky_cookie_after_writes(self):
+        response = ReplicaMiddleware(VistaEscritura.as_view())(self.factory.get('/'))
+        self.assertEqual(response.cookies[replica.COOKIE_PRIMARIA]['max-age'], 10)
+        middleware = ReplicaMiddleware(VistaLectura.as_view())
+        self.assertNotIn(replica.COOKIE_PRIMARIA, middleware(self.factory.post('/')).cookies)
+        response = middleware(self.factory.get('/'))
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(replica.COOKIE_PRIMARIA, response.cookies)
+        self.assertIsNone(replica.alias_lectura.get())
+        self.assertIsNone(replica.escrituras.get())
+
+
+@override_settings(CONSTRUBOT_DATABASE_REPLICA='replica')
+class ReplicaViewsTest(TransactionTestCase):
+    """La réplica de las pruebas es otra conexión a la misma base de datos."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        director = NivelAcceso.objects.get_or_create(nivel=3, nombre='Director')[0]
+        self.user = factories.UserFactory(nivel_acceso=director)
+        self.company = factories.CompanyFactory(customer=self.user.customer)
+        self.user.company.add(self.company)
+        self.user.currently_at = self.company
+        self.user.save()
+        self.user.groups.add(Group.objects.get_or_create(name='Proyectos')[0])
+        self.client.force_login(self.user)
+
+    def consultas_replica(self, url):
+        return len(self.get_replica(url)[1])
+
+    def get_replica(self, url):
+        with CaptureQueriesContext(connections['replica']) as replica_ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in replica_ctx.captured_queries]
+
+    def test_user_is_loaded_from_primary_and_no_etag_from_replica(self):
+        response, consultas = self.get_replica(reverse('proyectos:listado_de_clientes'))
+        self.assertNotEqual(consultas, [])
+        self.assertFalse([sql for sql in consultas if 'FROM "users_user"' in sql or 'FROM "users_company"' in sql])
+        self.assertNotIn('ETag', response)
+        self.client.cookies[replica.COOKIE_PRIMARIA] = '1'
+        self.assertIn('ETag', self.client.get(reverse('proyectos:listado_de_clientes')))
+
+    def test_company_change_get_reads_from_primary_afterwards(self):
+        otra = factories.CompanyFactory(customer=self.user.customer)
+        self.user.company.add(otra)
+        response = self.client.get(reverse('users:company_detail', kwargs={'pk': otra.pk}))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(replica.COOKIE_PRIMARIA, response.cookies)
+        self.assertEqual(self.consultas_replica(reverse('proyectos:proyect_dashboard')), 0)
+
+    def test_list_reads_from_replica_until_user_writes(self):
+        url = reverse('proyectos:listado_de_clientes')
+        self.assertGreater(self.consultas_replica(url), 0)
+        response = self.client.post(reverse('proyectos:nuevo_cliente'), {
+            'cliente_name': 'Cliente nuevo', 'company': self.company.pk, 'tipo': 'CLIENTE',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.consultas_replica(url), 0)
+        self.assertContains(self.client.get(url), 'Cliente nuevo')
+
+
+class LoginBackendTest(utils.BaseTestCase):
+
+    def setUp(self):
+        super(LoginBackendTest, self).setUp()
+        self.backend = LoginBackend()
+
+    def test_authenticates_with_email_or_username_in_one_query(self):
+        for credencial in (self.user.email, self.user.username):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.backend.authenticate(None, username=credencial, password='password'), self.user)
+        self.assertEqual(self.user.__class__.USERNAME_FIELD, 'email')
+
+    def test_wrong_password_or_unknown_user_returns_none(self):
+        self.assertIsNone(self.backend.authenticate(None, username=self.user.email, password='otra'))
+        with mock.patch('django.contrib.auth.base_user.AbstractBaseUser.set_password') as set_password:
+            self.assertIsNone(self.backend.authenticate(None, username='nadie@example.com', password='password'))
+        set_password.assert_called_once_with('password')
+
+    def test_inactive_user_cannot_authenticate(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.authenticate(None, username=self.user.username, password='password'))
+
+    def test_prefers_field_matching_the_credential(self):
+        otro = factories.UserFactory(username=self.user.email, nivel_acceso=self.auxiliar_permission)
+        self.assertEqual(self.backend.authenticate(None, username=self.user.email, password='password'), self.user)
+        self.assertNotEqual(otro, self.user)
+
+    def test_is_the_configured_backend(self):
+        user = authenticate(username=self.user.username, password='password')
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.backend, 'construbot.core.backends.LoginBackend')
+
+
+ARGON2_RAPIDO = {'time_cost': 1, 'memory_cost': 8, 'parallelism': 1}
+
+
+@override_settings(PASSWORD_HASHERS=['construbot.core.hashers.Argon2PasswordHasher'], CONSTRUBOT_ARGON2=ARGON2_RAPIDO)
+class Argon2PasswordHasherTest(utils.BaseTestCase):
+
+    def test_hash_uses_configured_parameters(self):
+        self.user.set_password('password')
+        self.assertIn('$m=8,t=1,p=1$', self.user.password)
+
+    def test_login_rehashes_with_new_parameters(self):
+        self.user.set_password('password')
+        self.user.save()
+        with self.settings(CONSTRUBOT_ARGON2=dict(ARGON2_RAPIDO, time_cost=2)):
+            usuario = LoginBackend().authenticate(None, username=self.user.email, password='password')
+        self.assertEqual(usuario, self.user)
+        self.user.refresh_from_db()
+        self.assertIn('$m=8,t=2,p=1$', self.user.password)
+        self.assertTrue(self.user.check_password('password'))
+
+
+class LoginBackendConcurrenteTest(TransactionTestCase):
+    """Muchos hilos inician sesión al mismo tiempo, unos con el correo y otros
+    con el nombre de usuario."""
+
+    def test_concurrent_logins_resolve_the_right_user(self):
+        auxiliar = NivelAcceso.objects.get_or_create(nivel=1, nombre='Auxiliar')[0]
+        usuarios = factories.UserFactory.create_batch(4, nivel_acceso=auxiliar)
+        backend = LoginBackend()
+        barrera = threading.Barrier(8)
+        errores = []
+
+        def iniciar_sesion(indice):
+            try:
+                barrera.wait()
+                for i in range(25):
+                    usuario = usuarios[(indice + i) % len(usuarios)]
+                    credencial = usuario.email if (indice + i) % 2 else usuario.username
+                    if backend.authenticate(None, username=credencial, password='password') != usuario:
+                        errores.append(credencial)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=iniciar_sesion, args=(i,)) for i in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+        self.assertEqual(usuarios[0].__class__.USERNAME_FIELD, 'email')
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ChunkedUploadTest(utils.BaseTestCase):
+    contenido = b'%PDF-1.4 ' + b'x' * 250
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super(ChunkedUploadTest, cls).tearDownClass()
+
+    def setUp(self):
+        super(ChunkedUploadTest, self).setUp()
+        self.company = factories.CompanyFactory(customer=self.user.customer)
+        self.user.company.add(self.company)
+        self.user.currently_at = self.company
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+        self.client.force_login(self.user)
+        self.md5 = hashlib.md5(self.contenido).hexdigest()
+
+    def enviar(self, inicio, fin, upload_id=None):
+        data = {'archivo': SimpleUploadedFile('contrato.pdf', self.contenido[inicio:fin])}
+        if upload_id:
+            data['upload_id'] = upload_id
+        return self.client.post(
+            reverse('core:chunk_upload'), data,
+            HTTP_CONTENT_RANGE='bytes {}-{}/{}'.format(inicio, fin - 1, len(self.contenido))
+        )
+
+    def subir(self):
+        upload_id = self.enviar(0, 100).json()['upload_id']
+        self.enviar(100, 200, upload_id)
+        self.enviar(200, len(self.contenido), upload_id)
+        return self.client.post(reverse('core:chunk_upload_complete'), {'upload_id': upload_id, 'md5': self.md5})
+
+    def test_upload_in_chunks_is_stored_by_content(self):
+        response = self.subir()
+        self.assertEqual(response.status_code, 200)
+        upload = ChunkedCoreUpload.objects.get(upload_id=response.json()['upload_id'])
+        self.assertEqual(upload.status, ChunkedCoreUpload.COMPLETE)
+        self.assertTrue(upload.file.name.endswith('/Archivos/{}/{}.pdf'.format(self.md5[:2], self.md5)))
+        with upload.file.open() as archivo:
+            self.assertEqual(archivo.read(), self.contenido)
+        self.assertEqual(upload.get_fragmentos(todos=True), [])
+
+    def test_same_content_is_stored_once(self):
+        primera = self.subir().json()
+        segunda = self.subir().json()
+        self.assertNotEqual(primera['upload_id'], segunda['upload_id'])
+        self.assertEqual(primera['archivo'], segunda['archivo'])
+        directorio = primera['archivo'].rsplit('/', 1)[0]
+        self.assertEqual(len(default_storage.listdir(directorio)[1]), 1)
+        response = self.client.get(reverse('core:chunk_upload'), {'md5': self.md5.upper()})
+        self.assertEqual(response.json()['archivo'], primera['archivo'])
+
+    def test_resume_reports_offset_and_rejects_gaps(self):
+        upload_id = self.enviar(0, 100).json()['upload_id']
+        response = self.enviar(200, 250, upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 100)
+        # Un fragmento reenviado que ya se recibió también se rechaza.
+        self.assertEqual(self.enviar(0, 100, upload_id).status_code, 409)
+        response = self.client.get(reverse('core:chunk_upload'), {'upload_id': upload_id})
+        self.assertEqual(response.json(), {'upload_id': upload_id, 'offset': 100, 'completa': False, 'archivo': None})
+
+    def test_md5_mismatch_discards_upload(self):
+        upload_id = self.enviar(0, 100).json()['upload_id']
+        upload = ChunkedCoreUpload.objects.get(upload_id=upload_id)
+        response = self.client.post(reverse('core:chunk_upload_complete'), {'upload_id': upload_id, 'md5': self.md5})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChunkedCoreUpload.objects.filter(upload_id=upload_id).exists())
+        self.assertEqual(upload.get_fragmentos(todos=True), [])
+
+    def test_uploads_are_private_to_user_and_company(self):
+        upload_id = self.enviar(0, 100).json()['upload_id']
+        otro = factories.UserFactory(nivel_acceso=self.auxiliar_permission)
+        otro.company.add(self.company)
+        otro.currently_at = self.company
+        otro.save()
+        otro.groups.add(self.proyectos_group)
+        self.client.force_login(otro)
+        self.assertEqual(self.enviar(100, 200, upload_id).status_code, 404)
+
+    def test_new_upload_must_start_at_zero(self):
+        self.assertEqual(self.enviar(100, 200).status_code, 400)
+        self.assertFalse(ChunkedCoreUpload.objects.exists())
+
+    def test_limpiar_subidas_removes_expired_uploads(self):
+        upload_id = self.enviar(0, 100).json()['upload_id']
+        upload = ChunkedCoreUpload.objects.get(upload_id=upload_id)
+        with self.settings(CONSTRUBOT_CHUNKED_UPLOAD_EXPIRATION=0):
+            call_command('limpiar_subidas', stdout=StringIO())
+        self.assertFalse(ChunkedCoreUpload.objects.exists())
+        self.assertEqual(upload.get_fragmentos(todos=True), [])
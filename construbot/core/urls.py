@@ -1,3 +1,4 @@
+from django.contrib import admin
 from django.urls import re_path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
 
@@ -6,5 +7,7 @@ from . import views
 app_name = 'construbot.core'
 
 urlpatterns = [
-
+    re_path(r'^perfiles/$', admin.site.admin_view(views.PerfilesView.as_view()), name='perfiles'),
+    re_path(r'^chunk_upload/$', views.ChunkedUploadView.as_view(), name='chunk_upload'),
+    re_path(r'^chunk_upload/complete/$', views.ChunkedUploadCompleteView.as_view(), name='chunk_upload_complete'),
 ]
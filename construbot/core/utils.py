@@ -1,14 +1,21 @@
+import hashlib
+import inspect
+import os
 import sys
 from PIL import Image
 from io import BytesIO
 from time import strftime
+from asgiref.sync import sync_to_async
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django import shortcuts
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
-from django.http import Http404
+from django.http import Http404, JsonResponse
 from django.db.models import Func
 from dal import autocomplete
+from construbot.core.replica import SoloLecturaMixin
 from construbot.users.auth import AuthenticationTestMixin
+from construbot.users.models import Company
 
 
 class Round(Func):
@@ -16,25 +23,74 @@ class Round(Func):
     template = '%(function)s(%(expressions)s, 2)'
 
 
+def get_company_path_prefix_key(company_id):
+    return 'construbot:upload-prefix:{}'.format(company_id)
+
+
+def get_company_path_prefix(company_id):
+    """Regresa el prefijo '<customer.id>-<customer_name>/<company_name>' de
+    los archivos de la compañía. Se guarda en cache para que resolver la ruta
+    de cada archivo no recorra las llaves foráneas hasta Customer."""
+    key = get_company_path_prefix_key(company_id)
+    prefix = cache.get(key)
+    if prefix is None:
+        company = Company.objects.select_related('customer').get(pk=company_id)
+        prefix = '{0}-{1}/{2}'.format(company.customer.id, company.customer.customer_name, company.company_name)
+        cache.set(key, prefix, None)
+    return prefix
+
+
+def delete_company_path_prefix(*company_ids):
+    cache.delete_many([get_company_path_prefix_key(company_id) for company_id in company_ids])
+
+
 def get_directory_path(instance, filename):
     date_str = strftime('%Y-%m-%d-%H-%M-%S')
     instance_model = instance._meta.verbose_name_plural
-    instance_customer = instance.contraparte.company.customer
-    instance_company = instance.contraparte.company.company_name
-    return '{0}-{1}/{2}/{3}/{4}-{5}'.format(
-        instance_customer.id, instance_customer.customer_name, instance_company, instance_model, date_str, filename
-    )
+    prefix = getattr(instance, 'upload_path_prefix', None)
+    if prefix is None:
+        prefix = get_company_path_prefix(instance.contraparte.company_id)
+    return '{0}/{1}/{2}-{3}'.format(prefix, instance_model, date_str, filename)
+
+
+def get_image_path_prefix(instance):
+    prefix = getattr(instance, 'upload_path_prefix', None)
+    if prefix is None:
+        # Sin prefijo precalculado (p.ej. fuera del formset) resolvemos la compañía en un solo query
+        # y lo guardamos en la instancia para las siguientes rutas.
+        estimateconcept_model = instance._meta.get_field('estimateconcept').related_model
+        company_id = estimateconcept_model.objects.filter(pk=instance.estimateconcept_id).values_list(
+            'concept__project__contraparte__company', flat=True).get()
+        prefix = instance.upload_path_prefix = get_company_path_prefix(company_id)
+    return prefix
 
 
 def get_image_directory_path(instance, filename):
-    date_str = strftime('%Y-%m-%d-%H-%M-%S')
     instance_model = instance._meta.verbose_name_plural
-    instance_customer = instance.estimateconcept.concept.project.contraparte.company.customer
-    instance_company = instance.estimateconcept.concept.project.contraparte.company.company_name
+    prefix = get_image_path_prefix(instance)
+    if getattr(instance, 'md5', ''):
+        return get_content_name(prefix, instance_model, instance.md5, filename)
+    date_str = strftime('%Y-%m-%d-%H-%M-%S')
+    return '{0}/{1}/{2}-{3}'.format(prefix, instance_model, date_str, filename)
 
-    return '{0}-{1}/{2}/{3}/{4}-{5}'.format(
-        instance_customer.id, instance_customer.customer_name, instance_company, instance_model, date_str, filename
-    )
+
+def get_md5(archivo):
+    digest = hashlib.md5()
+    for bloque in archivo.chunks():
+        digest.update(bloque)
+    archivo.seek(0)
+    return digest.hexdigest()
+
+
+def get_content_name(prefix, carpeta, md5, filename):
+    """Ruta de un archivo direccionado por su contenido: el mismo contenido
+    en una compañía siempre queda en la misma ruta."""
+    extension = os.path.splitext(filename)[1].lower()
+    return '{0}/{1}/{2}/{3}{4}'.format(prefix, carpeta, md5[:2], md5, extension)
+
+
+def get_content_path(company_id, md5, filename):
+    return get_content_name(get_company_path_prefix(company_id), 'Archivos', md5, filename)
 
 
 def get_object_403_or_404(model, user, **kwargs):
@@ -54,8 +110,7 @@ def get_object_403_or_404(model, user, **kwargs):
 
 def object_or_403(user, obj):
     if obj.company in user.company.all():
-        user.currently_at = obj.company
-        user.save()
+        user.establecer_compania(obj.company)
         return obj
     else:
         raise PermissionDenied
@@ -90,7 +145,29 @@ def image_resize(image):
     return im
 
 
-class BasicAutocomplete(AuthenticationTestMixin, autocomplete.Select2QuerySetView):
+class AsincronaMixin(object):
+    """Para vistas con handlers async. La autorización y los dispatch de los
+    demás mixins usan el ORM síncrono, así que corren con sync_to_async y el
+    handler se espera en el event loop. Si la vista no es async (p. ej. una
+    subclase con handlers síncronos) no cambia nada."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.view_is_async:
+            return super(AsincronaMixin, self).dispatch(request, *args, **kwargs)
+        return self.adispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        response = await sync_to_async(super(AsincronaMixin, self).dispatch)(request, *args, **kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+
+
+class BasicAutocomplete(AsincronaMixin, SoloLecturaMixin, AuthenticationTestMixin, autocomplete.Select2QuerySetView):
+    """Autocomplete async: con ASGI cada búsqueda espera a la base de datos
+    sin ocupar un hilo. Los resultados se piden con un renglón de más en
+    lugar de contar el queryset para saber si hay otra página."""
+    solo_lectura = True
     app_label_name = ''
     title = ''
     description = ''
@@ -112,6 +189,29 @@ class BasicAutocomplete(AuthenticationTestMixin, autocomplete.Select2QuerySetVie
         elif self.request.user and self.request.POST:
             return self.model.objects
 
+    def get_pagina(self):
+        try:
+            return max(1, int(self.request.GET.get(self.page_kwarg, 1)))
+        except ValueError:
+            return 1
+
+    async def get(self, request, *args, **kwargs):
+        # get_queryset puede consultar la base de datos, p. ej. el contrato de DestinatarioAutocomplete.
+        queryset = await sync_to_async(self.get_queryset)()
+        pagina = self.get_pagina()
+        inicio = (pagina - 1) * self.paginate_by
+        resultados = [] if queryset is None else [
+            resultado async for resultado in queryset[inicio:inicio + self.paginate_by + 1]
+        ]
+        context = {'object_list': resultados[:self.paginate_by]}
+        return JsonResponse({
+            'results': self.get_results(context) + (self.get_create_option(context, self.q) if pagina == 1 else []),
+            'pagination': {'more': len(resultados) > self.paginate_by},
+        })
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(super(BasicAutocomplete, self).post)(request, *args, **kwargs)
+
     def get_post_key_words(self):
         return {}
 
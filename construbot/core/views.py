@@ -0,0 +1,106 @@
+import re
+from django.contrib import admin
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.views.generic import TemplateView, View
+from construbot.users.auth import AuthenticationTestMixin
+from . import pool, profiling
+from .models import ChunkedCoreUpload, SubidaError
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class PerfilesView(TemplateView):
+    """Percentiles de consultas y tiempos por vista registrados por
+    ProfilingMiddleware y estadísticas del pool de conexiones del proceso. Se
+    sirve dentro del admin, solo para staff."""
+    template_name = 'core/perfiles.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(PerfilesView, self).get_context_data(**kwargs)
+        context.update(admin.site.each_context(self.request))
+        context['title'] = 'Perfil de vistas'
+        context['resumenes'] = profiling.get_resumenes()
+        context['percentiles'] = profiling.PERCENTILES
+        context['pools'] = pool.get_estadisticas()
+        return context
+
+    def post(self, request, *args, **kwargs):
+        profiling.borrar_muestras()
+        pool.get_estadisticas(reiniciar=True)
+        return redirect(request.path)
+
+
+class ChunkedUploadMixin(AuthenticationTestMixin):
+    app_label_name = 'Proyectos'
+    permiso_requerido = 1
+
+    def get_upload(self, upload_id, bloquear=False):
+        queryset = ChunkedCoreUpload.objects.select_for_update() if bloquear else ChunkedCoreUpload.objects
+        return get_object_or_404(
+            queryset, upload_id=upload_id, user=self.request.user, company=self.request.user.currently_at
+        )
+
+    def error(self, error, upload=None):
+        datos = upload.as_dict() if upload else {}
+        datos['error'] = str(error)
+        return JsonResponse(datos, status=error.status)
+
+
+class ChunkedUploadView(ChunkedUploadMixin, View):
+    """Recibe los fragmentos que envía jquery.fileupload con el encabezado
+    Content-Range. Con GET regresa el offset de `upload_id` para reanudar la
+    subida o, con `md5`, una subida completa con el mismo contenido para no
+    volver a subirlo."""
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('md5'):
+            upload = ChunkedCoreUpload.especial.completas(request.user.currently_at).filter(
+                md5=request.GET['md5'].lower()).first()
+            return JsonResponse(upload.as_dict() if upload else {'completa': False})
+        return JsonResponse(self.get_upload(request.GET.get('upload_id')).as_dict())
+
+    def get_rango(self, contenido):
+        """Regresa el byte inicial del fragmento."""
+        content_range = self.request.headers.get('Content-Range')
+        if not content_range:
+            return 0
+        match = CONTENT_RANGE_RE.match(content_range)
+        if match is None:
+            raise SubidaError('Encabezado Content-Range inválido.')
+        inicio, fin, total = (int(valor) for valor in match.groups())
+        if fin - inicio + 1 != contenido.size or fin >= total:
+            raise SubidaError('El tamaño del fragmento no coincide con Content-Range.')
+        return inicio
+
+    def post(self, request, *args, **kwargs):
+        if len(request.FILES) != 1:
+            return self.error(SubidaError('Se esperaba un fragmento.'))
+        contenido = next(iter(request.FILES.values()))
+        upload = None
+        try:
+            inicio = self.get_rango(contenido)
+            if request.POST.get('upload_id'):
+                upload = self.get_upload(request.POST['upload_id'], bloquear=True)
+            elif inicio:
+                raise SubidaError('Una subida nueva debe iniciar en el byte 0.')
+            else:
+                upload = ChunkedCoreUpload.objects.create(
+                    user=request.user, company=request.user.currently_at, filename=contenido.name
+                )
+            upload.agregar(contenido, inicio)
+        except SubidaError as e:
+            return self.error(e, upload)
+        return JsonResponse(upload.as_dict())
+
+
+class ChunkedUploadCompleteView(ChunkedUploadMixin, View):
+    """Une los fragmentos y verifica el MD5 calculado por el navegador."""
+
+    def post(self, request, *args, **kwargs):
+        upload = self.get_upload(request.POST.get('upload_id'), bloquear=True)
+        try:
+            upload.completar(request.POST.get('md5', ''))
+        except SubidaError as e:
+            return self.error(e)
+        return JsonResponse(upload.as_dict())
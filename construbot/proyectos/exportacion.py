@@ -0,0 +1,165 @@
+"""
+Exportación de estimaciones y catálogos a hojas de cálculo.
+
+Las descargas individuales (catálogo de conceptos o una estimación) se
+escriben fila por fila desde un cursor con `.iterator()`: el CSV se envía con
+`StreamingHttpResponse` y el XLSX se escribe en modo write_only de openpyxl a
+un archivo temporal, así la memoria no crece con el tamaño del catálogo.
+
+En la exportación masiva de estimaciones de un contrato los PDFs se generan
+en paralelo en los workers con la misma tarea de la descarga individual
+(`tasks.generate_estimate_pdf`), así que los que ya existen en el storage no se
+vuelven a dibujar. Al terminar, una sola tarea los empaqueta en un ZIP junto
+con un XLSX consolidado de las estimaciones.
+"""
+import csv
+import os
+import tempfile
+import uuid
+import zipfile
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from construbot.core.utils import get_company_path_prefix
+from . import pdf
+from .models import Concept, Estimate
+
+STORAGE_FOLDER = 'Exportaciones'
+
+CSV = 'csv'
+XLSX = 'xlsx'
+FORMATOS = (CSV, XLSX)
+CHUNK_SIZE = 2000
+
+ENCABEZADO_CATALOGO = ('Código', 'Concepto', 'Unidad', 'Cantidad', 'P.U.')
+
+ENCABEZADO_CONCEPTOS = (
+    'Estimación', 'Código', 'Concepto', 'Unidad', 'Cantidad contratada', 'P.U.', 'Importe contratado',
+    'Cantidad anterior', 'Importe anterior', 'Cantidad acumulada', 'Importe acumulado',
+    'Cantidad esta estimación', 'Importe esta estimación',
+)
+
+ENCABEZADO_RESUMEN = (
+    'Estimación', 'Inicio', 'Término', 'Subtotal', 'Amortización de anticipo', 'Retenciones', 'Total final',
+)
+
+
+def nuevo_identificador():
+    return uuid.uuid4().hex
+
+
+def get_export_storage_name(company_id, identificador):
+    return '{}/{}/estimaciones-{}.zip'.format(get_company_path_prefix(company_id), STORAGE_FOLDER, identificador)
+
+
+def get_estimaciones(estimate_ids):
+    return Estimate.objects.filter(pk__in=estimate_ids).select_related('project').prefetch_related(
+        'project__retenciones_set').order_by('consecutive')
+
+
+def get_pdfs_por_generar(estimate_ids):
+    """Pares (estimación, tipo) en el mismo orden en que `empaquetar` recibe los PDFs."""
+    return [(estimate_id, kind) for estimate_id in estimate_ids for kind in pdf.TIPOS_PDF]
+
+
+def filas_catalogo(contrato):
+    return Concept.objects.filter(project=contrato).order_by('pk').values_list(
+        'code', 'concept_text', 'unit__unit', 'total_cuantity', 'unit_price'
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def filas_conceptos(estimate):
+    consecutivo = '{:02d}'.format(estimate.consecutive)
+    for concepto in estimate.anotaciones_conceptos().iterator(chunk_size=CHUNK_SIZE):
+        yield (
+            consecutivo, concepto.code, concepto.concept_text, concepto.unit.unit,
+            concepto.total_cuantity, concepto.unit_price, concepto.importe_contratado(),
+            concepto.cantidad_estimado_anterior(), concepto.anterior or 0,
+            concepto.cantidad_estimado_ala_fecha(), concepto.acumulado or 0,
+            concepto.cantidad_esta_estimacion(), concepto.estaestimacion or 0,
+        )
+
+
+def fila_resumen(estimate):
+    return (
+        '{:02d}'.format(estimate.consecutive), estimate.start_date, estimate.finish_date,
+        estimate.get_subtotal(), estimate.amortizacion_anticipo(), estimate.get_total_retenciones(),
+        estimate.get_total_final(),
+    )
+
+
+class Echo(object):
+    """Objeto tipo archivo que regresa lo que se le escribe, para que
+    `csv.writer` produzca cada fila como un pedazo de la respuesta."""
+
+    def write(self, value):
+        return value
+
+
+def respuesta_csv(nombre, encabezado, filas):
+    writer = csv.writer(Echo())
+
+    def contenido():
+        # El BOM le indica a Excel que el archivo viene en UTF-8.
+        yield '\ufeff' + writer.writerow(encabezado)
+        for fila in filas:
+            yield writer.writerow(fila)
+    return StreamingHttpResponse(
+        contenido(), content_type='text/csv; charset=utf-8',
+        headers={'Content-Disposition': 'attachment; filename="{}.csv"'.format(nombre)}
+    )
+
+
+def respuesta_xlsx(nombre, encabezado, filas):
+    wb = Workbook(write_only=True)
+    hoja = wb.create_sheet(nombre[:31])
+    hoja.append(encabezado)
+    for fila in filas:
+        hoja.append(fila)
+    archivo = tempfile.TemporaryFile()
+    wb.save(archivo)
+    archivo.seek(0)
+    return FileResponse(
+        archivo, as_attachment=True, filename='{}.xlsx'.format(nombre),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+def respuesta_hoja(formato, nombre, encabezado, filas):
+    if formato == CSV:
+        return respuesta_csv(nombre, encabezado, filas)
+    return respuesta_xlsx(nombre, encabezado, filas)
+
+
+def escribir_consolidado(estimaciones, destino):
+    """Escribe en `destino` un XLSX con una hoja de conceptos y otra de resumen.
+    Se usa el modo write_only de openpyxl para no mantener el libro en memoria."""
+    wb = Workbook(write_only=True)
+    hoja_conceptos = wb.create_sheet('Conceptos')
+    hoja_resumen = wb.create_sheet('Resumen')
+    hoja_conceptos.append(ENCABEZADO_CONCEPTOS)
+    hoja_resumen.append(ENCABEZADO_RESUMEN)
+    for estimate in estimaciones:
+        for fila in filas_conceptos(estimate):
+            hoja_conceptos.append(fila)
+        hoja_resumen.append(fila_resumen(estimate))
+    wb.save(destino)
+
+
+def empaquetar(nombre, pdfs, estimate_ids):
+    """Guarda en `nombre` un ZIP con los PDFs ya generados y el consolidado.
+    `pdfs` son los nombres en el storage en el orden de `get_pdfs_por_generar`."""
+    estimaciones = list(get_estimaciones(estimate_ids))
+    consecutivos = {estimate.pk: estimate.consecutive for estimate in estimaciones}
+    with tempfile.TemporaryDirectory() as directorio:
+        consolidado = os.path.join(directorio, 'consolidado.xlsx')
+        escribir_consolidado(estimaciones, consolidado)
+        paquete = os.path.join(directorio, 'paquete.zip')
+        with zipfile.ZipFile(paquete, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for (estimate_id, kind), pdf_name in zip(get_pdfs_por_generar(estimate_ids), pdfs):
+                with default_storage.open(pdf_name) as archivo:
+                    zf.writestr('{}-{:02d}.pdf'.format(kind, consecutivos[estimate_id]), archivo.read())
+            zf.write(consolidado, 'consolidado.xlsx')
+        with open(paquete, 'rb') as archivo:
+            return default_storage.save(nombre, File(archivo))
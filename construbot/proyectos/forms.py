@@ -1,12 +1,16 @@
 from django.db import transaction
+from django.db.models import Prefetch
 from django import forms
+from django.utils.functional import SimpleLazyObject, cached_property
 from dal import autocomplete
 from treebeard.mp_tree import MP_AddRootHandler, MP_AddChildHandler
 from .models import (
     Contrato, Contraparte, Sitio, Concept, Destinatario, Estimate,
     EstimateConcept, ImageEstimateConcept, Retenciones, Units, Vertices)
 from construbot.users.models import Company
-from construbot.proyectos import widgets
+from construbot.core.models import ChunkedCoreUpload
+from construbot.core.utils import get_company_path_prefix
+from construbot.proyectos import numeracion, widgets
 
 MY_DATE_FORMATS = '%Y-%m-%d'
 
@@ -22,18 +26,34 @@ class ExcelConceptCatalogForm(forms.Form):
         )
 
 
+class EstimateExportForm(forms.Form):
+    fecha_inicio = forms.DateField(input_formats=[MY_DATE_FORMATS])
+    fecha_fin = forms.DateField(input_formats=[MY_DATE_FORMATS])
+
+    def clean(self):
+        cleaned_data = super(EstimateExportForm, self).clean()
+        fecha_inicio = cleaned_data.get('fecha_inicio')
+        fecha_fin = cleaned_data.get('fecha_fin')
+        if fecha_inicio and fecha_fin and fecha_inicio > fecha_fin:
+            raise forms.ValidationError('La fecha de inicio debe ser anterior a la fecha de término.')
+        return cleaned_data
+
+
 class ContratoForm(forms.ModelForm):
     currently_at = forms.CharField(widget=forms.HiddenInput())
-    # relacion_id_archivo = forms.CharField(widget=forms.HiddenInput(), required=False)
+    # upload_id de una subida por fragmentos (ver construbot.core.models.ChunkedCoreUpload).
+    relacion_id_archivo = forms.CharField(widget=forms.HiddenInput(), required=False)
 
     def obj_transaction_process(self):
         with transaction.atomic():
+            self.cleaned_data['folio'] = numeracion.siguiente_folio(self.request.user.currently_at)
             instance = MP_AddRootHandler(Contrato, **self.cleaned_data).process()
         return instance
 
     def save(self, commit=True):
         usrs = self.cleaned_data.pop('users')
         self.cleaned_data.pop('currently_at')
+        self.cleaned_data.pop('relacion_id_archivo', None)
         if not self.instance.pk:
             self.instance = self.obj_transaction_process()
             super(ContratoForm, self).save(commit=False)
@@ -44,8 +64,20 @@ class ContratoForm(forms.ModelForm):
             super(ContratoForm, self).save(commit=True)
         return self.instance
 
+    def clean_relacion_id_archivo(self):
+        upload_id = self.cleaned_data.get('relacion_id_archivo')
+        if not upload_id:
+            return None
+        upload = ChunkedCoreUpload.especial.completas(self.request.user.currently_at).filter(
+            upload_id=upload_id).first()
+        if upload is None:
+            raise forms.ValidationError('El archivo no existe o aún no termina de subirse.')
+        return upload
+
     def clean(self):
         result = super(ContratoForm, self).clean()
+        if self.cleaned_data.get('relacion_id_archivo'):
+            self.cleaned_data['file'] = self.cleaned_data['relacion_id_archivo'].file.name
         if self.cleaned_data.get('currently_at') is None:
             raise forms.ValidationError('Error en la formación del formulario, es posible que este corrupto,'
                                         'porfavor recarga y vuelve a intentarlo')
@@ -141,6 +173,7 @@ class SubContratoForm(ContratoForm):
 
     def obj_transaction_process(self):
         with transaction.atomic():
+            self.cleaned_data['folio'] = numeracion.siguiente_folio_subcontrato(self.contrato)
             instance = MP_AddChildHandler(self.contrato, **self.cleaned_data).process()
         return instance
 
@@ -332,7 +365,28 @@ class EstimateForm(forms.ModelForm):
         }
 
 
-class ImageInlineFormset(forms.BaseInlineFormSet):
+class PrefetchedInlineFormset(forms.BaseInlineFormSet):
+    """Usa los objetos que la instancia ya trae de un prefetch_related en vez
+    de volver a consultarlos."""
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            precargados = getattr(self.instance, '_prefetched_objects_cache', {})
+            relacion = self.fk.remote_field.get_accessor_name()
+            if relacion in precargados:
+                self._queryset = sorted(precargados[relacion], key=lambda obj: obj.pk)
+        return super(PrefetchedInlineFormset, self).get_queryset()
+
+
+class ImageInlineFormset(PrefetchedInlineFormset):
+    upload_path_prefix = None
+
+    def save_new(self, form, commit=True):
+        # La ruta de la imagen se arma con el prefijo que nos pasa el formset padre,
+        # así cada archivo no vuelve a consultar contrato, contraparte y compañía.
+        form.instance.upload_path_prefix = self.upload_path_prefix
+        return super(ImageInlineFormset, self).save_new(form, commit=commit)
+
     def clean(self):
         result = super(ImageInlineFormset, self).clean()
         limit_size = 2097152
@@ -356,14 +410,33 @@ verticesformset = forms.inlineformset_factory(
     EstimateConcept,
     Vertices,
     extra=1,
-    fields=('nombre', 'largo', 'ancho', 'alto', 'piezas')
+    fields=('nombre', 'largo', 'ancho', 'alto', 'piezas'),
+    formset=PrefetchedInlineFormset,
 )
 
 
 class BaseEstimateConceptInlineFormset(forms.BaseInlineFormSet):
 
+    def __init__(self, *args, **kwargs):
+        super(BaseEstimateConceptInlineFormset, self).__init__(*args, **kwargs)
+        self.queryset = self.queryset.prefetch_related(
+            Prefetch('imageestimateconcept_set', queryset=ImageEstimateConcept.objects.order_by('pk')),
+            Prefetch('vertices_set', queryset=Vertices.objects.order_by('pk')),
+        )
+
+    @cached_property
+    def conceptos(self):
+        conceptos = {
+            inicial['concept'].pk: inicial['concept'] for inicial in self.initial_extra or []
+            if isinstance(inicial.get('concept'), Concept)
+        }
+        if self.instance.project_id:
+            conceptos.update(Concept.objects.filter(project_id=self.instance.project_id).in_bulk())
+        return conceptos
+
     def add_fields(self, form, index):
         super(BaseEstimateConceptInlineFormset, self).add_fields(form, index)
+        form.fields['concept'].widget.conceptos = SimpleLazyObject(lambda: self.conceptos)
 
         form.nested = imageformset(
             instance=form.instance,
@@ -396,10 +469,17 @@ class BaseEstimateConceptInlineFormset(forms.BaseInlineFormSet):
                     result &= vertice_validity
         return result
 
+    def get_upload_path_prefix(self):
+        if not hasattr(self, 'upload_path_prefix'):
+            self.upload_path_prefix = get_company_path_prefix(self.instance.project.contraparte.company_id)
+        return self.upload_path_prefix
+
     def save(self, commit=True):
         result = super(BaseEstimateConceptInlineFormset, self).save(commit=commit)
         for form in self.forms:
             if hasattr(form, 'nested'):
+                if form.nested.has_changed():
+                    form.nested.upload_path_prefix = self.get_upload_path_prefix()
                 form.nested.save(commit=commit)
             if hasattr(form, 'vertices'):
                 form.vertices.save(commit=commit)
@@ -440,8 +520,20 @@ def estimateConceptInlineForm(count=0):
     return inlineform
 
 
+class BaseConceptInlineFormset(forms.BaseInlineFormSet):
+
+    def __init__(self, *args, **kwargs):
+        super(BaseConceptInlineFormset, self).__init__(*args, **kwargs)
+        self.queryset = self.queryset.select_related('unit')
+
+    def add_fields(self, form, index):
+        super(BaseConceptInlineFormset, self).add_fields(form, index)
+        if form.instance.unit_id:
+            form.fields['unit'].widget.seleccionada = form.instance.unit
+
+
 ContractConceptInlineForm = forms.inlineformset_factory(
-    Contrato, Concept,
+    Contrato, Concept, formset=BaseConceptInlineFormset,
     fields=(
         'code',
         'concept_text',
@@ -455,7 +547,7 @@ ContractConceptInlineForm = forms.inlineformset_factory(
             'cols': '20',
             'rows': '4'
         }),
-        'unit': autocomplete.ModelSelect2(
+        'unit': widgets.SeleccionPrecargadaSelect2(
             url='proyectos:unit-autocomplete',
             attrs={'class': 'n-input', 'data-minimum-input-length': 1}
         ),
@@ -1,21 +1,56 @@
+import argparse
+import time
 from random import random
 from datetime import datetime, timedelta
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.core.management import call_command
 from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
 from django.db.models import Max
+from django.contrib.auth import get_user_model
 from construbot.users.tests import factories as user_factories
 from construbot.users.utils import establish_access_levels
 from construbot.users.models import NivelAcceso
 from construbot.proyectos.tests import factories
 from construbot.proyectos.models import Contrato
+from construbot.proyectos.poblacion import ESCALAS, GeneradorMasivo, crear_tenants
+
+
+def positivo(valor):
+    numero = int(valor)
+    if numero < 1:
+        raise argparse.ArgumentTypeError('debe ser al menos 1, se recibió {}'.format(valor))
+    return numero
 
 
 class Command(BaseCommand):
+    help = (
+        'Elimina la base de datos y la puebla con datos de prueba. Con --bulk no elimina nada: agrega '
+        'customers, compañías y usuarios nuevos y llena cada compañía con bulk_create.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', action='store_true', help='Genera los datos en bloques con bulk_create.')
+        parser.add_argument('--escala', choices=sorted(ESCALAS), default='chica',
+                            help='Contratos, conceptos y estimaciones por compañía.')
+        parser.add_argument('--customers', type=positivo, default=1)
+        parser.add_argument('--companias', type=positivo, default=1, help='Compañías por customer.')
+        parser.add_argument('--usuarios', type=positivo, default=5, help='Usuarios por compañía.')
+        parser.add_argument('--contratos', type=int, help='Contratos por compañía.')
+        parser.add_argument('--conceptos', type=int, help='Conceptos por contrato.')
+        parser.add_argument('--estimaciones', type=int, help='Estimaciones por contrato.')
+        parser.add_argument('--vertices', type=int, default=2, help='Vértices por concepto estimado.')
+        parser.add_argument('--imagenes', type=float, default=0, help='Fracción de conceptos estimados con imagen.')
+        parser.add_argument('--hijos', type=int, default=3, help='Subcontratos por contrato.')
+        parser.add_argument('--profundidad', type=positivo, default=3, help='Niveles de cada árbol de contratos.')
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--prefijo', default='poblar', help='Prefijo de customers, compañías y usuarios.')
 
     def handle(self, *args, **options):
-        if settings.DEBUG:
+        if options.get('bulk'):
+            self.handle_bulk(options)
+        elif settings.DEBUG:
             call_command('flush')
             self.user_factory = user_factories.UserFactory
             self.create_customer(5)
@@ -41,6 +76,43 @@ class Command(BaseCommand):
         else:
             raise ImproperlyConfigured('No tienes settings.DEBUG activado, la operación no se puede completar.')
 
+    def handle_bulk(self, options):
+        inicio = time.monotonic()
+        escala = ESCALAS[options['escala']]
+        # Los nombres de usuario y correos son únicos: con un prefijo ya usado
+        # la inserción fallaría a la mitad.
+        if get_user_model().objects.filter(username__startswith='{}_'.format(options['prefijo'])).exists():
+            raise CommandError('Ya existen usuarios con el prefijo "{}"; usa otro con --prefijo.'.format(
+                options['prefijo']))
+        with transaction.atomic():
+            tenants = crear_tenants(
+                options['customers'], options['companias'], options['usuarios'], prefijo=options['prefijo'])
+        totales = {}
+        for i, (company, usuarios) in enumerate(tenants):
+            self.stdout.write('Poblando {} ({}/{})'.format(company.company_name, i + 1, len(tenants)))
+            resumen = GeneradorMasivo(
+                company, usuarios[0],
+                contratos=options['contratos'] or escala['contratos'],
+                conceptos_por_contrato=options['conceptos'] or escala['conceptos_por_contrato'],
+                estimaciones_por_contrato=options['estimaciones'] or escala['estimaciones_por_contrato'],
+                hijos=options['hijos'], profundidad=options['profundidad'], vertices=options['vertices'],
+                imagenes=options['imagenes'], usuarios=usuarios, semilla=options['semilla'] + i,
+                reportar=self.reportar,
+            ).generar()
+            for llave, cantidad in resumen.items():
+                totales[llave] = totales.get(llave, 0) + cantidad
+        self.stdout.write(self.style.SUCCESS(
+            'Se agregaron en {:.0f} s:\n- {} Customer\n- {} Compañías\n- {} Usuarios\n'.format(
+                time.monotonic() - inicio, options['customers'], len(tenants),
+                sum(len(usuarios) for company, usuarios in tenants)) +
+            '\n'.join('- {} {}'.format(totales.get(llave, 0), llave.replace('_', ' ').capitalize()) for llave in (
+                'contratos', 'conceptos', 'estimaciones', 'estimate_concepts', 'vertices', 'imagenes'))
+        ))
+
+    def reportar(self, etapa, hechos, total):
+        if hechos == total or not hechos % (GeneradorMasivo.contratos_por_bloque * 10):
+            self.stdout.write('  {}: {}/{}'.format(etapa, hechos, total))
+
     def create_customer(self, number):
         self.customer = []
         for i in range(0, number):
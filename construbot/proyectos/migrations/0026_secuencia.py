@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-19 19:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0025_auto_20201020_1419'),
+        ('users', '0013_alter_user_first_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Secuencia',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('C', 'Contratos'), ('S', 'Subcontratos'), ('E', 'Estimaciones')], max_length=1)),
+                ('ultimo', models.PositiveIntegerField(default=0)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='users.company')),
+                ('contrato', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='proyectos.contrato')),
+            ],
+            options={
+                'verbose_name': 'Secuencia',
+                'verbose_name_plural': 'Secuencias',
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'company'), name='secuencia_unica_por_company'), models.UniqueConstraint(fields=('tipo', 'contrato'), name='secuencia_unica_por_contrato')],
+            },
+        ),
+    ]
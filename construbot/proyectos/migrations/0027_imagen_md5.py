@@ -0,0 +1,24 @@
+# Generated by Django 5.2.10 on 2026-10-19 19:46
+
+import construbot.core.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0026_secuencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageestimateconcept',
+            name='md5',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='imageestimateconcept',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to=construbot.core.utils.get_image_directory_path),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.10 on 2026-10-19 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proyectos', '0027_imagen_md5'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueoImagen',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ruta', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Bloqueo de imagen',
+                'verbose_name_plural': 'Bloqueos de imágenes',
+            },
+        ),
+    ]
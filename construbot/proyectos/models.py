@@ -1,7 +1,7 @@
 import string
 from decimal import Decimal
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
@@ -148,6 +148,14 @@ class Contrato(MP_Node):
         except IndexError:
             return None
 
+    @classmethod
+    def get_siguiente_posicion_raiz(cls):
+        """Posición para un nodo raíz nuevo cuya ruta se calcula fuera de treebeard.
+        Se toma la ruta mayor y no get_last_root_node() (ordenado por pk) para
+        que las rutas calculadas nunca choquen con una existente."""
+        ultimo = cls.get_root_nodes().order_by('-path').first()
+        return ultimo._get_lastpos_in_path() + 1 if ultimo else 1
+
     @property
     def company(self):
         return self.contraparte.company
@@ -160,10 +168,18 @@ class Contrato(MP_Node):
         return reverse('construbot.proyectos:contrato_detail', kwargs={'pk': self.id})
 
     def get_estimaciones(self):
-        return self.estimate_set.all().order_by('consecutive')
+        return Estimate.especial.con_totales().filter(project=self).order_by('consecutive')
 
     def get_top_10_children(self):
-        query = self.get_children()
+        """Anota `ejercido`, el mismo importe de ejercido_acumulado()."""
+        ejercido = EstimateConcept.objects.filter(concept__project=models.OuterRef('pk')).values(
+            'concept__project').annotate(
+            total=utils.Round(Sum(F('cuantity_estimated') * F('concept__unit_price')))
+        ).values('total')
+        query = self.get_children().annotate(ejercido=Coalesce(
+            models.Subquery(ejercido, output_field=models.DecimalField(max_digits=20, decimal_places=2)),
+            V(Decimal('0.00'))
+        ))
         return query.order_by('-monto')[:10]
 
     def ejercido_acumulado(self):
@@ -203,6 +219,23 @@ class Retenciones(models.Model):
 
 class EstimateSet(models.QuerySet):
 
+    def con_totales(self):
+        """Anota `total_estimacion`, el mismo importe de Estimate.total_estimate()
+        calculado en la misma consulta."""
+        total = EstimateConcept.objects.filter(estimate=models.OuterRef('pk')).values('estimate').annotate(
+            total=utils.Round(Sum(F('cuantity_estimated') * F('concept__unit_price')))
+        ).values('total')
+        return self.annotate(total_estimacion=Coalesce(
+            models.Subquery(total, output_field=models.DecimalField(max_digits=20, decimal_places=2)),
+            V(Decimal('0.00'))
+        ))
+
+    def exportacion(self, company, contrato, start_date, finish_date):
+        return self.filter(
+            project=contrato, project__contraparte__company=company,
+            finish_date__gte=start_date, finish_date__lte=finish_date
+        ).order_by('consecutive')
+
     def reporte_subestimaciones(self, start_date, finish_date, depth, path):
         sql = """
             SELECT  U1."id", U1."consecutive", U3."contrato_shortName",
@@ -459,6 +492,18 @@ class Estimate(models.Model):
         self.conceptos = conceptos.add_estimateconcept_properties(self.consecutive)
         return self.conceptos
 
+    def anotaciones_generador(self):
+        """anotaciones_conceptos() con los vértices e imágenes de esta estimación
+        precargados, para que anotar_vertices y anotar_imagenes no consulten
+        concepto por concepto."""
+        return self.anotaciones_conceptos().prefetch_related(models.Prefetch(
+            'estimateconcept_set', to_attr='conceptos_estimacion',
+            queryset=EstimateConcept.objects.filter(estimate=self).prefetch_related(
+                models.Prefetch('vertices_set', queryset=Vertices.objects.order_by('pk')),
+                models.Prefetch('imageestimateconcept_set', queryset=ImageEstimateConcept.objects.order_by('pk')),
+            )
+        ))
+
     class Meta:
         verbose_name = 'Estimacion'
         verbose_name_plural = 'Estimaciones'
@@ -606,7 +651,9 @@ class Concept(models.Model):
         return self.unit_price_operations('estaestimacion')
 
     def anotar_imagenes(self):
-        if hasattr(self, 'conceptoestimacion'):
+        if hasattr(self, 'conceptos_estimacion'):
+            return [imagen for ec in self.conceptos_estimacion for imagen in ec.imageestimateconcept_set.all()]
+        elif hasattr(self, 'conceptoestimacion'):
             return ImageEstimateConcept.objects.filter(estimateconcept=self.conceptoestimacion)
         else:
             raise AttributeError('No es posible realizar la operación porque es necesario '
@@ -615,7 +662,9 @@ class Concept(models.Model):
                                  'con el manejador ConceptSet')
 
     def anotar_vertices(self):
-        if hasattr(self, 'conceptoestimacion'):
+        if hasattr(self, 'conceptos_estimacion'):
+            return [vertice for ec in self.conceptos_estimacion for vertice in ec.vertices_set.all()]
+        elif hasattr(self, 'conceptoestimacion'):
             return Vertices.objects.filter(estimateconcept=self.conceptoestimacion)
         else:
             raise AttributeError('No es posible realizar la operación porque es necesario '
@@ -697,19 +746,49 @@ class ImageEstimateConceptSet(models.QuerySet):
 
 
 class ImageEstimateConcept(models.Model):
-    image = models.ImageField(upload_to=utils.get_image_directory_path)
+    """Las imágenes nuevas se guardan en la ruta del MD5 del archivo original
+    (ver utils.get_image_directory_path). Si la compañía ya tiene una imagen con
+    el mismo contenido la fila apunta al mismo archivo sin volver a
+    redimensionarlo ni guardarlo, y el archivo se borra al eliminar la última
+    fila que lo usa (signals.handlers.delete_generator_images)."""
+    image = models.ImageField(upload_to=utils.get_image_directory_path, db_index=True)
     estimateconcept = models.ForeignKey(EstimateConcept, on_delete=models.CASCADE)
     size = models.BigIntegerField('Tamaño del archivo en kb', null=True)
+    md5 = models.CharField(max_length=32, blank=True, db_index=True)
 
     objects = models.Manager()
     especial = ImageEstimateConceptSet.as_manager()
 
+    def get_existente(self, ruta):
+        """(image, size) de una imagen de la compañía con el mismo contenido."""
+        return ImageEstimateConcept.objects.filter(md5=self.md5, image__startswith=ruta).values_list(
+            'image', 'size').first()
+
     def save(self, *args, **kwargs):
-        # Resize/modify the image
-        if self.image.height > 380:
-            self.image = utils.image_resize(self.image)
-        self.size = self.image.size
-        super(ImageEstimateConcept, self).save(*args, **kwargs)
+        if not self.image or self.image._committed:
+            return super(ImageEstimateConcept, self).save(*args, **kwargs)
+        self.md5 = utils.get_md5(self.image)
+        ruta = utils.get_content_name(
+            utils.get_image_path_prefix(self), self._meta.verbose_name_plural, self.md5, '')
+        with transaction.atomic(savepoint=False):
+            # Hasta el commit, delete_generator_images no puede borrar el archivo que se reutiliza.
+            BloqueoImagen.bloquear(ruta)
+            existente = self.get_existente(ruta)
+            if existente:
+                self.image, self.size = existente
+            else:
+                # Resize/modify the image
+                if self.image.height > 380:
+                    self.image = utils.image_resize(self.image)
+                self.size = self.image.size
+            super(ImageEstimateConcept, self).save(*args, **kwargs)
+
+    def get_ruta_bloqueo(self):
+        """Ruta sin extensión que comparten las filas con el mismo contenido, o
+        None para las imágenes anteriores al MD5, que nunca se reutilizan."""
+        if not self.md5:
+            return None
+        return '{}/{}'.format(self.image.name.rsplit('/', 1)[0], self.md5)
 
     class Meta:
         verbose_name = 'Imagen_generador'
@@ -717,3 +796,52 @@ class ImageEstimateConcept(models.Model):
 
     def __str__(self):
         return '{} {}'.format(self.id, repr(self.estimateconcept))
+
+
+class BloqueoImagen(models.Model):
+    """Fila por archivo de imagen de generador que se bloquea con
+    `select_for_update` al reutilizar el archivo (ImageEstimateConcept.save) y
+    al decidir si se borra (signals.handlers.delete_generator_images), así un
+    insert sin commit que reutiliza el archivo no lo pierde."""
+    ruta = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name = 'Bloqueo de imagen'
+        verbose_name_plural = 'Bloqueos de imágenes'
+
+    def __str__(self):
+        return self.ruta
+
+    @classmethod
+    def bloquear(cls, ruta, using=None):
+        return cls.objects.using(using).select_for_update().get_or_create(ruta=ruta)[0]
+
+
+class Secuencia(models.Model):
+    """Último folio o consecutivo asignado en un ámbito de numeración: los
+    contratos raíz de una compañía, o los subcontratos o las estimaciones de
+    un contrato. Su fila se bloquea al asignar y al recorrer números (ver
+    construbot.proyectos.numeracion)."""
+    CONTRATOS = 'C'
+    SUBCONTRATOS = 'S'
+    ESTIMACIONES = 'E'
+    TIPOS = (
+        (CONTRATOS, 'Contratos'),
+        (SUBCONTRATOS, 'Subcontratos'),
+        (ESTIMACIONES, 'Estimaciones'),
+    )
+    tipo = models.CharField(max_length=1, choices=TIPOS)
+    company = models.ForeignKey(Company, null=True, blank=True, on_delete=models.CASCADE)
+    contrato = models.ForeignKey(Contrato, null=True, blank=True, on_delete=models.CASCADE)
+    ultimo = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Secuencia'
+        verbose_name_plural = 'Secuencias'
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'company'], name='secuencia_unica_por_company'),
+            models.UniqueConstraint(fields=['tipo', 'contrato'], name='secuencia_unica_por_contrato'),
+        ]
+
+    def __str__(self):
+        return '{} {}: {}'.format(self.get_tipo_display(), self.company_id or self.contrato_id, self.ultimo)
@@ -0,0 +1,91 @@
+"""
+Numeración de contratos (`folio`) y estimaciones (`consecutive`).
+
+Los números son consecutivos dentro de su ámbito: los contratos raíz de una
+compañía, los subcontratos de un contrato y las estimaciones de un contrato.
+Los reportes dependen de que no haya huecos (la estimación anterior es la de
+`consecutive - 1`), así que al eliminar se recorren los números posteriores,
+pero sólo los del mismo ámbito.
+
+Asignar y recorrer bloquean con `select_for_update` la fila de `Secuencia` del
+ámbito hasta el final de la transacción, así dos estimaciones creadas al mismo
+tiempo en un contrato no reciben el mismo consecutivo. El número siguiente se
+toma del máximo del ámbito y no sólo de `Secuencia.ultimo` porque la carga
+masiva (poblacion) y la migración de la API insertan contratos y estimaciones
+sin pasar por aquí.
+"""
+from django.db import transaction
+from django.db.models import F, Max
+from .models import Contrato, Estimate, Secuencia
+from .utils import get_contrato_version_key, reset_versions
+
+
+def ambito_folio(company):
+    return {'tipo': Secuencia.CONTRATOS, 'company': company}, \
+        Contrato.objects.filter(contraparte__company=company, depth=1), 'folio'
+
+
+def ambito_folio_subcontrato(contrato):
+    return {'tipo': Secuencia.SUBCONTRATOS, 'contrato': contrato}, contrato.get_children(), 'folio'
+
+
+def ambito_consecutivo(contrato):
+    return {'tipo': Secuencia.ESTIMACIONES, 'contrato': contrato}, Estimate.objects.filter(project=contrato), \
+        'consecutive'
+
+
+def get_ambito(objeto):
+    """(llave de la Secuencia, queryset de los números del ámbito, campo)."""
+    if isinstance(objeto, Estimate):
+        return ambito_consecutivo(objeto.project)
+    if objeto.is_root():
+        return ambito_folio(objeto.contraparte.company)
+    return ambito_folio_subcontrato(objeto.get_parent())
+
+
+def get_ultimo(queryset, campo):
+    return queryset.aggregate(ultimo=Max(campo))['ultimo'] or 0
+
+
+def bloquear(llave, queryset, campo):
+    """Regresa la Secuencia del ámbito bloqueada hasta el final de la
+    transacción; la primera vez se crea con el número mayor existente."""
+    return Secuencia.objects.select_for_update().get_or_create(
+        defaults={'ultimo': lambda: get_ultimo(queryset, campo)}, **llave
+    )[0]
+
+
+def siguiente(llave, queryset, campo):
+    with transaction.atomic():
+        secuencia = bloquear(llave, queryset, campo)
+        secuencia.ultimo = get_ultimo(queryset, campo) + 1
+        secuencia.save(update_fields=['ultimo'])
+    return secuencia.ultimo
+
+
+def siguiente_folio(company):
+    return siguiente(*ambito_folio(company))
+
+
+def siguiente_folio_subcontrato(contrato):
+    return siguiente(*ambito_folio_subcontrato(contrato))
+
+
+def siguiente_consecutivo(contrato):
+    return siguiente(*ambito_consecutivo(contrato))
+
+
+def recorrer(objeto):
+    """Recorre un lugar los números posteriores al de `objeto`, que se va a
+    eliminar, dentro de su ámbito."""
+    llave, queryset, campo = get_ambito(objeto)
+    with transaction.atomic():
+        secuencia = bloquear(llave, queryset, campo)
+        posteriores = queryset.filter(**{'{}__gt'.format(campo): getattr(objeto, campo)})
+        # Los demás contratos raíz tienen su propia versión en el cache.
+        paths = list(posteriores.values_list('path', flat=True)) if llave['tipo'] == Secuencia.CONTRATOS else []
+        posteriores.update(**{campo: F(campo) - 1})
+        secuencia.ultimo = max(secuencia.ultimo - 1, 0)
+        secuencia.save(update_fields=['ultimo'])
+        # Se descartan al confirmar el borrado (ver utils.reset_versions), no antes.
+        reset_versions(*[get_contrato_version_key(path) for path in paths])
@@ -0,0 +1,355 @@
+"""
+Generación de PDFs de estimaciones y generadores del lado del servidor.
+
+El contenido de cada documento se reúne una sola vez en un diccionario
+(`get_pdf_content`). Ese mismo diccionario se usa para calcular el hash del
+contenido y para dibujar el PDF con reportlab, de modo que un PDF guardado
+solo se reutiliza si se generó exactamente con los mismos datos.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from decimal import Decimal
+from io import BytesIO
+from xml.sax.saxutils import escape
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.defaultfilters import date as date_filter, floatformat
+from django.utils import translation
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Image, KeepTogether, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from construbot.core.utils import get_company_path_prefix
+from .models import Estimate, ImageEstimateConcept, Vertices
+from .templatetags.projecttags import intxls, moneda
+
+# Se incrementa cuando cambia el diseño del PDF para no servir archivos viejos.
+PDF_LAYOUT_VERSION = 1
+
+ESTIMACION = 'estimacion'
+GENERADOR = 'generador'
+TIPOS_PDF = (ESTIMACION, GENERADOR)
+
+STORAGE_FOLDER = 'Estimaciones_pdf'
+
+# Segundos durante los que no se vuelve a encolar un PDF que ya se está
+# generando; si el worker falla se encola otra vez cuando expiran.
+PDF_RENDER_TIMEOUT = 10 * 60
+
+
+def get_estimate(estimate_id):
+    return Estimate.objects.select_related(
+        'project__contraparte__company', 'project__sitio', 'supervised_by'
+    ).get(pk=estimate_id)
+
+
+def formato_cantidad(value):
+    with translation.override('en'):
+        return intxls(floatformat(value, 2))
+
+
+def formato_moneda(value):
+    with translation.override('en'):
+        return moneda(floatformat(value, 2))
+
+
+def get_encabezado(estimate):
+    company = estimate.project.contraparte.company
+    with translation.override('es'):
+        periodo = 'Del {} al {}'.format(
+            date_filter(estimate.start_date, 'd/F/Y'), date_filter(estimate.finish_date, 'd/F/Y'))
+        fecha = date_filter(estimate.auth_date, 'd/F/Y') if estimate.auth_date else ''
+    return {
+        'cliente': estimate.project.contraparte.cliente_name,
+        'contrato_name': estimate.project.contrato_name,
+        'contrato_code': estimate.project.code or '',
+        'sitio': estimate.project.sitio.sitio_name,
+        'contratista': company.full_name or company.company_name,
+        'consecutivo': '{:02d}'.format(estimate.consecutive),
+        'fecha': fecha,
+        'periodo': periodo,
+    }
+
+
+def get_firmas(estimate, kind):
+    supervisor = estimate.supervised_by
+    firmas = [{
+        'nombre': '{} {}'.format(supervisor.first_name, supervisor.last_name).strip(),
+        'puesto': supervisor.puesto or 'Supervisor de Obras',
+        'empresa': estimate.project.contraparte.company.full_name or '',
+    }]
+    destinatarios = estimate.auth_by if kind == ESTIMACION else estimate.auth_by_gen
+    for firma in destinatarios.select_related('contraparte').order_by('pk'):
+        firmas.append({
+            'nombre': firma.destinatario_text,
+            'puesto': firma.puesto or '',
+            'empresa': firma.contraparte.cliente_name,
+        })
+    return firmas
+
+
+def get_conceptos_estimacion(estimate, conceptos):
+    rows = []
+    totales = defaultdict(Decimal)
+    for concepto in conceptos:
+        importe_contratado = concepto.importe_contratado()
+        anterior = concepto.anterior or Decimal('0.00')
+        acumulado = concepto.acumulado or Decimal('0.00')
+        estaestimacion = concepto.estaestimacion or Decimal('0.00')
+        rows.append([
+            concepto.code, concepto.concept_text, concepto.unit.unit,
+            formato_cantidad(concepto.total_cuantity), formato_moneda(concepto.unit_price),
+            formato_moneda(importe_contratado),
+            formato_cantidad(concepto.cantidad_estimado_anterior()) if concepto.anterior else '-',
+            formato_moneda(anterior) if concepto.anterior else '-',
+            formato_cantidad(concepto.cantidad_estimado_ala_fecha()), formato_moneda(acumulado),
+            formato_cantidad(concepto.cantidad_esta_estimacion()), formato_moneda(estaestimacion),
+        ])
+        totales['contratado'] += importe_contratado
+        totales['anterior'] += anterior
+        totales['acumulado'] += acumulado
+        totales['estaestimacion'] += estaestimacion
+    totales = {key: formato_moneda(value) for key, value in totales.items()}
+    resumen = []
+    if estimate.mostrar_anticipo:
+        resumen.append(['Amortización de anticipo ({}%)'.format(estimate.project.anticipo),
+                        formato_moneda(estimate.amortizacion_anticipo())])
+        resumen.append(['Subtotal de Estimación:', formato_moneda(estimate.get_subtotal())])
+    if estimate.mostrar_retenciones:
+        for retencion in estimate.get_retenciones():
+            descripcion = retencion['descripcion']
+            if retencion['valor'] != retencion['monto']:
+                descripcion = '{} ({}%)'.format(descripcion, retencion['valor'])
+            resumen.append([descripcion, formato_moneda(retencion['monto'])])
+        resumen.append(['Total de Retenciones:', formato_moneda(estimate.get_total_retenciones())])
+    resumen.append(['TOTAL FINAL:', formato_moneda(estimate.get_total_final())])
+    return {'conceptos': rows, 'totales': totales, 'resumen': resumen}
+
+
+def get_conceptos_generador(conceptos):
+    conceptos = [concepto for concepto in conceptos if concepto.estaestimacion]
+    ids = [concepto.conceptoestimacion for concepto in conceptos]
+    vertices = defaultdict(list)
+    for vertice in Vertices.objects.filter(estimateconcept__in=ids).order_by('pk'):
+        vertices[vertice.estimateconcept_id].append(
+            [vertice.nombre, str(vertice.largo), str(vertice.ancho), str(vertice.alto), str(vertice.piezas)]
+        )
+    imagenes = defaultdict(list)
+    for imagen in ImageEstimateConcept.objects.filter(estimateconcept__in=ids).order_by('pk'):
+        imagenes[imagen.estimateconcept_id].append(imagen.image.name)
+    rows = []
+    for concepto in conceptos:
+        rows.append({
+            'code': concepto.code,
+            'concept_text': concepto.concept_text,
+            'cantidad': formato_cantidad(concepto.cantidad_esta_estimacion()),
+            'unidad': concepto.unit.unit,
+            'observaciones': concepto.observations or '',
+            'vertices': vertices[concepto.conceptoestimacion],
+            'imagenes': imagenes[concepto.conceptoestimacion],
+        })
+    return {'conceptos': rows}
+
+
+def get_pdf_content(estimate, kind):
+    """Reúne en un diccionario serializable todo lo que se imprime en el PDF."""
+    if kind not in TIPOS_PDF:
+        raise ValueError('Tipo de PDF desconocido: {}'.format(kind))
+    conceptos = estimate.anotaciones_conceptos()
+    content = {
+        'version': PDF_LAYOUT_VERSION,
+        'tipo': kind,
+        'encabezado': get_encabezado(estimate),
+        'firmas': get_firmas(estimate, kind),
+    }
+    if kind == ESTIMACION:
+        content.update(get_conceptos_estimacion(estimate, conceptos))
+    else:
+        content.update(get_conceptos_generador(conceptos))
+    return content
+
+
+def get_content_hash(content):
+    serializado = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+def get_pdf_storage_name(estimate, kind, content_hash):
+    prefix = get_company_path_prefix(estimate.project.contraparte.company_id)
+    return '{0}/{1}/{2}-{3}-{4}.pdf'.format(prefix, STORAGE_FOLDER, kind, estimate.pk, content_hash)
+
+
+class EstimatePdfRenderer(object):
+    """Dibuja con reportlab el contenido que regresa `get_pdf_content`."""
+    pagesize = landscape(letter)
+    grid_color = colors.black
+    header_color = colors.HexColor('#e4e4e4')
+
+    def __init__(self, content):
+        self.content = content
+        styles = getSampleStyleSheet()
+        self.texto = styles['BodyText'].clone('texto', fontSize=7, leading=8.5)
+        self.titulo = styles['Heading4'].clone('titulo', alignment=1, spaceAfter=2)
+        self.subtitulo = styles['BodyText'].clone('subtitulo', alignment=1, fontSize=8)
+
+    def parrafo(self, text, style=None, negritas=False):
+        # Paragraph interpreta su texto como markup; el de los usuarios se escapa.
+        markup = escape(str(text)).replace('\n', '<br/>')
+        return Paragraph('<b>{}</b>'.format(markup) if negritas else markup, style or self.texto)
+
+    def encabezado(self, titulo):
+        enc = self.content['encabezado']
+        informacion = Table([
+            ['Contratista:', enc['contratista'], 'Contrato:', enc['contrato_code']],
+            ['Estimación N°:', enc['consecutivo'], 'Fecha:', enc['fecha']],
+            ['Proyecto:', self.parrafo(enc['contrato_name']), 'Período:', enc['periodo']],
+        ], colWidths=[2.5 * cm, 9 * cm, 2 * cm, 9 * cm])
+        informacion.setStyle(TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 7),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        return [
+            self.parrafo(enc['cliente'], self.titulo),
+            self.parrafo(titulo, self.subtitulo),
+            informacion,
+            Spacer(1, 0.3 * cm),
+        ]
+
+    def firmas(self):
+        celdas = []
+        for firma in self.content['firmas']:
+            celdas.append([
+                self.parrafo('\n\n______________________________'),
+                self.parrafo(firma['nombre'], negritas=True),
+                self.parrafo(firma['puesto']),
+                self.parrafo(firma['empresa']),
+            ])
+        if not celdas:
+            return []
+        tabla = Table([celdas], colWidths=[(self.pagesize[0] - 2 * cm) / max(len(celdas), 1)] * len(celdas))
+        tabla.setStyle(TableStyle([('ALIGN', (0, 0), (-1, -1), 'CENTER')]))
+        return [Spacer(1, 0.6 * cm), KeepTogether(tabla)]
+
+    def tabla_estimacion(self):
+        totales = self.content['totales']
+        data = [
+            ['N°', 'CONCEPTOS DE OBRA', 'CONTRATADO', '', '', '', 'ESTIMADO ANTERIOR', '',
+             'ESTIMADO A LA FECHA', '', 'ESTA ESTIMACIÓN', ''],
+            ['', '', 'UNIDAD', 'CANTIDAD', 'P.U.', 'IMPORTE', 'CANTIDAD', 'IMPORTE',
+             'CANTIDAD', 'IMPORTE', 'CANTIDAD', 'IMPORTE'],
+        ]
+        for row in self.content['conceptos']:
+            data.append([row[0], self.parrafo(row[1])] + row[2:])
+        data.append([
+            'Totales Estimación:', '', totales.get('contratado', '-'), '', '', '',
+            totales.get('anterior', '-'), '', totales.get('acumulado', '-'), '',
+            totales.get('estaestimacion', '-'), ''
+        ])
+        total_row = len(data) - 1
+        tabla = Table(
+            data, repeatRows=2,
+            colWidths=[1.2 * cm, 6.5 * cm, 1.4 * cm, 1.6 * cm, 2 * cm, 2.2 * cm,
+                       1.6 * cm, 2.2 * cm, 1.6 * cm, 2.2 * cm, 1.6 * cm, 2.2 * cm]
+        )
+        tabla.setStyle(TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 6.5),
+            ('GRID', (0, 0), (-1, -1), 0.5, self.grid_color),
+            ('SPAN', (0, 0), (0, 1)), ('SPAN', (1, 0), (1, 1)), ('SPAN', (2, 0), (5, 0)),
+            ('SPAN', (6, 0), (7, 0)), ('SPAN', (8, 0), (9, 0)), ('SPAN', (10, 0), (11, 0)),
+            ('BACKGROUND', (0, 0), (-1, 1), self.header_color),
+            ('ALIGN', (0, 0), (-1, 1), 'CENTER'),
+            ('ALIGN', (3, 2), (-1, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('SPAN', (0, total_row), (1, total_row)), ('SPAN', (2, total_row), (5, total_row)),
+            ('SPAN', (6, total_row), (7, total_row)), ('SPAN', (8, total_row), (9, total_row)),
+            ('SPAN', (10, total_row), (11, total_row)),
+            ('FONTNAME', (0, total_row), (-1, total_row), 'Helvetica-Bold'),
+        ]))
+        resumen = Table(self.content['resumen'], colWidths=[7 * cm, 3 * cm], hAlign='RIGHT')
+        resumen.setStyle(TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 7),
+            ('GRID', (0, 0), (-1, -1), 0.5, self.grid_color),
+            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ]))
+        return [tabla, Spacer(1, 0.3 * cm), resumen]
+
+    def imagen(self, name, width):
+        with default_storage.open(name) as archivo:
+            flowable = Image(BytesIO(archivo.read()))
+        escala = min(width / flowable.imageWidth, (5 * cm) / flowable.imageHeight, 1)
+        flowable.drawWidth = flowable.imageWidth * escala
+        flowable.drawHeight = flowable.imageHeight * escala
+        return flowable
+
+    def tabla_generador(self):
+        elementos = []
+        encabezados = [
+            ['CÓDIGO', 'DESCRIPCIÓN', 'VÉRTICES', '', '', '', '', 'VOLUMEN EJECUTADO', '', 'OBSERVACIONES'],
+            ['', '', 'NOMBRE', 'LARGO', 'ANCHO', 'ALTO', 'PIEZAS', 'CANTIDAD', 'UNIDAD', ''],
+        ]
+        anchos = [1.4 * cm, 6.5 * cm, 2.2 * cm, 1.4 * cm, 1.4 * cm, 1.4 * cm, 1.4 * cm, 1.8 * cm, 1.5 * cm, 6.3 * cm]
+        for concepto in self.content['conceptos']:
+            vertices = concepto['vertices'] or [['-', '-', '-', '-', '-']]
+            data = list(encabezados)
+            for number, vertice in enumerate(vertices):
+                if number == 0:
+                    data.append([concepto['code'], self.parrafo(concepto['concept_text'])] + vertice + [
+                        concepto['cantidad'], concepto['unidad'], self.parrafo(concepto['observaciones'])])
+                else:
+                    data.append(['', ''] + vertice + ['', '', ''])
+            ultimo = len(data) - 1
+            tabla = Table(data, colWidths=anchos)
+            tabla.setStyle(TableStyle([
+                ('FONTSIZE', (0, 0), (-1, -1), 6.5),
+                ('GRID', (0, 0), (-1, -1), 0.5, self.grid_color),
+                ('SPAN', (0, 0), (0, 1)), ('SPAN', (1, 0), (1, 1)), ('SPAN', (2, 0), (6, 0)),
+                ('SPAN', (7, 0), (8, 0)), ('SPAN', (9, 0), (9, 1)),
+                ('BACKGROUND', (0, 0), (-1, 1), self.header_color),
+                ('ALIGN', (0, 0), (-1, 1), 'CENTER'),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('SPAN', (0, 2), (0, ultimo)), ('SPAN', (1, 2), (1, ultimo)),
+                ('SPAN', (7, 2), (7, ultimo)), ('SPAN', (8, 2), (8, ultimo)), ('SPAN', (9, 2), (9, ultimo)),
+            ]))
+            bloque = [tabla]
+            if concepto['imagenes']:
+                ancho = (sum(anchos) / len(concepto['imagenes'])) - 0.2 * cm
+                imagenes = Table([[self.imagen(name, ancho) for name in concepto['imagenes']]])
+                imagenes.setStyle(TableStyle([('ALIGN', (0, 0), (-1, -1), 'CENTER')]))
+                bloque.append(imagenes)
+            elementos.append(KeepTogether(bloque))
+            elementos.append(Spacer(1, 0.4 * cm))
+        return elementos
+
+    def render(self):
+        output = BytesIO()
+        document = SimpleDocTemplate(
+            output, pagesize=self.pagesize, leftMargin=1 * cm, rightMargin=1 * cm,
+            topMargin=1 * cm, bottomMargin=1 * cm,
+            title='{} {}'.format(self.content['tipo'].capitalize(), self.content['encabezado']['consecutivo']),
+        )
+        if self.content['tipo'] == ESTIMACION:
+            story = self.encabezado('Estimación de obra') + self.tabla_estimacion()
+        else:
+            story = self.encabezado('Generador de obra para trabajos por P.U.') + self.tabla_generador()
+        document.build(story + self.firmas())
+        return output.getvalue()
+
+
+def get_render_key(name):
+    return 'construbot:pdf-render:{}'.format(name)
+
+
+def get_or_render_pdf(estimate_id, kind):
+    """Regresa el nombre en el storage del PDF de la estimación, generándolo
+    solo si no existe uno con el mismo hash de contenido."""
+    estimate = get_estimate(estimate_id)
+    content = get_pdf_content(estimate, kind)
+    name = get_pdf_storage_name(estimate, kind, get_content_hash(content))
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, ContentFile(EstimatePdfRenderer(content).render()))
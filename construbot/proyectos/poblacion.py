@@ -0,0 +1,314 @@
+"""
+Generación masiva de datos sintéticos para pruebas de rendimiento.
+
+`GeneradorMasivo` llena una compañía con árboles de contratos, conceptos,
+estimaciones, conceptos estimados e imágenes usando `bulk_create` en bloques.
+Las rutas de treebeard (`path`, `depth`, `numchild`) se calculan en memoria,
+así que no se hace una consulta por nodo.
+
+Los datos se generan con una semilla fija: dos corridas con la misma escala
+producen los mismos contratos, importes y cantidades.
+
+Como `bulk_create` no envía señales, las versiones en cache de
+proyectos/utils.py no se invalidan; la compañía generada debe ser nueva.
+"""
+import io
+import math
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+from construbot.core.utils import get_company_path_prefix
+from construbot.users.models import Company, Customer, NivelAcceso
+from . import numeracion
+from .apps import ProyectosConfig
+from .models import Contraparte, Sitio, Destinatario, Units, Contrato, Concept, Estimate, EstimateConcept, \
+    ImageEstimateConcept, Vertices
+
+User = get_user_model()
+
+ESCALAS = {
+    'chica': {
+        'contratos': 40, 'conceptos_por_contrato': 20, 'estimaciones_por_contrato': 4,
+    },
+    'mediana': {
+        'contratos': 1000, 'conceptos_por_contrato': 50, 'estimaciones_por_contrato': 10,
+    },
+    # 10 mil contratos, 500 mil conceptos y 5 millones de conceptos estimados.
+    'grande': {
+        'contratos': 10000, 'conceptos_por_contrato': 50, 'estimaciones_por_contrato': 10,
+    },
+}
+
+
+def crear_tenant(nombre, password='password'):
+    """Crea un customer con una compañía y un usuario Director que la tiene
+    como compañía actual."""
+    director, created = NivelAcceso.objects.get_or_create(nivel=3, defaults={'nombre': 'Director'})
+    grupo, created = Group.objects.get_or_create(name=ProyectosConfig.verbose_name)
+    customer = Customer.objects.create(customer_name=nombre)
+    company = Company.objects.create(customer=customer, company_name=nombre, full_name=nombre.upper())
+    user = User.objects.create_user(
+        username=nombre, email='{}@construbot.mx'.format(nombre), password=password, customer=customer,
+        currently_at=company, nivel_acceso=director, first_name='Usuario',
+        last_name=nombre, is_new=False,
+    )
+    user.company.add(company)
+    user.groups.add(grupo)
+    return company, user
+
+
+def crear_tenants(customers, companias_por_customer, usuarios_por_compania, password='password',
+                  prefijo='tenant'):
+    """Crea en bloque customers, compañías y usuarios. El primer usuario de
+    cada compañía es Director y el resto se reparte entre Auxiliar y
+    Coordinador. Regresa una lista de `(company, [usuarios])`."""
+    niveles = {nivel.nivel: nivel for nivel in NivelAcceso.objects.filter(nivel__lte=3)}
+    if 3 not in niveles:
+        niveles[3] = NivelAcceso.objects.create(nivel=3, nombre='Director')
+    subordinados = [niveles[nivel] for nivel in (1, 2) if nivel in niveles] or [niveles[3]]
+    grupo, created = Group.objects.get_or_create(name=ProyectosConfig.verbose_name)
+    customers = Customer.objects.bulk_create([
+        Customer(customer_name='{}_{}'.format(prefijo, i)) for i in range(customers)
+    ])
+    companias = Company.objects.bulk_create([
+        Company(customer=customer, company_name='{}_{}'.format(customer.customer_name, j),
+                full_name='{}_{}'.format(customer.customer_name, j).upper())
+        for customer in customers for j in range(companias_por_customer)
+    ])
+    # Todos los usuarios comparten el hash: calcularlo por usuario tomaría minutos.
+    password = make_password(password)
+    usuarios = User.objects.bulk_create([
+        User(
+            username='{}_{}'.format(company.company_name, k),
+            email='{}_{}@construbot.mx'.format(company.company_name, k),
+            password=password, customer=company.customer, currently_at=company, first_name='Usuario',
+            last_name=str(k), is_new=False, nivel_acceso=niveles[3] if k == 0 else subordinados[k % len(subordinados)],
+        )
+        for company in companias for k in range(usuarios_por_compania)
+    ], batch_size=GeneradorMasivo.chunk_size)
+    User.company.through.objects.bulk_create([
+        User.company.through(user_id=user.pk, company_id=user.currently_at_id) for user in usuarios
+    ], batch_size=GeneradorMasivo.chunk_size)
+    User.groups.through.objects.bulk_create([
+        User.groups.through(user_id=user.pk, group_id=grupo.pk) for user in usuarios
+    ], batch_size=GeneradorMasivo.chunk_size)
+    por_compania = {}
+    for user in usuarios:
+        por_compania.setdefault(user.currently_at_id, []).append(user)
+    return [(company, por_compania[company.pk]) for company in companias]
+
+
+class GeneradorMasivo(object):
+    """Genera `contratos` contratos en árboles de `hijos` subcontratos por nodo
+    hasta `profundidad` niveles. Cada contrato tiene `conceptos_por_contrato`
+    conceptos y `estimaciones_por_contrato` estimaciones que estiman todos sus
+    conceptos con `vertices` vértices cada uno; `imagenes` es la fracción de
+    conceptos estimados con imagen. Los contratos se asignan a `user` y, por
+    turnos, a cada uno de `usuarios`."""
+    chunk_size = 5000
+    contratos_por_bloque = 100
+
+    def __init__(self, company, user, contratos, conceptos_por_contrato, estimaciones_por_contrato,
+                 hijos=3, profundidad=3, clientes=50, sitios_por_cliente=2, unidades=10, imagenes=0.02,
+                 vertices=0, usuarios=(), semilla=0, reportar=None):
+        self.company = company
+        self.user = user
+        self.usuarios = [usuario for usuario in usuarios if usuario.pk != user.pk]
+        self.total_contratos = contratos
+        self.conceptos_por_contrato = conceptos_por_contrato
+        self.estimaciones_por_contrato = estimaciones_por_contrato
+        self.hijos = hijos
+        self.profundidad = profundidad
+        self.num_clientes = clientes
+        self.sitios_por_cliente = sitios_por_cliente
+        self.num_unidades = unidades
+        self.imagenes = imagenes
+        self.vertices = vertices
+        self.random = random.Random(semilla)
+        self.reportar = reportar or (lambda etapa, hechos, total: None)
+        self.resumen = dict.fromkeys(
+            ('contratos', 'conceptos', 'estimaciones', 'estimate_concepts', 'vertices', 'imagenes'), 0)
+
+    def generar(self):
+        self.crear_catalogos()
+        contratos = self.crear_contratos()
+        for inicio in range(0, len(contratos), self.contratos_por_bloque):
+            with transaction.atomic():
+                self.poblar_contratos(contratos[inicio:inicio + self.contratos_por_bloque])
+            self.reportar('contratos poblados', min(inicio + self.contratos_por_bloque, len(contratos)),
+                          len(contratos))
+        return self.resumen
+
+    def crear_catalogos(self):
+        prefijo = '{}-'.format(self.company.pk)
+        self.clientes = Contraparte.objects.bulk_create([
+            Contraparte(cliente_name='{}cliente-{}'.format(prefijo, i), company=self.company)
+            for i in range(self.num_clientes)
+        ])
+        self.subcontratistas = Contraparte.objects.bulk_create([
+            Contraparte(cliente_name='{}subcontratista-{}'.format(prefijo, i), company=self.company,
+                        tipo='SUBCONTRATISTA')
+            for i in range(self.num_clientes)
+        ])
+        self.sitios = {}
+        sitios = Sitio.objects.bulk_create([
+            Sitio(sitio_name='Sitio {}-{}'.format(i, j), sitio_location='CDMX', cliente=cliente)
+            for i, cliente in enumerate(self.clientes) for j in range(self.sitios_por_cliente)
+        ])
+        for sitio in sitios:
+            self.sitios.setdefault(sitio.cliente_id, []).append(sitio)
+        self.destinatarios = {
+            destinatario.contraparte_id: destinatario
+            for destinatario in Destinatario.objects.bulk_create([
+                Destinatario(destinatario_text='Residente {}'.format(contraparte.cliente_name),
+                             puesto='Residente', contraparte=contraparte)
+                for contraparte in self.clientes + self.subcontratistas
+            ])
+        }
+        self.unidades = Units.objects.bulk_create([
+            Units(unit='unidad-{}'.format(i), company=self.company) for i in range(self.num_unidades)
+        ])
+        self.imagen = self.guardar_imagen() if self.imagenes else None
+
+    def guardar_imagen(self):
+        contenido = io.BytesIO()
+        Image.new('RGB', (64, 48), (200, 120, 40)).save(contenido, 'PNG')
+        nombre = '{}/{}/generador.png'.format(
+            get_company_path_prefix(self.company.pk), ImageEstimateConcept._meta.verbose_name_plural)
+        return default_storage.save(nombre, ContentFile(contenido.getvalue()))
+
+    def nodos_por_arbol(self):
+        return sum(self.hijos ** nivel for nivel in range(self.profundidad))
+
+    def crear_contratos(self):
+        """Construye los árboles en orden de ruta y los inserta en bloques.
+        Los folios siguen los ámbitos de construbot.proyectos.numeracion: los
+        contratos raíz continúan la numeración de la compañía y los
+        subcontratos de cada contrato empiezan en 1. `numero` sólo distingue a
+        los contratos generados en sus nombres y fechas."""
+        raices = math.ceil(self.total_contratos / self.nodos_por_arbol())
+        posicion = Contrato.get_siguiente_posicion_raiz()
+        folio = numeracion.get_ultimo(*numeracion.ambito_folio(self.company)[1:]) + 1
+        nodos = []
+        for i in range(raices):
+            cliente = self.clientes[i % len(self.clientes)]
+            raiz = self.nuevo_contrato(
+                Contrato._get_path(None, 1, posicion + i), 1, cliente, cliente, folio + i, len(nodos) + 1)
+            nodos.append(raiz)
+            pendientes = [raiz]
+            while pendientes and len(nodos) < self.total_contratos:
+                padre = pendientes.pop(0)
+                if padre.depth == self.profundidad:
+                    continue
+                for j in range(self.hijos):
+                    if len(nodos) == self.total_contratos:
+                        break
+                    hijo = self.nuevo_contrato(
+                        Contrato._get_path(padre.path, padre.depth + 1, j + 1), padre.depth + 1,
+                        self.subcontratistas[(i + j) % len(self.subcontratistas)], cliente, j + 1, len(nodos) + 1,
+                        monto=padre.monto / (self.hijos + 1)
+                    )
+                    padre.numchild += 1
+                    nodos.append(hijo)
+                    pendientes.append(hijo)
+            if len(nodos) == self.total_contratos:
+                break
+        contratos = Contrato.objects.bulk_create(nodos, batch_size=self.chunk_size)
+        asignaciones = [
+            Contrato.users.through(contrato_id=contrato.pk, user_id=self.user.pk) for contrato in contratos
+        ]
+        if self.usuarios:
+            asignaciones += [
+                Contrato.users.through(contrato_id=contrato.pk, user_id=self.usuarios[i % len(self.usuarios)].pk)
+                for i, contrato in enumerate(contratos)
+            ]
+        Contrato.users.through.objects.bulk_create(asignaciones, batch_size=self.chunk_size)
+        self.resumen['contratos'] = len(contratos)
+        self.reportar('contratos', len(contratos), len(contratos))
+        return contratos
+
+    def nuevo_contrato(self, path, depth, contraparte, cliente, folio, numero, monto=None):
+        monto = monto or Decimal(self.random.randrange(1000000, 50000000)) / 100
+        return Contrato(
+            path=path, depth=depth, numchild=0, folio=folio, code='CON-{}'.format(numero),
+            fecha=date(2015, 1, 1) + timedelta(days=numero % 3000), contrato_name='Contrato número {}'.format(numero),
+            contrato_shortName='Contrato {}'.format(numero), contraparte=contraparte,
+            sitio=self.sitios[cliente.pk][numero % self.sitios_por_cliente], status=True,
+            monto=Decimal(monto).quantize(Decimal('0.01')), anticipo=Decimal('10.00') if depth == 1 else 0,
+        )
+
+    def poblar_contratos(self, contratos):
+        conceptos = Concept.objects.bulk_create([
+            Concept(
+                code=str(j + 1), concept_text='Concepto {} del contrato {}'.format(j + 1, contrato.folio),
+                project=contrato, unit=self.unidades[j % len(self.unidades)],
+                total_cuantity=Decimal(self.random.randrange(100, 10000)),
+                unit_price=Decimal(self.random.randrange(1000, 500000)) / 100,
+            )
+            for contrato in contratos for j in range(self.conceptos_por_contrato)
+        ], batch_size=self.chunk_size)
+        self.resumen['conceptos'] += len(conceptos)
+        estimaciones = Estimate.objects.bulk_create([
+            self.nueva_estimacion(contrato, consecutivo)
+            for contrato in contratos for consecutivo in range(1, self.estimaciones_por_contrato + 1)
+        ], batch_size=self.chunk_size)
+        self.resumen['estimaciones'] += len(estimaciones)
+        Estimate.auth_by.through.objects.bulk_create([
+            Estimate.auth_by.through(estimate_id=estimate.pk,
+                                     destinatario_id=self.destinatarios[estimate.project.contraparte_id].pk)
+            for estimate in estimaciones
+        ], batch_size=self.chunk_size)
+        por_contrato = {}
+        for concepto in conceptos:
+            por_contrato.setdefault(concepto.project_id, []).append(concepto)
+        lineas = []
+        for estimate in estimaciones:
+            for concepto in por_contrato[estimate.project_id]:
+                lineas.append(EstimateConcept(
+                    estimate=estimate, concept=concepto,
+                    cuantity_estimated=(concepto.total_cuantity / self.estimaciones_por_contrato).quantize(
+                        Decimal('0.01')),
+                ))
+                if len(lineas) == self.chunk_size:
+                    self.crear_lineas(lineas)
+                    lineas = []
+        self.crear_lineas(lineas)
+
+    def nueva_estimacion(self, contrato, consecutivo):
+        inicio = contrato.fecha + timedelta(days=15 * (consecutivo - 1))
+        pendientes = self.estimaciones_por_contrato - consecutivo
+        return Estimate(
+            project=contrato, consecutive=consecutivo, draft_by=self.user, supervised_by=self.user,
+            start_date=inicio, finish_date=inicio + timedelta(days=14), auth_date=inicio + timedelta(days=16),
+            invoiced=pendientes > 0, paid=pendientes > 1,
+            payment_date=inicio + timedelta(days=45) if pendientes > 1 else None,
+            mostrar_anticipo=contrato.depth == 1,
+        )
+
+    def crear_lineas(self, lineas):
+        if not lineas:
+            return
+        lineas = EstimateConcept.objects.bulk_create(lineas)
+        self.resumen['estimate_concepts'] += len(lineas)
+        if self.vertices:
+            vertices = Vertices.objects.bulk_create([
+                Vertices(
+                    nombre='Eje {}'.format(k + 1), estimateconcept=linea, ancho=1, alto=1, piezas=1,
+                    largo=(linea.cuantity_estimated / self.vertices).quantize(Decimal('0.01')),
+                )
+                for linea in lineas for k in range(self.vertices)
+            ], batch_size=self.chunk_size)
+            self.resumen['vertices'] += len(vertices)
+        if self.imagen:
+            imagenes = ImageEstimateConcept.objects.bulk_create([
+                ImageEstimateConcept(image=self.imagen, estimateconcept=linea, size=1)
+                for linea in lineas if self.random.random() < self.imagenes
+            ])
+            self.resumen['imagenes'] += len(imagenes)
@@ -1,8 +1,136 @@
-from django.db.models.signals import post_delete
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from construbot.proyectos.models import ImageEstimateConcept
+from construbot.core.utils import delete_company_path_prefix
+from construbot.proyectos.models import Concept, ImageEstimateConcept, Units, Contraparte, Sitio, Destinatario, \
+    Contrato, Retenciones, Estimate, EstimateConcept, Vertices, BloqueoImagen
+from construbot.proyectos.utils import reset_catalogo_version, reset_unidades_version, reset_contrato_version, \
+    reset_company_version
+from construbot.users.models import Company, Customer, User
 
 
 @receiver(post_delete, sender=ImageEstimateConcept)
 def delete_generator_images(sender, instance, using, **kwargs):
-    instance.image.delete(save=False)
+    # Varias filas pueden compartir el archivo (ver ImageEstimateConcept); se borra con la última que lo
+    # usa. Se revisa después del commit y con la fila de BloqueoImagen bloqueada: un insert que reutiliza
+    # el archivo la tiene bloqueada hasta su commit, y después de éste ya se ve en la consulta.
+    name = instance.image.name
+    ruta = instance.get_ruta_bloqueo()
+
+    def borrar():
+        with transaction.atomic(using=using):
+            bloqueo = ruta and BloqueoImagen.bloquear(ruta, using=using)
+            if not ImageEstimateConcept.objects.using(using).filter(image=name).exists():
+                instance.image.storage.delete(name)
+                if bloqueo:
+                    bloqueo.delete()
+    if name:
+        transaction.on_commit(borrar, using=using)
+
+
+@receiver(post_save, sender=Company)
+def reset_company_path_prefix(sender, instance, **kwargs):
+    delete_company_path_prefix(instance.pk)
+    reset_company_version(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def reset_user_companies_version(sender, instance, created, update_fields=None, **kwargs):
+    # Los nombres y puestos de los usuarios aparecen en las firmas de las estimaciones.
+    if created or (update_fields and not set(update_fields) & {'first_name', 'last_name', 'name', 'puesto'}):
+        return
+    reset_company_version(*instance.company.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Customer)
+def reset_customer_path_prefixes(sender, instance, created, **kwargs):
+    if created:
+        return
+    delete_company_path_prefix(*instance.company_set.values_list('pk', flat=True))
+
+
+def es_cascada(instance, origin):
+    """Indica si `instance` se borró por el borrado de otro modelo. En ese caso
+    el borrado que lo originó ya cambia las versiones y se evita consultar la
+    relación de cada fila borrada."""
+    if origin is None:
+        return False
+    modelo = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return modelo is not type(instance)
+
+
+@receiver(post_save, sender=Concept)
+@receiver(post_delete, sender=Concept)
+def reset_concept_catalog_version(sender, instance, **kwargs):
+    reset_catalogo_version(instance.project_id)
+    if not es_cascada(instance, kwargs.get('origin')):
+        reset_contrato_version(instance.project.path)
+
+
+@receiver(post_save, sender=Units)
+@receiver(post_delete, sender=Units)
+def reset_company_units_version(sender, instance, **kwargs):
+    reset_unidades_version(instance.company_id)
+    reset_company_version(instance.company_id)
+
+
+@receiver(post_save, sender=Contraparte)
+@receiver(post_delete, sender=Contraparte)
+def reset_contraparte_company_version(sender, instance, **kwargs):
+    reset_company_version(instance.company_id)
+
+
+@receiver(post_save, sender=Sitio)
+@receiver(post_delete, sender=Sitio)
+@receiver(post_save, sender=Destinatario)
+@receiver(post_delete, sender=Destinatario)
+def reset_cliente_company_version(sender, instance, **kwargs):
+    if not es_cascada(instance, kwargs.get('origin')):
+        contraparte = instance.cliente if sender is Sitio else instance.contraparte
+        reset_company_version(contraparte.company_id)
+
+
+@receiver(post_save, sender=Contrato)
+@receiver(post_delete, sender=Contrato)
+def reset_contrato_versions(sender, instance, **kwargs):
+    if not es_cascada(instance, kwargs.get('origin')):
+        reset_contrato_version(instance.path, instance.contraparte.company_id)
+
+
+@receiver(m2m_changed, sender=Contrato.users.through)
+def reset_contrato_asignaciones_version(sender, instance, **kwargs):
+    if kwargs['action'].startswith('post_') and isinstance(instance, Contrato):
+        reset_contrato_version(instance.path, instance.contraparte.company_id)
+
+
+@receiver(post_save, sender=Retenciones)
+@receiver(post_delete, sender=Retenciones)
+@receiver(post_save, sender=Estimate)
+@receiver(post_delete, sender=Estimate)
+def reset_project_version(sender, instance, **kwargs):
+    if not es_cascada(instance, kwargs.get('origin')):
+        reset_contrato_version(instance.project.path)
+
+
+@receiver(m2m_changed, sender=Estimate.auth_by.through)
+@receiver(m2m_changed, sender=Estimate.auth_by_gen.through)
+def reset_estimate_destinatarios_version(sender, instance, **kwargs):
+    if kwargs['action'].startswith('post_') and isinstance(instance, Estimate):
+        reset_contrato_version(instance.project.path)
+
+
+@receiver(post_save, sender=EstimateConcept)
+@receiver(post_delete, sender=EstimateConcept)
+def reset_estimate_concept_version(sender, instance, **kwargs):
+    if not es_cascada(instance, kwargs.get('origin')):
+        reset_contrato_version(instance.estimate.project.path)
+
+
+@receiver(post_save, sender=ImageEstimateConcept)
+@receiver(post_delete, sender=ImageEstimateConcept)
+@receiver(post_save, sender=Vertices)
+@receiver(post_delete, sender=Vertices)
+def reset_generator_version(sender, instance, **kwargs):
+    if not es_cascada(instance, kwargs.get('origin')):
+        reset_contrato_version(instance.estimateconcept.estimate.project.path)
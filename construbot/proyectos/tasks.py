@@ -0,0 +1,20 @@
+from celery import chord, shared_task
+from . import exportacion, pdf
+
+
+@shared_task
+def generate_estimate_pdf(estimate_id, kind):
+    return pdf.get_or_render_pdf(estimate_id, kind)
+
+
+@shared_task
+def empaquetar_exportacion(pdfs, nombre, estimate_ids):
+    return exportacion.empaquetar(nombre, pdfs, estimate_ids)
+
+
+def exportar_estimaciones(nombre, estimate_ids):
+    """Reparte la generación de los PDFs entre los workers y, cuando todos
+    terminan, los empaqueta en `nombre`."""
+    encabezado = [generate_estimate_pdf.s(estimate_id, kind)
+                  for estimate_id, kind in exportacion.get_pdfs_por_generar(estimate_ids)]
+    return chord(encabezado)(empaquetar_exportacion.s(nombre, estimate_ids))
@@ -1,8 +1,12 @@
+import io
 from unittest import mock
+from django.core.management import call_command
 from django.test import tag
 from django.test.utils import override_settings
 from construbot.users.tests import utils
 from construbot.proyectos.management.commands import poblar
+from construbot.proyectos.models import Contrato, Vertices
+from construbot.users.models import Company
 
 
 class BaseCommandTest(utils.BaseTestCase):
@@ -119,3 +123,22 @@ class PoblarCommandTesting(BaseCommandTest):
         sitios.assert_called_once_with(200)
         contratos.assert_called_once_with(1500)
         concepts.assert_called_once_with(5000)
+
+
+class PoblarBulkCommandTesting(BaseCommandTest):
+
+    @override_settings(DEBUG=False)
+    @mock.patch('construbot.proyectos.management.commands.poblar.call_command')
+    def test_bulk_adds_tenants_without_flush(self, mock_call_command):
+        existente = Company.objects.count()
+        salida = io.StringIO()
+        call_command(
+            'poblar', '--bulk', '--customers=1', '--companias=2', '--usuarios=2', '--contratos=5', '--conceptos=2',
+            '--estimaciones=1', '--vertices=1', stdout=salida
+        )
+        mock_call_command.assert_not_called()
+        self.assertEqual(Company.objects.count(), existente + 2)
+        self.assertEqual(Contrato.objects.filter(contraparte__company__company_name__startswith='poblar').count(), 10)
+        self.assertEqual(Vertices.objects.count(), 20)
+        self.assertEqual(Contrato.find_problems(), ([], [], [], [], []))
+        self.assertIn('- 10 Contratos', salida.getvalue())
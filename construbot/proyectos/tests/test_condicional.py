@@ -0,0 +1,182 @@
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from construbot.users.tests import utils
+from construbot.proyectos import utils as utils_proyectos, views
+from . import factories
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class SinCacheTest(utils.BaseTestCase):
+
+    def test_versions_fall_back_to_current_time(self):
+        with mock.patch('construbot.proyectos.utils.time.time', side_effect=[100.0, 200.0, 300.0, 400.0, 500.0]):
+            etag, last_modified = utils_proyectos.versiones_etag(['llave'])
+            self.assertEqual(last_modified, 100)
+            self.assertNotEqual(utils_proyectos.catalogo_etag(1, 1), utils_proyectos.catalogo_etag(1, 1))
+
+
+class VersionesTestCase(utils.BaseTestCase):
+
+    def setUp(self):
+        super(VersionesTestCase, self).setUp()
+        cache.clear()
+        self.company = factories.CompanyFactory(customer=self.user.customer)
+        self.user.nivel_acceso = self.director_permission
+        self.user.company.add(self.company)
+        self.user.currently_at = self.company
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+        self.contrato = factories.ContratoFactory(contraparte__company=self.company)
+        self.estimate = factories.EstimateFactory(
+            project=self.contrato, draft_by=self.user, supervised_by=self.user, consecutive=1)
+
+    def get_view(self, view, headers=None, **kwargs):
+        request = self.factory.get('/', headers=headers)
+        request.user = self.user
+        return view.as_view()(request, **kwargs)
+
+    def revalidar(self, view, response, **kwargs):
+        return self.get_view(view, headers={'If-None-Match': response['ETag']}, **kwargs)
+
+
+class ConditionalGetTest(VersionesTestCase):
+
+    def test_contrato_detail_not_modified_skips_rendering(self):
+        response = self.get_view(views.ContratoDetailView, pk=self.contrato.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as context:
+            segunda = self.revalidar(views.ContratoDetailView, response, pk=self.contrato.pk)
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda['ETag'], response['ETag'])
+        self.assertLessEqual(len(context), 6)
+
+    def test_if_modified_since(self):
+        response = self.get_view(views.ContratoDetailView, pk=self.contrato.pk)
+        segunda = self.get_view(
+            views.ContratoDetailView, headers={'If-Modified-Since': response['Last-Modified']}, pk=self.contrato.pk)
+        self.assertEqual(segunda.status_code, 304)
+
+    def test_estimate_changes_invalidate_contrato_and_estimate(self):
+        contrato = self.get_view(views.ContratoDetailView, pk=self.contrato.pk)
+        estimate = self.get_view(views.EstimateDetailView, pk=self.estimate.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            factories.EstimateConceptFactory(
+                estimate=self.estimate, concept=factories.ConceptoFactory(project=self.contrato))
+        self.assertEqual(self.revalidar(views.ContratoDetailView, contrato, pk=self.contrato.pk).status_code, 200)
+        self.assertEqual(self.revalidar(views.EstimateDetailView, estimate, pk=self.estimate.pk).status_code, 200)
+
+    def test_versions_survive_until_commit(self):
+        response = self.get_view(views.ContratoDetailView, pk=self.contrato.pk)
+        llave = utils_proyectos.get_contrato_version_key(self.contrato.path)
+        version = cache.get(llave)
+        with self.captureOnCommitCallbacks(execute=True):
+            factories.EstimateConceptFactory(
+                estimate=self.estimate, concept=factories.ConceptoFactory(project=self.contrato))
+            # Una consulta concurrente no debe tomar una versión nueva con los datos sin confirmar.
+            self.assertEqual(cache.get(llave), version)
+            self.assertEqual(self.revalidar(views.ContratoDetailView, response, pk=self.contrato.pk).status_code, 304)
+        self.assertIsNone(cache.get(llave))
+        self.assertEqual(self.revalidar(views.ContratoDetailView, response, pk=self.contrato.pk).status_code, 200)
+
+    def test_subcontract_estimate_invalidates_parent(self):
+        subcontrato = factories.SubContratoFactory(
+            parent=self.contrato, contraparte__company=self.company)
+        response = self.get_view(views.ContratoDetailView, pk=self.contrato.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            factories.EstimateFactory(project=subcontrato, draft_by=self.user, supervised_by=self.user)
+        self.assertEqual(self.revalidar(views.ContratoDetailView, response, pk=self.contrato.pk).status_code, 200)
+
+    def test_other_contract_changes_keep_estimate_cached(self):
+        otro = factories.ContratoFactory(contraparte=self.contrato.contraparte)
+        response = self.get_view(views.EstimateDetailView, pk=self.estimate.pk)
+        factories.ConceptoFactory(project=otro)
+        self.assertEqual(self.revalidar(views.EstimateDetailView, response, pk=self.estimate.pk).status_code, 304)
+
+    def test_list_invalidated_by_company_changes(self):
+        response = self.get_view(views.ClienteListView)
+        self.assertEqual(self.revalidar(views.ClienteListView, response).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            factories.ClienteFactory(company=self.company)
+        self.assertEqual(self.revalidar(views.ClienteListView, response).status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        response = self.get_view(views.ContratoDetailView, pk=self.contrato.pk)
+        self.user.nivel_acceso = self.corporativo_permission
+        self.user.save()
+        self.assertEqual(self.revalidar(views.ContratoDetailView, response, pk=self.contrato.pk).status_code, 200)
+
+    def test_cascade_delete_queries_do_not_depend_on_concepts(self):
+        queries = []
+        for cantidad in (1, 5):
+            estimate = factories.EstimateFactory(project=self.contrato, draft_by=self.user, supervised_by=self.user)
+            for i in range(cantidad):
+                factories.EstimateConceptFactory(
+                    estimate=estimate, concept=factories.ConceptoFactory(project=self.contrato))
+            estimate = type(estimate).objects.get(pk=estimate.pk)
+            with CaptureQueriesContext(connection) as context:
+                estimate.delete()
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+
+
+class PrintFragmentCacheTest(VersionesTestCase):
+
+    def render(self, view):
+        response = self.get_view(view, pk=self.estimate.pk)
+        return response.render().content.decode('utf-8')
+
+    def agregar_conceptos(self, cantidad):
+        for i in range(cantidad):
+            factories.EstimateConceptFactory(
+                estimate=self.estimate, concept=factories.ConceptoFactory(project=self.contrato))
+
+    def test_cached_render_queries_do_not_depend_on_concepts(self):
+        queries = []
+        for cantidad in (1, 10):
+            self.agregar_conceptos(cantidad)
+            for view in (views.EstimatePdfPrint, views.GeneratorPdfPrint):
+                primera = self.render(view)
+                with CaptureQueriesContext(connection) as context:
+                    self.assertEqual(self.render(view), primera)
+                queries.append(len(context))
+        self.assertEqual(queries[:2], queries[2:])
+
+    def test_edits_refresh_fragments(self):
+        self.agregar_conceptos(1)
+        self.render(views.EstimatePdfPrint)
+        with self.captureOnCommitCallbacks(execute=True):
+            concepto = factories.ConceptoFactory(project=self.contrato, concept_text='Concepto nuevo')
+            factories.EstimateConceptFactory(estimate=self.estimate, concept=concepto)
+        self.assertIn('Concepto nuevo', self.render(views.EstimatePdfPrint))
+
+    def test_supervisor_name_change_refreshes_signatures(self):
+        self.render(views.EstimatePdfPrint)
+        self.user.first_name = 'Renombrado'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertIn('Renombrado', self.render(views.EstimatePdfPrint))
+
+    def test_fragments_rendered_before_commit_keep_the_old_version(self):
+        self.render(views.EstimatePdfPrint)
+        self.user.first_name = 'Renombrado'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+            # Lo que se arma antes del commit no se guarda con la versión nueva.
+            self.assertNotIn('Renombrado', self.render(views.EstimatePdfPrint))
+        self.assertIn('Renombrado', self.render(views.EstimatePdfPrint))
+
+    def test_invoiced_estimates_keep_fragments_longer(self):
+        self.estimate.invoiced = True
+        self.estimate.save()
+        response = self.get_view(views.EstimatePdfPrint, pk=self.estimate.pk)
+        self.assertEqual(
+            response.context_data['fragment_timeout'], views.PrintFragmentCacheMixin.fragment_timeout_facturada)
+
+    def test_fragments_from_replica_are_not_stored(self):
+        with mock.patch('construbot.proyectos.views.en_replica', return_value=True):
+            response = self.get_view(views.EstimatePdfPrint, pk=self.estimate.pk)
+        self.assertEqual(response.context_data['fragment_timeout'], 0)
@@ -0,0 +1,165 @@
+import shutil
+import tempfile
+from django.test import override_settings
+from django.urls import reverse
+from construbot.users.tests import utils
+from construbot.proyectos.models import Contrato, Contraparte, Estimate
+from construbot.proyectos.poblacion import GeneradorMasivo, crear_tenant
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def poblar(self, tamano):
+    """Un contrato con `tamano` subcontratos; cada contrato con `tamano + 1`
+    conceptos y estimaciones, y cada concepto estimado con `tamano` vértices y
+    una imagen."""
+    company, user = crear_tenant('consultas_{}'.format(tamano))
+    GeneradorMasivo(
+        company, user, contratos=tamano + 1, conceptos_por_contrato=tamano + 1,
+        estimaciones_por_contrato=tamano + 1, hijos=tamano, profundidad=2, clientes=tamano + 1,
+        unidades=tamano + 1, vertices=tamano, imagenes=1,
+    ).generar()
+    self.client.force_login(user)
+    contrato = Contrato.objects.get(contraparte__company=company, depth=1)
+    return {
+        'contrato': contrato,
+        'subcontrato': contrato.get_children().first(),
+        'estimate': Estimate.objects.filter(project=contrato).order_by('-consecutive').first(),
+        'cliente': contrato.contraparte,
+        'sitio': contrato.sitio,
+        'destinatario': contrato.contraparte.destinatario_set.first(),
+    }
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ProyectosQueryCountTest(utils.ConsultasConstantesMixin, utils.BaseTestCase):
+    """Las consultas de cada vista no dependen de cuántos contratos,
+    conceptos, estimaciones, vértices e imágenes tenga la compañía."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super(ProyectosQueryCountTest, cls).tearDownClass()
+
+    def get(self, nombre, datos=None, objeto=None, **kwargs):
+        if objeto:
+            kwargs['pk'] = datos[objeto].pk
+        response = self.client.get(reverse('proyectos:{}'.format(nombre), kwargs=kwargs))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    @utils.consultas_constantes(poblar)
+    def test_dashboard(self, datos):
+        return self.get('proyect_dashboard')
+
+    @utils.consultas_constantes(poblar)
+    def test_listado_de_contratos(self, datos):
+        return self.get('listado_de_contratos')
+
+    @utils.consultas_constantes(poblar)
+    def test_listado_de_clientes(self, datos):
+        return self.get('listado_de_clientes')
+
+    @utils.consultas_constantes(poblar)
+    def test_listado_de_sitios(self, datos):
+        return self.get('listado_de_sitios')
+
+    @utils.consultas_constantes(poblar)
+    def test_listado_de_destinatarios(self, datos):
+        return self.get('listado_de_destinatarios')
+
+    @utils.consultas_constantes(poblar)
+    def test_contrato_detail(self, datos):
+        return self.get('contrato_detail', datos, 'contrato')
+
+    @utils.consultas_constantes(poblar)
+    def test_subcontrato_detail(self, datos):
+        return self.get('contrato_detail', datos, 'subcontrato')
+
+    @utils.consultas_constantes(poblar)
+    def test_cliente_detail(self, datos):
+        return self.get('cliente_detail', datos, 'cliente')
+
+    @utils.consultas_constantes(poblar)
+    def test_sitio_detail(self, datos):
+        return self.get('sitio_detail', datos, 'sitio')
+
+    @utils.consultas_constantes(poblar)
+    def test_destinatario_detail(self, datos):
+        return self.get('destinatario_detail', datos, 'destinatario')
+
+    @utils.consultas_constantes(poblar)
+    def test_estimate_detail(self, datos):
+        return self.get('estimate_detail', datos, 'estimate')
+
+    @utils.consultas_constantes(poblar)
+    def test_reporte_subcontratistas(self, datos):
+        return self.get('reporte-subcontratistas', datos, 'estimate')
+
+    @utils.consultas_constantes(poblar)
+    def test_estimate_pdf(self, datos):
+        return self.get('estimate_detailpdf', datos, 'estimate')
+
+    @utils.consultas_constantes(poblar)
+    def test_generator_pdf(self, datos):
+        return self.get('generator_detailpdf', datos, 'estimate')
+
+    @utils.consultas_constantes(poblar)
+    def test_estimate_exportar(self, datos):
+        return self.get('estimate_exportar', datos, 'estimate', formato='xlsx')
+
+    @utils.consultas_constantes(poblar)
+    def test_catalogo_conceptos_listado(self, datos):
+        return self.get('catalogo_conceptos_listado', datos, 'contrato')
+
+    @utils.consultas_constantes(poblar)
+    def test_catalogo_conceptos_exportar(self, datos):
+        return self.get('catalogo_conceptos_exportar', datos, 'contrato', formato='csv')
+
+    @utils.consultas_constantes(poblar)
+    def test_catalogo_conceptos(self, datos):
+        return self.get('catalogo_conceptos', datos, 'contrato')
+
+    @utils.consultas_constantes(poblar)
+    def test_catalogo_retenciones(self, datos):
+        return self.get('catalogo_retenciones', datos, 'contrato')
+
+    @utils.consultas_constantes(poblar)
+    def test_catalogo_de_unidades(self, datos):
+        return self.get('catalogo_de_unidades')
+
+    @utils.consultas_constantes(poblar)
+    def test_nuevo_subcontrato(self, datos):
+        return self.get('nuevo_subcontrato', datos, 'contrato')
+
+    @utils.consultas_constantes(poblar)
+    def test_nueva_estimacion(self, datos):
+        return self.get('nueva_estimacion', datos, 'contrato')
+
+    @utils.consultas_constantes(poblar)
+    def test_editar_contrato(self, datos):
+        return self.get('editar_contrato', datos, 'contrato')
+
+    @utils.consultas_constantes(poblar)
+    def test_editar_estimacion(self, datos):
+        return self.get('editar_estimacion', datos, 'estimate')
+
+    @utils.consultas_constantes(poblar)
+    def test_editar_cliente(self, datos):
+        return self.get('editar_cliente', datos, 'cliente')
+
+    @utils.consultas_constantes(poblar)
+    def test_eliminar_contrato(self, datos):
+        return self.get('eliminar', datos, 'subcontrato', model='Contrato')
+
+    @utils.consultas_constantes(poblar)
+    def test_eliminar_cliente(self, datos):
+        return self.get('eliminar', datos, 'cliente', model=Contraparte.__name__)
+
+    def test_generador_shows_prefetched_vertices_and_images(self):
+        datos = poblar(self, 2)
+        response = self.get('estimate_detail', datos, 'estimate')
+        # Tres conceptos estimados, cada uno con dos vértices y una imagen.
+        self.assertContains(response, '<td> Eje 2 </td>', count=3)
+        self.assertContains(response, 'class="estimateImage', count=3)
+        self.assertEqual(list(response.context['firmas_generador']), [])
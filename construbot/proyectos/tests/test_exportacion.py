@@ -0,0 +1,188 @@
+import csv
+import datetime
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from openpyxl import load_workbook
+from construbot.users.tests import utils
+from construbot.proyectos import exportacion, tasks, views
+from construbot.proyectos.models import Estimate
+from . import factories
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class EstimateExportTest(utils.BaseTestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super(EstimateExportTest, cls).tearDownClass()
+
+    def setUp(self):
+        super(EstimateExportTest, self).setUp()
+        cache.clear()
+        self.company = factories.CompanyFactory(customer=self.user.customer)
+        self.contrato = factories.ContratoFactory(contraparte__company=self.company)
+        self.unit = factories.UnitFactory(company=self.company)
+
+    def crear_estimacion(self, consecutive, finish_date, conceptos=1):
+        estimate = factories.EstimateFactory(
+            project=self.contrato, draft_by=self.user, supervised_by=self.user,
+            consecutive=consecutive, finish_date=finish_date
+        )
+        for i in range(conceptos):
+            concepto = factories.ConceptoFactory(project=self.contrato, unit=self.unit)
+            factories.EstimateConceptFactory(estimate=estimate, concept=concepto)
+        return estimate
+
+    def test_exportacion_queryset_filters_contract_company_and_period(self):
+        dentro = self.crear_estimacion(1, datetime.date(2020, 2, 10))
+        self.crear_estimacion(2, datetime.date(2020, 5, 10))
+        factories.EstimateFactory(
+            project__contraparte__company=self.company, draft_by=self.user, supervised_by=self.user,
+            finish_date=datetime.date(2020, 2, 10)
+        )
+        otra_company = factories.CompanyFactory(customer=self.user.customer)
+        queryset = Estimate.especial.exportacion(
+            self.company, self.contrato, datetime.date(2020, 1, 1), datetime.date(2020, 3, 1))
+        self.assertEqual(list(queryset), [dentro])
+        queryset = Estimate.especial.exportacion(
+            otra_company, self.contrato, datetime.date(2020, 1, 1), datetime.date(2020, 3, 1))
+        self.assertFalse(queryset.exists())
+
+    def test_consolidado_queries_do_not_depend_on_concept_count(self):
+        pocos = self.crear_estimacion(1, datetime.date(2020, 2, 10), conceptos=1)
+        muchos = self.crear_estimacion(2, datetime.date(2020, 2, 20), conceptos=5)
+        queries = []
+        for ids in ([pocos.pk], [muchos.pk], [pocos.pk, muchos.pk]):
+            with CaptureQueriesContext(connection) as context:
+                exportacion.escribir_consolidado(exportacion.get_estimaciones(ids), io.BytesIO())
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+        # La consulta de estimaciones y sus retenciones se hacen una sola vez.
+        self.assertEqual(queries[2] - 2, 2 * (queries[0] - 2))
+
+    def test_exportar_estimaciones_stores_zip_with_pdfs_and_consolidado(self):
+        primera = self.crear_estimacion(1, datetime.date(2020, 2, 10), conceptos=2)
+        segunda = self.crear_estimacion(2, datetime.date(2020, 2, 20), conceptos=3)
+        nombre = exportacion.get_export_storage_name(self.company.pk, exportacion.nuevo_identificador())
+        result = tasks.exportar_estimaciones(nombre, [primera.pk, segunda.pk])
+        self.assertEqual(result.get(), nombre)
+        with zipfile.ZipFile(exportacion.default_storage.open(nombre)) as zf:
+            self.assertEqual(sorted(zf.namelist()), [
+                'consolidado.xlsx', 'estimacion-01.pdf', 'estimacion-02.pdf', 'generador-01.pdf', 'generador-02.pdf'
+            ])
+            self.assertEqual(zf.read('estimacion-02.pdf')[:4], b'%PDF')
+            wb = load_workbook(io.BytesIO(zf.read('consolidado.xlsx')), read_only=True)
+        self.assertEqual(len(list(wb['Conceptos'].rows)), 1 + 2 + 3)
+        self.assertEqual(len(list(wb['Resumen'].rows)), 1 + 2)
+
+    def set_user_company(self):
+        self.user.company.add(self.company)
+        self.user.currently_at = self.company
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+
+    def get_export_view(self, data):
+        self.user.nivel_acceso = self.director_permission
+        self.set_user_company()
+        request = self.factory.post('/', data=data)
+        request.user = self.user
+        return views.EstimateExportView.as_view()(request, pk=self.contrato.pk)
+
+    def test_export_view_starts_export_and_download_serves_zip(self):
+        self.crear_estimacion(1, datetime.date(2020, 2, 10))
+        response = self.get_export_view({'fecha_inicio': '2020-01-01', 'fecha_fin': '2020-03-01'})
+        self.assertEqual(response.status_code, 202)
+        identificador = json.loads(response.content)['url'].rstrip('/').split('/')[-1]
+        request = self.get_request(self.user)
+        response = views.ExportacionDescarga.as_view()(request, identificador=identificador)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+    def test_export_view_rejects_empty_period(self):
+        self.crear_estimacion(1, datetime.date(2020, 2, 10))
+        response = self.get_export_view({'fecha_inicio': '2021-01-01', 'fecha_fin': '2021-03-01'})
+        self.assertEqual(response.status_code, 400)
+        response = self.get_export_view({'fecha_inicio': '2020-03-01', 'fecha_fin': '2020-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_download_returns_202_while_pending(self):
+        self.user.nivel_acceso = self.coordinador_permission
+        self.set_user_company()
+        request = self.get_request(self.user)
+        response = views.ExportacionDescarga.as_view()(request, identificador=exportacion.nuevo_identificador())
+        self.assertEqual(response.status_code, 202)
+
+
+class HojaExportTest(utils.BaseTestCase):
+
+    def setUp(self):
+        super(HojaExportTest, self).setUp()
+        self.company = factories.CompanyFactory(customer=self.user.customer)
+        self.contrato = factories.ContratoFactory(contraparte__company=self.company)
+        self.unit = factories.UnitFactory(company=self.company)
+        self.user.nivel_acceso = self.director_permission
+        self.user.company.add(self.company)
+        self.user.currently_at = self.company
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+
+    def crear_conceptos(self, cantidad):
+        return [factories.ConceptoFactory(project=self.contrato, unit=self.unit) for i in range(cantidad)]
+
+    def exportar_catalogo(self, formato):
+        request = self.get_request(self.user)
+        return views.CatalogoConceptosExport.as_view()(request, pk=self.contrato.pk, formato=formato)
+
+    def leer_csv(self, response):
+        contenido = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(io.StringIO(contenido)))
+
+    def test_catalogo_csv_streams_one_row_per_concept(self):
+        conceptos = self.crear_conceptos(3)
+        response = self.exportar_catalogo('csv')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        filas = self.leer_csv(response)
+        self.assertEqual(filas[0], list(exportacion.ENCABEZADO_CATALOGO))
+        self.assertEqual([fila[1] for fila in filas[1:]], [concepto.concept_text for concepto in conceptos])
+        self.assertEqual(filas[1][2], self.unit.unit)
+
+    def test_catalogo_csv_queries_do_not_depend_on_concept_count(self):
+        queries = []
+        for cantidad in (2, 20):
+            self.crear_conceptos(cantidad)
+            response = self.exportar_catalogo('csv')
+            with CaptureQueriesContext(connection) as context:
+                self.leer_csv(response)
+            queries.append(len(context))
+        self.assertEqual(queries, [1, 1])
+
+    def test_catalogo_xlsx(self):
+        self.crear_conceptos(4)
+        response = self.exportar_catalogo('xlsx')
+        wb = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(len(list(wb.active.rows)), 1 + 4)
+
+    def test_estimate_xlsx_has_annotated_concepts(self):
+        estimate = factories.EstimateFactory(
+            project=self.contrato, draft_by=self.user, supervised_by=self.user, consecutive=1)
+        for concepto in self.crear_conceptos(3):
+            factories.EstimateConceptFactory(estimate=estimate, concept=concepto, cuantity_estimated=2)
+        self.contrato.users.add(self.user)
+        request = self.get_request(self.user)
+        response = views.EstimateExport.as_view()(request, pk=estimate.pk, formato='xlsx')
+        self.assertIn('estimacion-', response['Content-Disposition'])
+        wb = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        filas = list(wb.active.values)
+        self.assertEqual(len(filas), 1 + 3)
+        self.assertEqual(filas[1][11], 2)
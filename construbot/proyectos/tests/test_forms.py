@@ -4,6 +4,7 @@ from django.shortcuts import reverse
 from django.test import tag
 from construbot.users.tests import factories as user_factories
 from construbot.users.tests import utils
+from construbot.core.models import ChunkedCoreUpload
 from construbot.proyectos import forms, models
 from . import factories
 
@@ -86,6 +87,29 @@ class ContratoFormTest(BaseFormTest):
         form.save()
         self.assertEqual(form.instance.monto, decimal.Decimal('1222.12'))
 
+    def test_contrato_form_uses_chunked_upload_file(self):
+        contrato_company = user_factories.CompanyFactory(customer=self.user.customer)
+        self.user.currently_at = contrato_company
+        contrato_cliente = factories.ClienteFactory(company=contrato_company)
+        contrato_sitio = factories.SitioFactory(cliente=contrato_cliente)
+        upload = ChunkedCoreUpload.objects.create(
+            user=self.user, company=contrato_company, filename='contrato.pdf', status=ChunkedCoreUpload.COMPLETE,
+            file='Archivos/ab/abc.pdf', md5='abc'
+        )
+        form_data = {'folio': 1, 'code': 'TEST-1', 'fecha': '1999-12-1', 'contrato_name': 'TEST CONTRATO 1',
+                     'contrato_shortName': 'TC1', 'contraparte': contrato_cliente.id, 'sitio': contrato_sitio.id,
+                     'monto': 1222.12, 'currently_at': contrato_company.company_name, 'users': [self.user.id],
+                     'anticipo': 0.0, 'relacion_id_archivo': upload.upload_id}
+        form = forms.ContratoForm(data=form_data)
+        form.request = self.request
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().file.name, 'Archivos/ab/abc.pdf')
+        upload.company = user_factories.CompanyFactory(customer=self.user.customer)
+        upload.save()
+        form = forms.ContratoForm(data=form_data)
+        form.request = self.request
+        self.assertIn('relacion_id_archivo', form.errors)
+
 
 class ClienteFormTest(BaseFormTest):
 
@@ -0,0 +1,121 @@
+import threading
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
+from construbot.users.tests import utils
+from construbot.users.tests import factories as user_factories
+from construbot.proyectos import numeracion
+from construbot.proyectos.models import Estimate, Secuencia
+from construbot.proyectos.utils import get_contrato_version_key, get_version
+from . import factories
+
+
+class NumeracionTest(utils.BaseTestCase):
+
+    def test_siguiente_consecutivo_starts_from_existing_estimates(self):
+        contrato = factories.ContratoFactory()
+        factories.EstimateFactory(project=contrato, consecutive=4, draft_by=self.user, supervised_by=self.user)
+        factories.EstimateFactory(consecutive=9, draft_by=self.user, supervised_by=self.user)
+        self.assertEqual(numeracion.siguiente_consecutivo(contrato), 5)
+        self.assertEqual(numeracion.siguiente_consecutivo(contrato), 5)
+        factories.EstimateFactory(project=contrato, consecutive=5, draft_by=self.user, supervised_by=self.user)
+        self.assertEqual(numeracion.siguiente_consecutivo(contrato), 6)
+        secuencia = Secuencia.objects.get(tipo=Secuencia.ESTIMACIONES, contrato=contrato)
+        self.assertEqual(secuencia.ultimo, 6)
+
+    def test_siguiente_folio_counts_root_contracts_of_the_company(self):
+        contrato = factories.ContratoFactory(folio=2)
+        contrato.add_child(
+            folio=7, fecha='2018-01-01', contrato_name='sub', contrato_shortName='sub',
+            contraparte=contrato.contraparte, sitio=contrato.sitio
+        )
+        factories.ContratoFactory(folio=10)
+        self.assertEqual(numeracion.siguiente_folio(contrato.contraparte.company), 3)
+        self.assertEqual(numeracion.siguiente_folio_subcontrato(contrato), 8)
+
+    def test_recorrer_updates_sequence(self):
+        contrato = factories.ContratoFactory()
+        estimaciones = [
+            factories.EstimateFactory(project=contrato, consecutive=i, draft_by=self.user, supervised_by=self.user)
+            for i in (1, 2)
+        ]
+        numeracion.recorrer(estimaciones[0])
+        estimaciones[0].delete()
+        self.assertEqual(Secuencia.objects.get(contrato=contrato).ultimo, 1)
+        self.assertEqual(numeracion.siguiente_consecutivo(contrato), 2)
+
+    def test_recorrer_resets_root_versions_on_commit(self):
+        company = user_factories.CompanyFactory()
+        contratos = [factories.ContratoFactory(contraparte__company=company, folio=i) for i in (1, 2)]
+        llave = get_contrato_version_key(contratos[1].path)
+        version = get_version(llave)
+        with self.captureOnCommitCallbacks(execute=True):
+            numeracion.recorrer(contratos[0])
+            self.assertEqual(cache.get(llave), version)
+        self.assertIsNone(cache.get(llave))
+
+    def test_estimate_creation_ignores_stale_consecutive(self):
+        company = factories.CompanyFactory(customer=self.user.customer)
+        contrato = factories.ContratoFactory(contraparte__company=company)
+        contrato.users.add(self.user)
+        factories.EstimateFactory(project=contrato, consecutive=1, draft_by=self.user, supervised_by=self.user)
+        destinatario = factories.DestinatarioFactory(contraparte=contrato.contraparte)
+        self.user.company.add(company)
+        self.user.currently_at = company
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('proyectos:nueva_estimacion', kwargs={'pk': contrato.pk}), {
+            # El formulario se abrió antes de que se creara la estimación 1.
+            'consecutive': '1',
+            'supervised_by': str(self.user.id),
+            'start_date': '2018-04-29',
+            'finish_date': '2018-05-15',
+            'draft_by': str(self.user.id),
+            'project': str(contrato.id),
+            'auth_by': str(destinatario.id),
+            'auth_date': '2018-05-15',
+            'estimateconcept_set-TOTAL_FORMS': '0',
+            'estimateconcept_set-INITIAL_FORMS': '0',
+            'estimateconcept_set-MIN_NUM_FORMS': '0',
+            'estimateconcept_set-MAX_NUM_FORMS': '0',
+        })
+        self.assertRedirects(response, reverse('proyectos:contrato_detail', kwargs={'pk': contrato.pk}))
+        consecutivos = Estimate.objects.filter(project=contrato).order_by('consecutive')
+        self.assertEqual(list(consecutivos.values_list('consecutive', flat=True)), [1, 2])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class NumeracionConcurrenteTest(TransactionTestCase):
+    """Dos altas simultáneas en el mismo contrato: la segunda espera el
+    bloqueo de la Secuencia y recibe el consecutivo siguiente."""
+
+    def crear_estimacion(self, contrato, user, barrera, consecutivos):
+        try:
+            barrera.wait()
+            with transaction.atomic():
+                consecutive = numeracion.siguiente_consecutivo(contrato)
+                factories.EstimateFactory(
+                    project=contrato, consecutive=consecutive, draft_by=user, supervised_by=user
+                )
+                consecutivos.append(consecutive)
+        finally:
+            connection.close()
+
+    def test_concurrent_estimates_get_distinct_consecutives(self):
+        contrato = factories.ContratoFactory()
+        user = user_factories.UserFactory()
+        factories.EstimateFactory(project=contrato, consecutive=1, draft_by=user, supervised_by=user)
+        barrera = threading.Barrier(2)
+        consecutivos = []
+        hilos = [
+            threading.Thread(target=self.crear_estimacion, args=(contrato, user, barrera, consecutivos))
+            for _ in range(2)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(sorted(consecutivos), [2, 3])
+        self.assertEqual(Secuencia.objects.get(contrato=contrato).ultimo, 3)
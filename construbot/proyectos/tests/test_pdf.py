@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from construbot.users.tests import utils
+from construbot.proyectos import pdf, views
+from construbot.proyectos.models import Retenciones
+from . import factories
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class EstimatePdfTest(utils.BaseTestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super(EstimatePdfTest, cls).tearDownClass()
+
+    def setUp(self):
+        super(EstimatePdfTest, self).setUp()
+        cache.clear()
+        self.company = factories.CompanyFactory(customer=self.user.customer)
+        self.contrato = factories.ContratoFactory(contraparte__company=self.company)
+        self.concepto = factories.ConceptoFactory(project=self.contrato, unit__company=self.company)
+        self.estimate = factories.EstimateFactory(
+            project=self.contrato, draft_by=self.user, supervised_by=self.user, consecutive=1
+        )
+        self.estimate_concept = factories.EstimateConceptFactory(
+            estimate=self.estimate, concept=self.concepto, cuantity_estimated=3
+        )
+
+    def get_hash(self, kind=pdf.ESTIMACION):
+        estimate = pdf.get_estimate(self.estimate.pk)
+        return pdf.get_content_hash(pdf.get_pdf_content(estimate, kind))
+
+    def test_content_hash_is_stable(self):
+        self.assertEqual(self.get_hash(), self.get_hash())
+        self.assertNotEqual(self.get_hash(), self.get_hash(pdf.GENERADOR))
+
+    def test_content_hash_changes_with_estimated_quantity(self):
+        anterior = self.get_hash()
+        self.estimate_concept.cuantity_estimated = 4
+        self.estimate_concept.save()
+        self.assertNotEqual(anterior, self.get_hash())
+
+    def test_content_hash_changes_with_retenciones(self):
+        anterior = self.get_hash()
+        Retenciones.objects.create(nombre='Fondo de garantía', project=self.contrato, valor=5)
+        self.estimate.mostrar_retenciones = True
+        self.estimate.save()
+        self.assertNotEqual(anterior, self.get_hash())
+
+    def test_get_or_render_pdf_stores_a_pdf(self):
+        for kind in pdf.TIPOS_PDF:
+            name = pdf.get_or_render_pdf(self.estimate.pk, kind)
+            self.assertTrue(name.endswith('-{}.pdf'.format(self.get_hash(kind))))
+            with default_storage.open(name) as stored:
+                self.assertEqual(stored.read(4), b'%PDF')
+
+    def test_markup_like_text_is_escaped(self):
+        self.concepto.concept_text = 'muro <br> tipo & Tubo <b>PVC'
+        self.concepto.save()
+        self.contrato.contraparte.cliente_name = 'Cliente <i>uno'
+        self.contrato.contraparte.save()
+        for kind in pdf.TIPOS_PDF:
+            name = pdf.get_or_render_pdf(self.estimate.pk, kind)
+            with default_storage.open(name) as stored:
+                self.assertEqual(stored.read(4), b'%PDF')
+
+    def test_get_or_render_pdf_reuses_stored_file(self):
+        name = pdf.get_or_render_pdf(self.estimate.pk, pdf.ESTIMACION)
+        with mock.patch.object(pdf.EstimatePdfRenderer, 'render') as mock_render:
+            self.assertEqual(pdf.get_or_render_pdf(self.estimate.pk, pdf.ESTIMACION), name)
+        mock_render.assert_not_called()
+
+    def descargar(self):
+        self.user.nivel_acceso = self.director_permission
+        self.user.currently_at = self.company
+        self.user.save()
+        self.contrato.users.add(self.user)
+        request = self.get_request(self.user)
+        view = self.get_instance(views.GeneratorPdfDownload, request=request, pk=self.estimate.pk)
+        return view.get(request)
+
+    def test_download_view_queues_render_once_per_content(self):
+        with mock.patch('construbot.proyectos.tasks.generate_estimate_pdf.delay') as mock_delay:
+            mock_delay.return_value.ready.return_value = False
+            self.assertEqual(self.descargar().status_code, 202)
+            self.assertEqual(self.descargar().status_code, 202)
+        mock_delay.assert_called_once_with(self.estimate.pk, pdf.GENERADOR)
+
+    def test_download_view_returns_pdf_attachment(self):
+        response = self.descargar()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content)[:4], b'%PDF')
@@ -0,0 +1,93 @@
+import io
+import shutil
+import tempfile
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from construbot.users.tests import utils
+from construbot.users.models import Customer
+from construbot.proyectos.models import Contrato, Concept, Estimate, EstimateConcept, ImageEstimateConcept, Vertices
+from construbot.proyectos import numeracion
+from construbot.proyectos.poblacion import GeneradorMasivo, crear_tenant, crear_tenants
+from . import factories
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class GeneradorMasivoTest(utils.BaseTestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super(GeneradorMasivoTest, cls).tearDownClass()
+
+    def generar(self, company, user, **kwargs):
+        return GeneradorMasivo(
+            company, user, contratos=10, conceptos_por_contrato=3, estimaciones_por_contrato=2, hijos=2,
+            profundidad=3, clientes=2, **kwargs
+        ).generar()
+
+    def test_generar_creates_valid_trees_and_counts(self):
+        existente = factories.ContratoFactory()
+        company, user = crear_tenant('tenant_chico')
+        resumen = self.generar(company, user, imagenes=1)
+        self.assertEqual(resumen, {
+            'contratos': 10, 'conceptos': 30, 'estimaciones': 20, 'estimate_concepts': 60, 'vertices': 0,
+            'imagenes': 60,
+        })
+        contratos = Contrato.objects.filter(contraparte__company=company)
+        self.assertEqual(contratos.count(), 10)
+        self.assertEqual(Contrato.find_problems(), ([], [], [], [], []))
+        self.assertTrue(all(existente.path < contrato.path for contrato in contratos))
+        # Dos árboles completos de 7 nodos no caben: el segundo queda con 3.
+        self.assertEqual(sorted(raiz.get_descendant_count() for raiz in contratos.filter(depth=1)), [2, 6])
+        self.assertEqual(Contrato.users.through.objects.filter(user=user).count(), 10)
+        self.assertEqual(Concept.objects.filter(project__contraparte__company=company).count(), 30)
+        self.assertEqual(EstimateConcept.objects.filter(estimate__project__contraparte__company=company).count(), 60)
+        self.assertEqual(ImageEstimateConcept.objects.values('image').distinct().count(), 1)
+        estimate = Estimate.especial.con_totales().filter(project__contraparte__company=company).first()
+        self.assertTrue(estimate.auth_by.exists())
+
+    def test_generar_is_deterministic(self):
+        montos = []
+        for nombre in ('tenant_a', 'tenant_b'):
+            company, user = crear_tenant(nombre)
+            self.generar(company, user, imagenes=0)
+            montos.append(list(Contrato.objects.filter(contraparte__company=company).order_by('path').values_list(
+                'monto', flat=True)))
+        self.assertEqual(montos[0], montos[1])
+
+    def test_folios_follow_numbering_scopes(self):
+        company, user = crear_tenant('tenant_folios')
+        anterior = factories.ContratoFactory(contraparte__company=company, folio=4)
+        self.generar(company, user, imagenes=0)
+        raices = Contrato.objects.filter(contraparte__company=company, depth=1).exclude(pk=anterior.pk)
+        self.assertEqual(sorted(raices.values_list('folio', flat=True)), [5, 6])
+        for contrato in Contrato.objects.filter(contraparte__company=company, numchild__gt=0):
+            self.assertEqual(
+                sorted(contrato.get_children().values_list('folio', flat=True)), list(range(1, contrato.numchild + 1)))
+        self.assertEqual(numeracion.siguiente_folio(company), 7)
+
+    def test_crear_tenants_assigns_contracts_and_vertices(self):
+        tenants = crear_tenants(2, 2, 3, prefijo='masivo')
+        self.assertEqual(len(tenants), 4)
+        company, usuarios = tenants[0]
+        self.assertEqual([usuario.nivel_acceso.nivel for usuario in usuarios], [3, 2, 1])
+        self.assertTrue(all(usuario.check_password('password') for usuario in usuarios))
+        self.assertEqual(list(usuarios[1].company.all()), [company])
+        self.assertTrue(usuarios[1].groups.filter(name='Proyectos').exists())
+        resumen = self.generar(company, usuarios[0], usuarios=usuarios, vertices=2, imagenes=0)
+        self.assertEqual(resumen['vertices'], 120)
+        self.assertEqual(Contrato.users.through.objects.filter(user=usuarios[0]).count(), 10)
+        self.assertEqual(Contrato.users.through.objects.filter(user__in=usuarios[1:]).count(), 10)
+        vertice = Vertices.objects.filter(estimateconcept__estimate__project__contraparte__company=company).first()
+        self.assertEqual(vertice.largo * 2, vertice.estimateconcept.cuantity_estimated)
+
+    def test_poblar_bulk_rejects_used_prefix_and_empty_companies(self):
+        crear_tenants(1, 1, 1, prefijo='usado')
+        customers = Customer.objects.count()
+        with self.assertRaisesMessage(CommandError, 'usado'):
+            call_command('poblar', '--bulk', '--prefijo', 'usado', '--contratos', '1', stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, '--usuarios'):
+            call_command('poblar', '--bulk', '--usuarios', '0', stdout=io.StringIO())
+        self.assertEqual(Customer.objects.count(), customers)
@@ -1,13 +1,18 @@
+import io
 import tempfile
 import shutil
 import datetime
 from unittest import mock
 from decimal import Decimal
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.images import ImageFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import transaction
 from django.db.utils import IntegrityError
 from django.test import override_settings, tag
+from PIL import Image
 from test_plus.test import CBVTestCase
 from construbot.users.models import NivelAcceso
 from construbot.users.tests import factories as user_factories
@@ -425,3 +430,93 @@ class ImageEstimateConceptTest(CBVTestCase):
         imagen = models.ImageEstimateConcept.objects.create(image=image, estimateconcept=concepto)
         self.assertTrue(models.ImageEstimateConcept.objects.filter(estimateconcept=concepto).exists())
         self.assertTrue(isinstance(imagen.id, int))
+
+    @mock.patch.object(ImageFile, '_get_image_dimensions')
+    def test_guardado_de_imagenes_con_prefijo_no_consulta_la_ruta(self, mock_dimensions):
+        mock_dimensions.return_value = (500, 380)
+        concepto = factories.EstimateConceptFactory(
+            estimate__draft_by=self.user,
+            estimate__supervised_by=self.user
+        )
+        for i in range(3):
+            imagen = models.ImageEstimateConcept(image=self.get_test_image_file(), estimateconcept=concepto)
+            imagen.upload_path_prefix = '1-customer/company'
+            # El bloqueo del archivo (creado la primera vez en un savepoint), la búsqueda de una imagen con el
+            # mismo contenido y el insert.
+            with self.assertNumQueries(6 if i == 0 else 3):
+                imagen.save()
+            self.assertTrue(imagen.image.name.startswith('1-customer/company/Imagenes_generadores/'))
+
+    @mock.patch.object(ImageFile, '_get_image_dimensions')
+    def test_guardado_de_imagen_sin_prefijo_usa_cache_de_compania(self, mock_dimensions):
+        mock_dimensions.return_value = (500, 380)
+        cache.clear()
+        concepto = factories.EstimateConceptFactory(
+            estimate__draft_by=self.user,
+            estimate__supervised_by=self.user
+        )
+        company = concepto.concept.project.contraparte.company
+        with self.assertNumQueries(8):
+            imagen = models.ImageEstimateConcept.objects.create(
+                image=self.get_test_image_file(), estimateconcept=concepto)
+        with self.assertNumQueries(4):
+            models.ImageEstimateConcept.objects.create(image=self.get_test_image_file(), estimateconcept=concepto)
+        self.assertTrue(imagen.image.name.startswith(
+            '{}-{}/{}/'.format(company.customer.id, company.customer.customer_name, company.company_name)))
+
+    def get_png(self, color, alto=400):
+        contenido = io.BytesIO()
+        Image.new('RGB', (60, alto), color).save(contenido, 'PNG')
+        return SimpleUploadedFile('foto.png', contenido.getvalue(), content_type='image/png')
+
+    def crear_concepto(self, **kwargs):
+        return factories.EstimateConceptFactory(
+            estimate__draft_by=self.user, estimate__supervised_by=self.user, **kwargs)
+
+    def test_same_content_is_stored_and_resized_once(self):
+        concepto = self.crear_concepto()
+        otro = self.crear_concepto(concept__project=concepto.concept.project)
+        with mock.patch('construbot.core.utils.image_resize', wraps=models.utils.image_resize) as resize:
+            primera = models.ImageEstimateConcept.objects.create(image=self.get_png('red'), estimateconcept=concepto)
+            segunda = models.ImageEstimateConcept.objects.create(image=self.get_png('red'), estimateconcept=otro)
+            tercera = models.ImageEstimateConcept.objects.create(image=self.get_png('blue'), estimateconcept=otro)
+        self.assertEqual(resize.call_count, 2)
+        self.assertEqual(primera.image.name, segunda.image.name)
+        self.assertEqual(primera.size, segunda.size)
+        self.assertNotEqual(primera.image.name, tercera.image.name)
+        self.assertIn('/{}/{}'.format(primera.md5[:2], primera.md5), primera.image.name)
+        self.assertEqual(len(default_storage.listdir(primera.image.name.rsplit('/', 1)[0])[1]), 1)
+
+    def test_same_content_in_other_company_is_stored_apart(self):
+        primera = models.ImageEstimateConcept.objects.create(
+            image=self.get_png('red'), estimateconcept=self.crear_concepto())
+        segunda = models.ImageEstimateConcept.objects.create(
+            image=self.get_png('red'), estimateconcept=self.crear_concepto())
+        self.assertEqual(primera.md5, segunda.md5)
+        self.assertNotEqual(primera.image.name, segunda.image.name)
+
+    def test_file_is_deleted_with_last_reference(self):
+        concepto = self.crear_concepto()
+        imagenes = [
+            models.ImageEstimateConcept.objects.create(image=self.get_png('red', alto=100), estimateconcept=concepto)
+            for _ in range(2)
+        ]
+        nombre = imagenes[0].image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            imagenes[0].delete()
+        self.assertTrue(default_storage.exists(nombre))
+        with self.captureOnCommitCallbacks(execute=True):
+            concepto.estimate.delete()
+        self.assertFalse(default_storage.exists(nombre))
+        self.assertFalse(models.BloqueoImagen.objects.exists())
+
+    def test_save_and_delete_lock_the_same_file(self):
+        # El insert que reutiliza un archivo y el borrado diferido se serializan con la misma fila.
+        with mock.patch.object(models.BloqueoImagen, 'bloquear') as bloquear:
+            imagen = models.ImageEstimateConcept.objects.create(
+                image=self.get_png('red', alto=100), estimateconcept=self.crear_concepto())
+            with self.captureOnCommitCallbacks(execute=True):
+                imagen.delete()
+        self.assertEqual(bloquear.call_count, 2)
+        self.assertEqual(bloquear.call_args_list[0].args[0], bloquear.call_args_list[1].args[0])
+        self.assertEqual(bloquear.call_args_list[0].args[0] + '.png', imagen.image.name)
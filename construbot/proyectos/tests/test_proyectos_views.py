@@ -1,13 +1,15 @@
+import asyncio
 import json
 import decimal
 from io import StringIO
 from unittest import mock
+from asgiref.sync import async_to_sync
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import reverse
 from django.test import RequestFactory, tag
 from construbot.users.tests import utils
 from construbot.proyectos import views
-from construbot.proyectos.models import Destinatario, Contrato, Estimate
+from construbot.proyectos.models import Contraparte, Destinatario, Contrato, Estimate
 from construbot.users.tests import factories as user_factories
 from . import factories
 
@@ -1439,11 +1441,72 @@ class CatalogoConceptosTest(BaseViewTest):
                 },
 
             ],
+            'siguiente': None,
         }
         JSON_test = json.dumps(JSON_test)
-        JSON_view = str(response.content, encoding='utf-8')
+        JSON_view = b''.join(response.streaming_content).decode('utf-8')
         self.assertJSONEqual(JSON_view, JSON_test)
 
+    def get_catalogo_response(self, contrato):
+        instance = self.get_instance(views.CatalogoConceptos, request=self.request)
+        instance.contrato = contrato
+        return instance.get(self.request)
+
+    def test_json_paginated_by_cursor_in_one_query(self):
+        company = factories.CompanyFactory(customer=self.user.customer)
+        self.request.user.currently_at = company
+        contrato = factories.ContratoFactory(contraparte__company=company)
+        unit = factories.UnitFactory(company=company)
+        conceptos = [factories.ConceptoFactory(project=contrato, unit=unit) for i in range(5)]
+        self.request = self.factory.get('/proyectos/contrato/catalogo-conceptos/1/', data={'limite': 2})
+        self.request.user = self.user
+        recibidos = []
+        while True:
+            response = self.get_catalogo_response(contrato)
+            with self.assertNumQueries(1):
+                data = json.loads(b''.join(response.streaming_content))
+            recibidos += [concepto['concept_text'] for concepto in data['conceptos']]
+            if data['siguiente'] is None:
+                break
+            self.assertLessEqual(len(data['conceptos']), 2)
+            self.request = self.factory.get(data['siguiente'])
+            self.request.user = self.user
+        self.assertEqual(recibidos, [concepto.concept_text for concepto in conceptos])
+
+    def test_json_without_cursor_or_limit_is_complete(self):
+        company = factories.CompanyFactory(customer=self.user.customer)
+        self.request.user.currently_at = company
+        contrato = factories.ContratoFactory(contraparte__company=company)
+        unit = factories.UnitFactory(company=company)
+        for i in range(3):
+            factories.ConceptoFactory(project=contrato, unit=unit)
+        with mock.patch.object(views.CatalogoConceptos, 'paginate_by', 2):
+            data = json.loads(b''.join(self.get_catalogo_response(contrato).streaming_content))
+        self.assertEqual(len(data['conceptos']), 3)
+        self.assertIsNone(data['siguiente'])
+
+    def test_json_etag_not_modified_until_catalog_changes(self):
+        company = factories.CompanyFactory(customer=self.user.customer)
+        self.request.user.currently_at = company
+        contrato = factories.ContratoFactory(contraparte__company=company)
+        concepto = factories.ConceptoFactory(project=contrato, unit__company=company)
+        etag = self.get_catalogo_response(contrato)['ETag']
+        self.request = self.factory.get('bla/bla', HTTP_IF_NONE_MATCH=etag)
+        self.request.user = self.user
+        self.assertEqual(self.get_catalogo_response(contrato).status_code, 304)
+        concepto.unit.unit = 'otra'
+        with self.captureOnCommitCallbacks(execute=True):
+            concepto.unit.save()
+        response = self.get_catalogo_response(contrato)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.request = self.factory.get('bla/bla', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.request.user = self.user
+        concepto.total_cuantity = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            concepto.save()
+        self.assertEqual(self.get_catalogo_response(contrato).status_code, 200)
+
     def test_catalogo_edit_raises_permission_denied(self):
         company_test = user_factories.CompanyFactory(customer=self.user.customer)
         self.user.company.add(company_test)
@@ -1556,87 +1619,63 @@ class DynamicDeleteTest(BaseViewTest):
         mock_object.assert_called_once()
         self.assertJSONEqual(str(response.content, encoding='utf8'), {"exito": True})
 
-    @mock.patch.object(views.DynamicDelete, 'get_company_query')
-    def test_folio_handling_perfoms_correct_qs(self, mock_query):
+    def get_delete_view(self, objeto):
+        request = RequestFactory().post(
+            reverse('proyectos:eliminar', kwargs={'model': type(objeto).__name__, 'pk': objeto.pk}),
+            data={'value': 'confirm'}
+        )
+        request.user = self.user
+        view = self.get_instance(views.DynamicDelete, request=request, model=type(objeto).__name__, pk=objeto.pk)
+        view.object = objeto
+        view.model = type(objeto)
+        return view
+
+    def test_folio_handling_renumbers_company_root_contracts(self):
         company_delete = factories.CompanyFactory(customer=self.user.customer)
         cliente_delete = factories.ClienteFactory(company=company_delete)
         contrato_delete = factories.ContratoFactory(folio=1, contraparte=cliente_delete)
         contrato_delete_2 = factories.ContratoFactory(folio=2, contraparte=cliente_delete)
         contrato_delete_3 = factories.ContratoFactory(folio=3, contraparte=cliente_delete)
-        self.user.currently_at = company_delete
-        request = RequestFactory().post(
-            reverse('proyectos:eliminar', kwargs={'model': 'Contrato', 'pk': contrato_delete.pk}),
-            data={'value': 'confirm'}
+        subcontrato = contrato_delete.add_child(
+            folio=2, fecha='2018-01-01', contrato_name='sub', contrato_shortName='sub', contraparte=cliente_delete,
+            sitio=contrato_delete.sitio
         )
-        request.user = self.user
-        view = self.get_instance(
-            views.DynamicDelete,
-            request=request,
-            model='Contrato',
-            pk=contrato_delete.pk
-        )
-        view.object = contrato_delete
-        view.model = contrato_delete._meta.model
-        mock_query.return_value = (
-            {'contraparte__company': self.user.currently_at, 'folio__gt': view.object.folio}, 'folio'
-        )
-        view.folio_handling()
-        contrato_delete_2.refresh_from_db()
-        contrato_delete_3.refresh_from_db()
-        mock_query.assert_called_once()
+        otro = factories.ContratoFactory(folio=2)
+        self.user.currently_at = company_delete
+        self.get_delete_view(contrato_delete).folio_handling()
+        for contrato in (contrato_delete_2, contrato_delete_3, subcontrato, otro):
+            contrato.refresh_from_db()
         self.assertEqual(contrato_delete_2.folio, 1)
         self.assertEqual(contrato_delete_3.folio, 2)
+        self.assertEqual(subcontrato.folio, 2)
+        self.assertEqual(otro.folio, 2)
+
+    def test_folio_handling_renumbers_sibling_subcontracts_only(self):
+        contrato = factories.ContratoFactory(folio=1)
+        otro = factories.ContratoFactory(folio=2, contraparte=contrato.contraparte)
+        datos = {'fecha': '2018-01-01', 'contraparte': contrato.contraparte, 'sitio': contrato.sitio}
+        hijos = [contrato.add_child(folio=i, contrato_name='sub', contrato_shortName='sub', **datos) for i in (1, 2, 3)]
+        self.user.currently_at = contrato.contraparte.company
+        self.get_delete_view(hijos[0]).folio_handling()
+        for hijo in hijos + [otro]:
+            hijo.refresh_from_db()
+        self.assertEqual([hijo.folio for hijo in hijos], [1, 1, 2])
+        self.assertEqual(otro.folio, 2)
 
-    @mock.patch.object(views.DynamicDelete, 'get_object')
-    def test_get_company_query_with_estimate(self, mock_object):
-        estimate = factories.EstimateFactory(
-            draft_by=self.user,  # se ocupa porque si no truena
-            supervised_by=self.user
-        )
-        mock_object.return_value = estimate
-        request = RequestFactory().post(
-            reverse('proyectos:eliminar', kwargs={'model': 'Estimate', 'pk': estimate.pk}),
-            data={'value': 'confirm'}
-        )
-        self.user.currently_at = estimate.project.contraparte.company
-        request.user = self.user
-        view = self.get_instance(
-            views.DynamicDelete,
-            request=request,
-            model='Estimate',
-            pk=estimate.pk
-        )
-        view.object = view.get_object()
-        control_dict = {
-            'project__contraparte__company': self.request.user.currently_at,
-            'consecutive__gt': estimate.consecutive
-        }
-        kwargs, field = view.get_company_query('Estimate')
-        self.assertDictEqual(kwargs, control_dict)
-
-    @mock.patch.object(views.DynamicDelete, 'get_object')
-    def test_get_company_query_with_contrato(self, mock_object):
+    def test_folio_handling_renumbers_estimates_of_the_same_project_only(self):
         contrato = factories.ContratoFactory()
-        mock_object.return_value = contrato
-        request = RequestFactory().post(
-            reverse('proyectos:eliminar', kwargs={'model': 'Estimate', 'pk': contrato.pk}),
-            data={'value': 'confirm'}
-        )
+        otro_contrato = factories.ContratoFactory(contraparte=contrato.contraparte)
+        usuarios = {'draft_by': self.user, 'supervised_by': self.user}
+        estimaciones = [factories.EstimateFactory(project=contrato, consecutive=i, **usuarios) for i in (1, 2, 3)]
+        ajena = factories.EstimateFactory(project=otro_contrato, consecutive=3, **usuarios)
         self.user.currently_at = contrato.contraparte.company
-        request.user = self.user
-        view = self.get_instance(
-            views.DynamicDelete,
-            request=request,
-            model='Estimate',
-            pk=contrato.pk
-        )
-        view.object = view.get_object()
-        control_dict = {
-            'contraparte__company': self.request.user.currently_at,
-            'folio__gt': contrato.folio
-        }
-        kwargs, field = view.get_company_query('Contrato')
-        self.assertDictEqual(kwargs, control_dict)
+        view = self.get_delete_view(estimaciones[0])
+        view.delete(view.request)
+        for estimacion in estimaciones[1:] + [ajena]:
+            estimacion.refresh_from_db()
+        self.assertEqual([estimacion.consecutive for estimacion in estimaciones[1:]], [1, 2])
+        self.assertEqual(ajena.consecutive, 3)
+        self.assertFalse(Estimate.objects.filter(pk=estimaciones[0].pk).exists())
 
 
 class ClienteAutocompleteTest(BaseViewTest):
@@ -1738,6 +1777,65 @@ class ClienteAutocompleteTest(BaseViewTest):
         self.assertTrue(isinstance(obj.pk, int))
 
 
+class AutocompleteAsincronoTest(BaseViewTest):
+
+    def setUp(self):
+        super(AutocompleteAsincronoTest, self).setUp()
+        self.company = factories.CompanyFactory(customer=self.user.customer)
+        self.user.company.add(self.company)
+        self.user.currently_at = self.company
+        self.user.nivel_acceso = self.soporte_permission
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+
+    def test_views_are_async_and_non_atomic(self):
+        view = views.NivelAccesoAutocomplete.as_view()
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        self.assertEqual(view._non_atomic_requests, {'default'})
+
+    def test_results_paginated(self):
+        response = self.client.get(reverse('proyectos:nivelacceso-autocomplete'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'results': [
+                {'id': str(nivel.pk), 'text': str(nivel), 'selected_text': str(nivel)}
+                for nivel in [self.auxiliar_permission, self.coordinador_permission, self.director_permission,
+                              self.corporativo_permission, self.soporte_permission]
+            ],
+            'pagination': {'more': False},
+        })
+        with mock.patch.object(views.NivelAccesoAutocomplete, 'paginate_by', 2):
+            primera = self.client.get(reverse('proyectos:nivelacceso-autocomplete')).json()
+            ultima = self.client.get(reverse('proyectos:nivelacceso-autocomplete'), {'page': 3}).json()
+        self.assertEqual(len(primera['results']), 2)
+        self.assertTrue(primera['pagination']['more'])
+        self.assertEqual([r['id'] for r in ultima['results']], [str(self.soporte_permission.pk)])
+        self.assertFalse(ultima['pagination']['more'])
+
+    def test_concurrent_lookups(self):
+        async def buscar():
+            return await asyncio.gather(*[
+                self.async_client.get(reverse('proyectos:nivelacceso-autocomplete')) for _ in range(5)
+            ])
+        respuestas = async_to_sync(buscar)()
+        self.assertEqual([response.status_code for response in respuestas], [200] * 5)
+        self.assertEqual(len({response.content for response in respuestas}), 1)
+
+    def test_requires_permission(self):
+        self.user.groups.clear()
+        response = self.client.get(reverse('proyectos:nivelacceso-autocomplete'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_post_creates_object(self):
+        response = self.client.post(reverse('proyectos:cliente-autocomplete'), {'text': 'Cliente nuevo'})
+        self.assertEqual(response.status_code, 200)
+        cliente = Contraparte.objects.get(cliente_name='Cliente nuevo')
+        self.assertEqual(response.json(), {'id': str(cliente.pk), 'text': 'Cliente nuevo'})
+        self.assertEqual(cliente.company, self.company)
+
+
 class SitioAutocompleteTest(BaseViewTest):
     def test_if_autocomplete_returns_the_correct_sitio_object(self):
         company_autocomplete = factories.CompanyFactory(customer=self.user.customer)
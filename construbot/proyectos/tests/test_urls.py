@@ -1,5 +1,8 @@
 from django.urls import reverse
+from django.views.generic import DetailView, ListView
+from construbot.core.utils import BasicAutocomplete
 from construbot.users.tests import utils
+from construbot.proyectos import urls
 
 
 class TestProyectsURLs(utils.BaseTestCase):
@@ -97,3 +100,17 @@ class TestProyectsURLs(utils.BaseTestCase):
 
     def test_unit_autocomplete_reverse(self):
         self.assertEqual(reverse('proyectos:unit-autocomplete'), '/proyectos/unit-autocomplete/')
+
+
+class TestNonAtomicRequests(utils.BaseTestCase):
+    """Las vistas de consulta no abren la transacción de ATOMIC_REQUESTS; las que escriben sí."""
+
+    def test_read_only_views_are_non_atomic(self):
+        for pattern in urls.urlpatterns:
+            vista = pattern.callback.view_class
+            solo_lectura = issubclass(vista, (ListView, DetailView, BasicAutocomplete))
+            with self.subTest(pattern.name):
+                self.assertEqual(solo_lectura, vista.solo_lectura)
+                self.assertEqual(
+                    getattr(pattern.callback, '_non_atomic_requests', set()), {'default'} if solo_lectura else set()
+                )
@@ -32,9 +32,19 @@ urlpatterns = [
     re_path(r'^contrato/catalogo-conceptos/(?P<pk>\d+)/$', views.CatalogoConceptos.as_view(),
         name='catalogo_conceptos_listado'
     ),
+    re_path(r'^contrato/catalogo-conceptos/(?P<pk>\d+)/exportar/(?P<formato>csv|xlsx)/$',
+        views.CatalogoConceptosExport.as_view(),
+        name='catalogo_conceptos_exportar'
+    ),
     re_path(r'^contrato/detalle/(?P<pk>\d+)/$', views.ContratoDetailView.as_view(),
         name='contrato_detail'
     ),
+    re_path(r'^contrato/(?P<pk>\d+)/exportar-estimaciones/$', views.EstimateExportView.as_view(),
+        name='exportar_estimaciones'
+    ),
+    re_path(r'^exportacion/(?P<identificador>[0-9a-f]{32})/$', views.ExportacionDescarga.as_view(),
+        name='exportacion_descarga'
+    ),
     re_path(r'^cliente/detalle/(?P<pk>\d+)/$', views.ClienteDetailView.as_view(),
         name='cliente_detail'
     ),
@@ -47,6 +57,9 @@ urlpatterns = [
     re_path(r'^estimacion/detalle/(?P<pk>\d+)/$', views.EstimateDetailView.as_view(),
         name='estimate_detail'
     ),
+    re_path(r'^estimacion/detalle/(?P<pk>\d+)/exportar/(?P<formato>csv|xlsx)/$', views.EstimateExport.as_view(),
+        name='estimate_exportar'
+    ),
     re_path(r'^estimacion/(?P<pk>\d+)/reporte-subcontratistas/$', views.SubcontratosReport.as_view(),
         name='reporte-subcontratistas'
     ),
@@ -56,6 +69,12 @@ urlpatterns = [
     re_path(r'^generador/pdf/(?P<pk>\d+)/$', views.GeneratorPdfPrint.as_view(),
         name='generator_detailpdf'
     ),
+    re_path(r'^estimacion/pdf/(?P<pk>\d+)/descargar/$', views.EstimatePdfDownload.as_view(),
+        name='estimate_pdf_download'
+    ),
+    re_path(r'^generador/pdf/(?P<pk>\d+)/descargar/$', views.GeneratorPdfDownload.as_view(),
+        name='generator_pdf_download'
+    ),
     re_path(r'^contrato/nuevo/$', views.ContratoCreationView.as_view(),
         name='nuevo_contrato'
     ),
@@ -1,4 +1,9 @@
+import hashlib
+import time
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Sum, F
+from django.utils.http import quote_etag
 from construbot.core.utils import Round
 from .models import Contrato, Estimate
 
@@ -60,3 +65,96 @@ def path_processing(path):
     elif path[-1] == '\\':
         path = path[:-1] + r'\\\\'
     return path + '%'
+
+
+def get_catalogo_version_key(contrato_id):
+    return 'construbot:catalogo-version:{}'.format(contrato_id)
+
+
+def get_unidades_version_key(company_id):
+    return 'construbot:unidades-version:{}'.format(company_id)
+
+
+def get_contrato_version_key(path):
+    # Todo el árbol de un contrato comparte versión: el detalle de un contrato
+    # muestra lo ejercido en sus subcontratos.
+    return 'construbot:contrato-version:{}'.format(path[:Contrato.steplen])
+
+
+def get_company_version_key(company_id):
+    return 'construbot:company-version:{}'.format(company_id)
+
+
+def get_version(key):
+    """Regresa la versión guardada en `key`, que es el momento de la última
+    modificación. Si no existe (porque se modificó o porque el cache la
+    descartó) se toma el momento actual, así nunca se repite un ETag para
+    datos distintos. Sin cache (p. ej. con Redis caído e IGNORE_EXCEPTIONS)
+    cada llamada regresa el momento actual."""
+    version = cache.get(key)
+    if version is None:
+        ahora = time.time()
+        cache.add(key, ahora, None)
+        version = cache.get(key)
+        if version is None:
+            version = ahora
+    return version
+
+
+def reset_versions(*keys):
+    """Descarta las versiones de `keys` al confirmar la transacción en curso
+    (o de inmediato fuera de una). Si se descartaran antes, una consulta
+    concurrente podría tomar una versión nueva con los datos aún sin
+    confirmar y el cambio no se vería hasta la siguiente modificación."""
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def reset_catalogo_version(contrato_id):
+    reset_versions(get_catalogo_version_key(contrato_id))
+
+
+def reset_unidades_version(company_id):
+    reset_versions(get_unidades_version_key(company_id))
+
+
+def reset_contrato_version(path, company_id=None):
+    keys = [get_contrato_version_key(path)]
+    if company_id is not None:
+        keys.append(get_company_version_key(company_id))
+    reset_versions(*keys)
+
+
+def reset_company_version(*company_ids):
+    reset_versions(*[get_company_version_key(company_id) for company_id in company_ids])
+
+
+def versiones_etag(keys, *args):
+    """Regresa el ETag y la fecha de última modificación (timestamp) de los
+    datos cuyas versiones se guardan en `keys`. `args` son los demás valores de
+    los que depende la respuesta."""
+    versiones = [get_version(key) for key in keys]
+    partes = [repr(version) for version in versiones] + [str(arg) for arg in args]
+    etag = quote_etag(hashlib.sha256('|'.join(partes).encode('utf-8')).hexdigest())
+    return etag, int(max(versiones))
+
+
+def get_impresion_version(estimate):
+    """Versión del contenido impreso de una estimación: sus conceptos y
+    generadores dependen de todo el contrato (estimaciones anteriores) y las
+    firmas de los datos de la compañía, sus destinatarios y usuarios."""
+    keys = [
+        get_contrato_version_key(estimate.project.path),
+        get_company_version_key(estimate.project.contraparte.company_id),
+    ]
+    return '-'.join(repr(get_version(key)) for key in keys)
+
+
+def catalogo_etag(contrato_id, company_id, *args):
+    """ETag del catálogo de conceptos de un contrato. Cambia cuando se modifica
+    alguno de sus conceptos o alguna unidad de la compañía."""
+    partes = [
+        contrato_id,
+        get_version(get_catalogo_version_key(contrato_id)),
+        get_version(get_unidades_version_key(company_id)),
+    ]
+    return quote_etag('-'.join(str(parte) for parte in partes + list(args)))
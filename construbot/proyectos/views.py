@@ -3,20 +3,29 @@ import json
 from decimal import Decimal
 from django import shortcuts
 from django.conf import settings
-from django.views.generic import ListView, CreateView, DetailView, UpdateView, DeleteView, TemplateView
+from django.views.generic import ListView, CreateView, DetailView, UpdateView, DeleteView, FormView, View
 from django.urls import reverse, reverse_lazy
-from django.db.models import Max, F, Q
+from django.db import transaction
+from django.db.models import Count, Max, Q
 from django.db.models.functions import Lower
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, urlencode
 from django.contrib.auth import get_user_model
 from openpyxl import load_workbook
 from construbot.users.models import Company, NivelAcceso
 from construbot.proyectos import forms
+from construbot.core.replica import SoloLecturaMixin, en_replica
 from construbot.core.utils import BasicAutocomplete, get_object_403_or_404
+from . import exportacion, numeracion, pdf, tasks
 from .apps import ProyectosConfig
 from .models import Contrato, Contraparte, Sitio, Units, Concept, Destinatario, Estimate, Retenciones
 from .utils import contratosvigentes, estimacionespendientes_facturacion, estimacionespendientes_pago,\
-    totalsinfacturar, total_sinpago, path_processing
+    totalsinfacturar, total_sinpago, path_processing, catalogo_etag, versiones_etag, get_company_version_key, \
+    get_contrato_version_key, get_impresion_version
 
 try:
     auth = importlib.import_module(settings.CONSTRUBOT_AUTHORIZATION_CLASS)
@@ -26,7 +35,7 @@ except ImportError:
 User = get_user_model()
 
 
-class ProyectosMenuMixin(auth.AuthenticationTestMixin):
+class ProyectosMenuMixin(SoloLecturaMixin, auth.AuthenticationTestMixin):
     permiso_requerido = 2
     app_label_name = ProyectosConfig.verbose_name
     menu_specific = [
@@ -114,12 +123,53 @@ class ProyectosMenuMixin(auth.AuthenticationTestMixin):
             'Estimate': {
                 'project__contraparte__company': self.request.user.currently_at
             },
+            'Concept': {
+                'project__contraparte__company': self.request.user.currently_at
+            },
+            'EstimateConcept': {
+                'estimate__project__contraparte__company': self.request.user.currently_at
+            },
         }
         return company_query[opcion]
 
 
+class ConditionalGetMixin(object):
+    """Responde 304 cuando los datos de la página no cambiaron desde la última
+    visita del usuario. La revisión se hace después de la autorización y antes
+    de las consultas de la vista y del render del template.
+
+    Las versiones se invalidan con las señales de proyectos/signals/handlers.py."""
+
+    def get_version_keys(self):
+        return [get_company_version_key(self.request.user.currently_at_id)]
+
+    def get_etag_args(self):
+        # La página también depende del usuario (menú y permisos) y del token CSRF de sus formularios.
+        user = self.request.user
+        return (
+            self.__class__.__name__, self.request.get_full_path(), user.pk, user.currently_at_id,
+            user.nivel_acceso_id, self.request.META.get('CSRF_COOKIE'),
+        )
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = versiones_etag(self.get_version_keys(), *self.get_etag_args())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super(ConditionalGetMixin, self).get(request, *args, **kwargs)
+            if en_replica():
+                # La réplica pudo no tener aún los cambios de la versión actual.
+                patch_cache_control(response, private=True, no_cache=True)
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+
 class ProyectDashboardView(ProyectosMenuMixin, ListView):
     permiso_requerido = 1
+    solo_lectura = True
     template_name = 'proyectos/index.html'
     model = Contrato
 
@@ -139,8 +189,9 @@ class ProyectDashboardView(ProyectosMenuMixin, ListView):
         return context
 
 
-class DynamicList(ProyectosMenuMixin, ListView):
+class DynamicList(ConditionalGetMixin, ProyectosMenuMixin, ListView):
     paginate_by = 10
+    solo_lectura = True
 
     def get_queryset(self):
         if self.request.user.nivel_acceso.nivel >= 3:
@@ -151,7 +202,11 @@ class DynamicList(ProyectosMenuMixin, ListView):
         else:
             self.queryset = Contrato.especial.asignaciones(self.request.user, self.model).order_by(
                     Lower(self.model_options[self.model.__name__]['ordering']))
-        return super(DynamicList, self).get_queryset()
+        return self.optimizar_queryset(super(DynamicList, self).get_queryset())
+
+    def optimizar_queryset(self, queryset):
+        """Relaciones y conteos que el template muestra en cada renglón."""
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super(DynamicList, self).get_context_data(**kwargs)
@@ -178,6 +233,9 @@ class ContratoListView(DynamicList):
 class ClienteListView(DynamicList):
     model = Contraparte
 
+    def optimizar_queryset(self, queryset):
+        return queryset.select_related('company').annotate(numero_de_contratos=Count('contrato'))
+
 
 class SitioListView(DynamicList):
     model = Sitio
@@ -192,16 +250,22 @@ class DestinatarioListView(DynamicList):
             self.queryset = Destinatario.objects.filter(contraparte__in=clientes).order_by(
                 Lower(self.model_options[self.model.__name__]['ordering'])
             )
-            return self.queryset
+            return self.optimizar_queryset(self.queryset)
         return super(DestinatarioListView, self).get_queryset()
 
+    def optimizar_queryset(self, queryset):
+        return queryset.select_related('contraparte')
+
 
 class CatalogoConceptos(ProyectosMenuMixin, ListView):
+    solo_lectura = True
     model = Concept
     ordering = 'code'
     permiso_requerido = 3
     nivel_permiso_asignado = 2
     asignacion_requerida = True
+    paginate_by = 500
+    max_paginate_by = 2000
 
     def get_assignment_args(self):
         self.contrato = self.get_contrato()
@@ -213,22 +277,76 @@ class CatalogoConceptos(ProyectosMenuMixin, ListView):
         )
         return self.contrato
 
+    def get_limite(self):
+        # Sin cursor ni límite se entrega el catálogo completo, como antes de paginarlo.
+        if 'cursor' not in self.request.GET and 'limite' not in self.request.GET:
+            return None
+        try:
+            limite = int(self.request.GET.get('limite', self.paginate_by))
+        except ValueError:
+            limite = self.paginate_by
+        return max(1, min(limite, self.max_paginate_by))
+
+    def get_cursor(self):
+        try:
+            return int(self.request.GET.get('cursor', 0))
+        except ValueError:
+            return 0
+
+    def get_siguiente(self, cursor, limite):
+        return '{}?{}'.format(self.request.path, urlencode({'cursor': cursor, 'limite': limite}))
+
+    def json_conceptos(self, conceptos, limite):
+        # Se escribe el arreglo concepto por concepto para no tener el catálogo completo en memoria.
+        encoder = DjangoJSONEncoder()
+        siguiente = anterior = None
+        yield '{"conceptos": ['
+        for i, concepto in enumerate(conceptos):
+            if i == limite:
+                # Sobra un concepto: hay otra página, que empieza después del último entregado.
+                siguiente = self.get_siguiente(anterior, limite)
+                break
+            anterior = concepto['pk']
+            yield ('' if i == 0 else ', ') + encoder.encode({
+                'code': concepto['code'],
+                'concept_text': concepto['concept_text'],
+                'unit': concepto['unit__unit'],
+                'cuantity': concepto['total_cuantity'],
+                'unit_price': concepto['unit_price'],
+            })
+        yield '], "siguiente": {}}}'.format(encoder.encode(siguiente))
+
+    def get(self, request, *args, **kwargs):
+        cursor = self.get_cursor()
+        limite = self.get_limite()
+        etag = catalogo_etag(self.contrato.pk, self.request.user.currently_at_id, cursor, limite)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+        conceptos = self.model.objects.filter(project=self.contrato, pk__gt=cursor).order_by('pk').values(
+            'pk', 'code', 'concept_text', 'unit__unit', 'total_cuantity', 'unit_price'
+        )
+        if limite is not None:
+            conceptos = conceptos[:limite + 1]
+        response = StreamingHttpResponse(
+            self.json_conceptos(conceptos.iterator(), limite), content_type='application/json'
+        )
+        if not en_replica():
+            response['ETag'] = etag
+        return response
+
+
+class CatalogoConceptosExport(CatalogoConceptos):
+
     def get(self, request, *args, **kwargs):
-        queryset = self.model.objects.filter(project=self.contrato).order_by('pk')
-        json = {}
-        json['conceptos'] = []
-        for concepto in queryset:
-            aux = {}
-            aux["code"] = concepto.code
-            aux["concept_text"] = concepto.concept_text
-            aux["unit"] = concepto.unit.unit
-            aux["cuantity"] = concepto.total_cuantity
-            aux["unit_price"] = concepto.unit_price
-            json['conceptos'].append(aux)
-        return JsonResponse(json)
-
-
-class DynamicDetail(ProyectosMenuMixin, DetailView):
+        nombre = 'catalogo-{}'.format(self.contrato.code or self.contrato.pk)
+        return exportacion.respuesta_hoja(
+            self.kwargs['formato'], nombre, exportacion.ENCABEZADO_CATALOGO, exportacion.filas_catalogo(self.contrato)
+        )
+
+
+class DynamicDetail(ConditionalGetMixin, ProyectosMenuMixin, DetailView):
+    solo_lectura = True
     permiso_requerido = 3
     asignacion_requerida = True
     change_company_ability = False
@@ -271,6 +389,9 @@ class ContratoDetailView(DynamicDetail):
         self.object = self.get_object()
         return self.object, self.request.user.contrato_set.all()
 
+    def get_version_keys(self):
+        return super(ContratoDetailView, self).get_version_keys() + [get_contrato_version_key(self.object.path)]
+
     def get_object(self, queryset=None):
         query_kw = self.get_company_query(self.model.__name__)
         query_kw.update({'pk': self.kwargs['pk']})
@@ -296,16 +417,28 @@ class EstimateDetailView(DynamicDetail):
     permiso_requerido = 3
     asignacion_requerida = True
     model = Estimate
+    incluye_generador = True
 
     def get_assignment_args(self):
         self.object = self.get_object()
         return self.object.project, self.request.user.contrato_set.all()
 
+    def get_version_keys(self):
+        return super(EstimateDetailView, self).get_version_keys() + [
+            get_contrato_version_key(self.object.project.path)
+        ]
+
     def get_context_data(self, **kwargs):
         context = super(EstimateDetailView, self).get_context_data(**kwargs)
-        context["conceptos"] = self.object.anotaciones_conceptos()
-        context["total_estimacion"] = context["conceptos"].importe_total_esta_estimacion()['total']
-        context["cantidad_de_conceptos"] = len(context["conceptos"])
+        if self.incluye_generador:
+            conceptos = context["conceptos"] = self.object.anotaciones_generador()
+            context["firmas_generador"] = self.object.auth_by_gen.select_related('contraparte')
+        else:
+            conceptos = context["conceptos"] = self.object.anotaciones_conceptos()
+        # El template solo hace estas consultas si las usa; en las vistas de
+        # impresión suelen venir en fragmentos que ya están en cache.
+        context["total_estimacion"] = lambda: conceptos.importe_total_esta_estimacion()['total']
+        context["cantidad_de_conceptos"] = lambda: len(conceptos)
         return context
 
 
@@ -333,17 +466,124 @@ class SubcontratosReport(EstimateDetailView):
         return context
 
 
-class EstimatePdfPrint(EstimateDetailView):
+class PrintFragmentCacheMixin(object):
+    """Los templates de impresión guardan en cache sus fragmentos pesados con
+    la versión del contenido de la estimación. Las estimaciones facturadas casi
+    no cambian, así que sus fragmentos se conservan más tiempo. Las versiones
+    cambian hasta que se confirma cada modificación (utils.reset_versions): un
+    fragmento armado antes del commit queda con la versión anterior y no con
+    la que se usará para los datos nuevos."""
+    fragment_timeout = 60 * 60 * 24
+    fragment_timeout_facturada = 60 * 60 * 24 * 30
+
+    def get_context_data(self, **kwargs):
+        context = super(PrintFragmentCacheMixin, self).get_context_data(**kwargs)
+        context['version_impresion'] = get_impresion_version(self.object)
+        context['fragment_timeout'] = self.fragment_timeout_facturada if self.object.invoiced \
+            else self.fragment_timeout
+        if en_replica():
+            # Se usan los fragmentos que ya están en cache pero no se guardan los armados con la réplica.
+            context['fragment_timeout'] = 0
+        return context
+
+
+class EstimatePdfPrint(PrintFragmentCacheMixin, EstimateDetailView):
     nivel_permiso_asignado = 2
+    incluye_generador = False
     template_name = 'proyectos/concept_pdf_estimate.html'
 
 
-class GeneratorPdfPrint(EstimateDetailView):
+class GeneratorPdfPrint(PrintFragmentCacheMixin, EstimateDetailView):
     template_name = 'proyectos/concept_pdf_generator.html'
 
 
-class DummyFileForm(ProyectosMenuMixin, TemplateView):
-    template_name = 'core/dummy_input.html'
+class EstimateExport(EstimateDetailView):
+    nivel_permiso_asignado = 2
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        nombre = 'estimacion-{}-{:02d}'.format(
+            self.object.project.code or self.object.project.pk, self.object.consecutive)
+        return exportacion.respuesta_hoja(
+            self.kwargs['formato'], nombre, exportacion.ENCABEZADO_CONCEPTOS, exportacion.filas_conceptos(self.object)
+        )
+
+
+class PdfDownloadMixin(object):
+    """Sirve el PDF generado en el worker. Si aún no existe uno con el mismo
+    hash de contenido se encola su generación, una sola vez por hash aunque el
+    navegador siga preguntando, y se responde 202."""
+    pdf_kind = pdf.ESTIMACION
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        content = pdf.get_pdf_content(self.object, self.pdf_kind)
+        name = pdf.get_pdf_storage_name(self.object, self.pdf_kind, pdf.get_content_hash(content))
+        if not default_storage.exists(name):
+            if not cache.add(pdf.get_render_key(name), True, pdf.PDF_RENDER_TIMEOUT):
+                return JsonResponse({'listo': False}, status=202)
+            result = tasks.generate_estimate_pdf.delay(self.object.pk, self.pdf_kind)
+            if not result.ready():
+                return JsonResponse({'listo': False}, status=202)
+            name = result.get()
+        filename = '{}-{}-{:02d}.pdf'.format(self.pdf_kind, self.object.project.code or self.object.project.pk,
+                                             self.object.consecutive)
+        return FileResponse(default_storage.open(name), as_attachment=True, filename=filename,
+                            content_type='application/pdf')
+
+
+class EstimatePdfDownload(PdfDownloadMixin, EstimatePdfPrint):
+    pdf_kind = pdf.ESTIMACION
+
+
+class GeneratorPdfDownload(PdfDownloadMixin, GeneratorPdfPrint):
+    pdf_kind = pdf.GENERADOR
+
+
+class EstimateExportView(ProyectosMenuMixin, FormView):
+    """Inicia la exportación de las estimaciones de un contrato en un periodo
+    y responde con la url donde estará el ZIP cuando termine."""
+    http_method_names = ['post']
+    form_class = forms.EstimateExportForm
+    permiso_requerido = 3
+    nivel_permiso_asignado = 2
+    asignacion_requerida = True
+
+    def get_assignment_args(self):
+        self.contrato = get_object_403_or_404(
+            Contrato, self.request.user, pk=self.kwargs['pk'], contraparte__company=self.request.user.currently_at
+        )
+        return self.contrato, self.request.user.contrato_set.all()
+
+    def form_valid(self, form):
+        company = self.request.user.currently_at
+        estimate_ids = list(Estimate.especial.exportacion(
+            company, self.contrato, form.cleaned_data['fecha_inicio'], form.cleaned_data['fecha_fin']
+        ).values_list('pk', flat=True))
+        if not estimate_ids:
+            form.add_error(None, 'No hay estimaciones en el periodo seleccionado.')
+            return self.form_invalid(form)
+        identificador = exportacion.nuevo_identificador()
+        tasks.exportar_estimaciones(exportacion.get_export_storage_name(company.pk, identificador), estimate_ids)
+        url = reverse('proyectos:exportacion_descarga', kwargs={'identificador': identificador})
+        return JsonResponse({'url': url, 'estimaciones': len(estimate_ids)}, status=202)
+
+    def form_invalid(self, form):
+        return JsonResponse({'errores': form.errors}, status=400)
+
+
+class ExportacionDescarga(ProyectosMenuMixin, View):
+    """Sirve el ZIP de una exportación de la compañía actual; mientras el
+    worker no lo termina responde 202."""
+    permiso_requerido = 2
+
+    def get(self, request, *args, **kwargs):
+        name = exportacion.get_export_storage_name(self.request.user.currently_at.pk, self.kwargs['identificador'])
+        if not default_storage.exists(name):
+            return JsonResponse({'listo': False}, status=202)
+        return FileResponse(default_storage.open(name), as_attachment=True,
+                            filename='estimaciones-{}.zip'.format(self.kwargs['identificador'][:8]),
+                            content_type='application/zip')
 
 
 class ContratoCreationView(ProyectosMenuMixin, CreateView):
@@ -359,7 +599,7 @@ class ContratoCreationView(ProyectosMenuMixin, CreateView):
 
     def get_max_id(self):
         max_id = self.form_class.Meta.model.objects.filter(
-            contraparte__company=self.request.user.currently_at
+            contraparte__company=self.request.user.currently_at, depth=1
         ).aggregate(Max('folio'))['folio__max'] or 0
         return max_id
 
@@ -381,7 +621,7 @@ class ContratoCreationView(ProyectosMenuMixin, CreateView):
     def get_context_data(self, **kwargs):
         context = super(ContratoCreationView, self).get_context_data(**kwargs)
         context['company'] = self.request.user.currently_at
-        # context['dummy_file'] = True
+        context['dummy_file'] = True
         return context
 
 
@@ -411,6 +651,7 @@ class SubcontratoCreationView(ContratoCreationView):
     def get_context_data(self, **kwargs):
         context = super(ContratoCreationView, self).get_context_data(**kwargs)
         context['subcontrato'] = True
+        context['dummy_file'] = True
         return context
 
 
@@ -537,6 +778,7 @@ class EstimateCreationView(ProyectosMenuMixin, CreateView):
             instance=form.instance
         )
         if generator_inline_concept.is_valid():
+            form.instance.consecutive = numeracion.siguiente_consecutivo(self.get_project_instance())
             response = super(EstimateCreationView, self).form_valid(form)
             generator_inline_concept.save()
             return response
@@ -614,7 +856,7 @@ class ContratoEditView(ProyectosMenuMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         context = super(ContratoEditView, self).get_context_data(**kwargs)
-        # context['dummy_file'] = True
+        context['dummy_file'] = True
         return context
 
     def get_initial(self):
@@ -847,31 +1089,15 @@ class DynamicDelete(ProyectosMenuMixin, DeleteView):
             )
         return self.object
 
-    def get_company_query(self, opcion):
-        kwargs = super(DynamicDelete, self).get_company_query(opcion)
-        if hasattr(self, 'object'):
-            if opcion == 'Estimate':
-                folio = {'consecutive__gt': self.object.consecutive}
-                field = 'consecutive'
-            else:
-                folio = {'folio__gt': self.object.folio}
-                field = 'folio'
-            kwargs.update(folio)
-            return (kwargs, field)
-        return kwargs
-
     def folio_handling(self):
-        if hasattr(self.object, 'folio') or hasattr(self.object, 'consecutive'):
-            kwargs, field = self.get_company_query(self.kwargs['model'])
-            if(hasattr(self.object, 'folio')):
-                self.model.objects.filter(**kwargs).update(folio=F(field) - 1)
-            else:
-                self.model.objects.filter(**kwargs).update(consecutive=F(field) - 1)
+        if isinstance(self.object, (Contrato, Estimate)):
+            numeracion.recorrer(self.object)
 
     def delete(self, request, *args, **kwargs):
         self.object = self.get_object()
-        self.folio_handling()
-        self.object.delete()
+        with transaction.atomic():
+            self.folio_handling()
+            self.object.delete()
         return JsonResponse({"exito": True})
 
 
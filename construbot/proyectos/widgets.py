@@ -1,16 +1,25 @@
+from dal import autocomplete
 from django import forms
 from .models import Concept
 from django.core.exceptions import ObjectDoesNotExist
 
 
 class ConceptDummyWidget(forms.Textarea):
+    # Conceptos por pk que el formset ya cargó; sin ellos se consulta cada uno.
+    conceptos = None
+
+    def get_concepto(self, value):
+        if self.conceptos is not None and str(value).isdigit() and int(value) in self.conceptos:
+            return self.conceptos[int(value)]
+        return Concept.objects.get(pk=value)
+
     def render(self, name, value, attrs=None, renderer=None):
         """
             esto se queda asi.... todavia no se porque, espero que se sepa con
             las pruebas de las vistas.
         """
         try:
-            value_instance = Concept.objects.get(pk=value)
+            value_instance = self.get_concepto(value)
             self.value = value_instance
         except:
             self.value = str(Concept.objects.get(concept_text=value).id)
@@ -37,3 +46,15 @@ class ConceptDummyWidget(forms.Textarea):
 
 class FileNestedWidget(forms.ClearableFileInput):
     template_name = 'proyectos/file_input.html'
+
+
+class SeleccionPrecargadaSelect2(autocomplete.ModelSelect2):
+    """ModelSelect2 que muestra `seleccionada` (la instancia que el formset ya
+    trae con select_related) en vez de consultarla en cada forma."""
+    seleccionada = None
+
+    def filter_choices_to_render(self, selected_choices):
+        if self.seleccionada is not None and selected_choices == [str(self.seleccionada.pk)]:
+            self.choices = [(self.seleccionada.pk, str(self.seleccionada))]
+        else:
+            super(SeleccionPrecargadaSelect2, self).filter_choices_to_render(selected_choices)
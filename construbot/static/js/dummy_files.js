@@ -1,92 +1,108 @@
 $(document).ready(function(){
-    let dp = document.getElementById("dummy_parent");
-    
-    function cargar_elementos(){
-        $("#inputGroupFile01").click();
-        var md5 = "",
-        csrf = $("input[name='csrfmiddlewaretoken']")[1].value,
-        form_data = [{"name": "csrfmiddlewaretoken", "value": csrf}];
-        function calculate_md5(file, chunk_size) {
-          var slice = File.prototype.slice || File.prototype.mozSlice || File.prototype.webkitSlice,
-              chunks = chunks = Math.ceil(file.size / chunk_size),
-              current_chunk = 0,
-              spark = new SparkMD5.ArrayBuffer();
-          function onload(e) {
-            spark.append(e.target.result);  // append chunk
-            current_chunk++;
-            if (current_chunk < chunks) {
-              read_next_chunk();
-            } else {
-              md5 = spark.end();
-            }
-          };
-          function read_next_chunk() {
-            var reader = new FileReader();
-            reader.onload = onload;
-            var start = current_chunk * chunk_size,
-                end = Math.min(start + chunk_size, file.size);
-            reader.readAsArrayBuffer(slice.call(file, start, end));
-          };
+    var dp = $("#dummy_parent"),
+        chunk_size = 1000000,  // Fragmentos de 1 MB
+        max_retries = 20,
+        csrf = $("input[name='csrfmiddlewaretoken']")[0].value;
+
+    function calculate_md5(file, done) {
+      var slice = File.prototype.slice || File.prototype.mozSlice || File.prototype.webkitSlice,
+          chunks = Math.ceil(file.size / chunk_size),
+          current_chunk = 0,
+          spark = new SparkMD5.ArrayBuffer();
+      function onload(e) {
+        spark.append(e.target.result);
+        current_chunk++;
+        if (current_chunk < chunks) {
           read_next_chunk();
+        } else {
+          done(spark.end());
         }
-        $("#inputGroupFile01").fileupload({
-          url: "/core/chunk_upload/",
-          dataType: "json",
-          maxChunkSize: 100000, // Chunks of 100 kB
-          formData: form_data,
-          add: function(e, data) { // Called before starting upload
-            $("#messages").empty();
-            // If this is the second file you're uploading we need to remove the
-            // old upload_id and just keep the csrftoken (which is always first).
-            form_data.splice(1);
-            calculate_md5(data.files[0], 100000);  // Again, chunks of 100 kB
-            $('.dummy-progreso').toggleClass("d-none");
-            $(this).parent().find(".custom-file-label")[0].innerText = data.fileInput.val().replace(/C:\\fakepath\\/i, '');
-            data.submit();
-          },
-          chunkdone: function (e, data) { // Called after uploading each chunk
-            if (form_data.length < 2) {
-              form_data.push(
-                {"name": "upload_id", "value": data.result.upload_id}
-              );
-            }
-            //$("#messages").append($('<p>').text(JSON.stringify(data.result)));
-            var progress = parseInt(data.loaded / data.total * 100.0, 10);
-            $('.progress-bar').attr('aria-valuenow', progress).css('width', progress+'%');
-            $("#dummy-progreso-progress").text("Progreso: "+progress + " %");
-            //$("#progress").text(Array(progress).join("=") + "> " + progress + "%");
+      };
+      function read_next_chunk() {
+        var reader = new FileReader();
+        reader.onload = onload;
+        var start = current_chunk * chunk_size,
+            end = Math.min(start + chunk_size, file.size);
+        reader.readAsArrayBuffer(slice.call(file, start, end));
+      };
+      read_next_chunk();
+    }
 
-          },
-          done: function (e, data) { // Called when the file has completely uploaded
-            $.ajax({
-              type: "POST",
-              url: "/proyectos/file_chunk_complete/",
-              data: {
-                csrfmiddlewaretoken: csrf,
-                upload_id: data.result.upload_id,
-                md5: md5
-              },
-              dataType: "json",
-              success: function(data) {
-                //$("#messages").append($('<p>').text(JSON.stringify(data)));
-                $('#id_relacion_id_archivo').attr('value', JSON.parse(data).chunked_id)
-                $('.dummy-progreso').toggleClass("d-none");
-                $('.progress-bar').attr('aria-valuenow', 0).css('width', 0+'%');
-              }
-            });
-          },
-        });
+    function progreso(porcentaje) {
+      $('.progress-bar').attr('aria-valuenow', porcentaje).css('width', porcentaje + '%');
+      $("#dummy-progreso-progress").text("Progreso: " + porcentaje + " %");
+    }
+
+    function terminar(upload) {
+      $('#id_relacion_id_archivo').attr('value', upload.upload_id);
+      $('.dummy-progreso').addClass("d-none");
+      progreso(0);
     }
 
-    $("#dummy_file").on("click", function(ev){
-        $.ajax({
-            url: '/proyectos/get_file_chunk_form/',
-            type: 'GET',
-            success: function(response){
-                dp.innerHTML = response;
-                cargar_elementos();
-            },
+    function error(mensaje) {
+      $("#messages").append($('<p class="text-danger">').text(mensaje));
+      $('.dummy-progreso').addClass("d-none");
+    }
+
+    function completar(upload_id, md5) {
+      $.ajax({
+        type: "POST",
+        url: dp.data("complete-url"),
+        data: {csrfmiddlewaretoken: csrf, upload_id: upload_id, md5: md5},
+        dataType: "json",
+        success: terminar,
+        error: function(xhr) { error(xhr.responseJSON ? xhr.responseJSON.error : 'No se pudo completar la subida.'); }
+      });
+    }
+
+    $("#inputGroupFile01").fileupload({
+      url: dp.data("upload-url"),
+      dataType: "json",
+      paramName: "archivo",
+      maxChunkSize: chunk_size,
+      formData: [{"name": "csrfmiddlewaretoken", "value": csrf}],
+      add: function(e, data) {
+        $("#messages").empty();
+        $(this).parent().find(".custom-file-label")[0].innerText = data.files[0].name;
+        data.formData = [{"name": "csrfmiddlewaretoken", "value": csrf}];
+        data.retries = 0;
+        // Si la compañía ya tiene un archivo con el mismo contenido no se vuelve a subir.
+        calculate_md5(data.files[0], function(md5) {
+          data.md5 = md5;
+          $.getJSON(dp.data("upload-url"), {md5: md5}, function(upload) {
+            if (upload.completa) {
+              terminar(upload);
+            } else {
+              $('.dummy-progreso').removeClass("d-none");
+              data.submit();
+            }
+          });
         });
-        
+      },
+      chunkdone: function(e, data) {
+        if (data.formData.length < 2) {
+          data.formData.push({"name": "upload_id", "value": data.result.upload_id});
+        }
+        data.retries = 0;
+        progreso(parseInt(data.loaded / data.total * 100.0, 10));
+      },
+      fail: function(e, data) {
+        // Reanuda desde el último byte que recibió el servidor.
+        if (data.formData.length < 2 || data.retries >= max_retries || data.errorThrown === 'abort') {
+          error('No se pudo subir el archivo, vuelve a intentarlo.');
+          return;
+        }
+        data.retries += 1;
+        window.setTimeout(function() {
+          $.getJSON(dp.data("upload-url"), {upload_id: data.formData[1].value}, function(upload) {
+            data.uploadedBytes = upload.offset;
+            data.data = null;
+            data.submit();
+          }).fail(function() { error('No se pudo reanudar la subida.'); });
+        }, 1000 * data.retries);
+      },
+      done: function(e, data) {
+        completar(data.result.upload_id, data.md5);
+      }
     });
 });
@@ -56,6 +56,40 @@ $(document).ready(function(){
             win = window.open(url, '_blank');
             win.focus();
         });
+
+        var descargar = $("#descargar_pdf");
+        var descargar_mensaje = $("#descargar_pdf_mensaje");
+        function terminarDescarga(mensaje){
+            descargar.removeClass("disabled");
+            if(mensaje){
+                descargar_mensaje.text(mensaje).show();
+            }
+        }
+        function descargarPdf(url, intentos){
+            // El PDF se genera en el worker, mientras no esté listo el servidor responde 202.
+            // Sólo se navega con 200: con 202 el navegador mostraría el JSON de la respuesta.
+            $.ajax({url: url, method: 'HEAD'}).done(function(data, textStatus, xhr){
+                if(xhr.status == 200){
+                    terminarDescarga();
+                    window.location.href = url;
+                } else if(intentos > 0){
+                    setTimeout(function(){ descargarPdf(url, intentos - 1); }, 2000);
+                } else {
+                    terminarDescarga("El PDF se sigue generando, inténtalo de nuevo en unos momentos.");
+                }
+            }).fail(function(){
+                terminarDescarga("No se pudo generar el PDF, inténtalo de nuevo.");
+            });
+        }
+        descargar.on("click", function(ev){
+            ev.preventDefault();
+            if(descargar.hasClass("disabled")){
+                return;
+            }
+            descargar.addClass("disabled");
+            descargar_mensaje.hide();
+            descargarPdf(ctrl != 0 ? descargar.data("generador") : descargar.data("estimacion"), 30);
+        });
     }
 
     var intcomma = function(value) {
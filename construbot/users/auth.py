@@ -2,6 +2,7 @@ from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth import get_user_model
 from django.core.exceptions import PermissionDenied, ImproperlyConfigured
 from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
 from construbot.core.context import ContextManager
 
 User = get_user_model()
@@ -16,15 +17,15 @@ class AuthenticationTestMixin(UserPassesTestMixin, ContextManager):
 
     def test_func(self):
         try:
-            self.request.user = User.objects.select_related(
+            # De la primaria aunque la vista lea de la réplica: el usuario pudo cambiar de compañía.
+            self.request.user = User.objects.using(DEFAULT_DB_ALIAS).select_related(
                 'currently_at', 'nivel_acceso').prefetch_related('company').get(pk=self.request.user.pk)
         except User.DoesNotExist:
             if not self.request.user.is_authenticated:
                 return False
         if self.request.user.company.exists():
             if not self.request.user.currently_at:
-                self.request.user.currently_at = self.request.user.company.first()
-                self.request.user.save()
+                self.request.user.establecer_compania(self.request.user.company.first())
         else:
             raise AttributeError('Current User must have company')
         self.user_groups = [x.name.lower() for x in self.request.user.groups.all()]
@@ -113,6 +113,16 @@ class AbstractConstrubotUser(AbstractUser):
     def get_absolute_url(self):
         return reverse('users:detail', kwargs={'username': self.username})
 
+    def establecer_compania(self, company):
+        """Cambia `currently_at` escribiendo sólo esa columna y sólo si cambió,
+        así las peticiones GET que no cambian de compañía no escriben en la
+        base de datos (save() escribe toda la fila y actualiza last_updated)."""
+        if self.currently_at_id == getattr(company, 'pk', None):
+            return False
+        self.currently_at = company
+        self.save(update_fields=['currently_at'])
+        return True
+
 
 class User(AbstractConstrubotUser):
 
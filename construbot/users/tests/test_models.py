@@ -1,5 +1,8 @@
 from . import factories
+from django.db import connection
 from django.test import tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.contrib.auth import get_user_model
 from construbot.users.models import Customer, NivelAcceso
 from . import utils
@@ -81,6 +84,37 @@ class TestUser(utils.BaseTestCase):
         )
         self.assertIsInstance(superuser.nivel_acceso, NivelAcceso)
 
+    def test_establecer_compania_only_writes_currently_at_when_it_changes(self):
+        company = factories.CompanyFactory(customer=self.user.customer)
+        last_updated = User.objects.values_list('last_updated', flat=True).get(pk=self.user.pk)
+        with self.assertNumQueries(1) as consultas:
+            self.assertTrue(self.user.establecer_compania(company))
+        sql = consultas.captured_queries[0]['sql']
+        self.assertIn('currently_at_id', sql)
+        self.assertNotIn('last_updated', sql)
+        with self.assertNumQueries(0):
+            self.assertFalse(self.user.establecer_compania(company))
+        guardado = User.objects.get(pk=self.user.pk)
+        self.assertEqual(guardado.currently_at, company)
+        self.assertEqual(guardado.last_updated, last_updated)
+
+    def test_get_pages_only_write_missing_currently_at(self):
+        company = factories.CompanyFactory(customer=self.user.customer)
+        self.user.company.add(company)
+        self.user.currently_at = None
+        self.user.save()
+        self.user.groups.add(self.proyectos_group)
+        self.client.force_login(self.user)
+        escrituras = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as consultas:
+                self.client.get(reverse('proyectos:proyect_dashboard'))
+            escrituras.append([q['sql'] for q in consultas.captured_queries if q['sql'].startswith('UPDATE')])
+        self.assertEqual(len(escrituras[0]), 1)
+        self.assertNotIn('last_updated', escrituras[0][0])
+        self.assertEqual(escrituras[1], [])
+        self.assertEqual(User.objects.get(pk=self.user.pk).currently_at, company)
+
 
 class TestCustomer(utils.BaseTestCase):
     def test_customer_repr_dont_raises_error(self):
@@ -1,6 +1,12 @@
+import collections
+import functools
+import re
+from django.core.cache import cache
+from django.db import transaction
 from django.test import RequestFactory
 from django.contrib.auth.models import Group
 from test_plus.test import CBVTestCase
+from construbot.core.profiling import MedidorConsultas
 from construbot.users.models import NivelAcceso
 from . import factories
 
@@ -24,3 +30,64 @@ class BaseTestCase(CBVTestCase):
         request = self.factory.get(url)
         request.user = user
         return request
+
+
+SAVEPOINT_RE = re.compile(r'"s\d+_x\d+"')
+
+
+def contar_consultas(func, *args, **kwargs):
+    """Ejecuta `func` y regresa el `MedidorConsultas` con las consultas de
+    todas las conexiones. Si `func` regresa una respuesta, se renderiza y se
+    consume dentro de la medición, porque las plantillas y los streams también
+    consultan la base de datos."""
+    with MedidorConsultas(registrar=True) as medidor:
+        response = func(*args, **kwargs)
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+    return medidor
+
+
+class ConsultasConstantesMixin(object):
+    """Compara las consultas de una petición contra datos de distintos
+    tamaños. `poblar(tamano)` crea los datos y regresa lo que necesite
+    `peticion(datos)`; cada tamaño se crea y se revierte en su propio savepoint
+    y el cache se limpia antes de medir."""
+    tamanos = (1, 4)
+
+    def medir_consultas(self, peticion, poblar, tamanos=None):
+        medidores = []
+        for tamano in tamanos or self.tamanos:
+            with transaction.atomic():
+                datos = poblar(tamano)
+                cache.clear()
+                medidores.append(contar_consultas(peticion, datos))
+                transaction.set_rollback(True)
+        return medidores
+
+    def assertConsultasConstantes(self, peticion, poblar, tamanos=None):
+        medidores = self.medir_consultas(peticion, poblar, tamanos)
+        consultas = [medidor.consultas for medidor in medidores]
+        if len(set(consultas)) > 1:
+            primeras, ultimas = (
+                collections.Counter(SAVEPOINT_RE.sub('"savepoint"', sql) for sql in medidor.sql)
+                for medidor in (medidores[0], medidores[-1])
+            )
+            self.fail('Las consultas crecen con los datos {}:\n{}'.format(consultas, '\n'.join(
+                '{} -> {} veces: {}'.format(primeras[sql], veces, sql)
+                for sql, veces in ultimas.items() if veces != primeras[sql]
+            )))
+        return consultas[0]
+
+
+def consultas_constantes(poblar, tamanos=None):
+    """Decorador para pruebas de `ConsultasConstantesMixin`: la prueba recibe
+    los datos de `poblar(self, tamano)` y regresa la respuesta a medir."""
+    def decorator(test):
+        @functools.wraps(test)
+        def wrapper(self):
+            self.assertConsultasConstantes(
+                lambda datos: test(self, datos), lambda tamano: poblar(self, tamano), tamanos)
+        return wrapper
+    return decorator
@@ -236,8 +236,7 @@ class CompanyChangeView(AuthenticationTestMixin, TemplateView):
             customer=self.request.user.customer
         )
         if new_company in self.request.user.company.all():
-            self.request.user.currently_at = new_company
-            self.request.user.save()
+            self.request.user.establecer_compania(new_company)
             return http.HttpResponse(self.request.user.currently_at.company_name)
         else:
             raise PermissionDenied(
@@ -254,8 +253,7 @@ class CompanyChangeViewFromList(CompanyChangeView):
             customer=self.request.user.customer
         )
         if new_company in self.request.user.company.all():
-            self.request.user.currently_at = new_company
-            self.request.user.save()
+            self.request.user.establecer_compania(new_company)
             return redirect('proyectos:proyect_dashboard')
         else:
             raise PermissionDenied(
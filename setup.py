@@ -47,8 +47,8 @@ setup(
         'Pillow>=11.0.0',
         # For user registration
         'django-allauth>=65.0,<66.0',
-        # Python-PostgreSQL Database Adapter - psycopg3
-        'psycopg[binary]>=3.2,<4.0',
+        # Python-PostgreSQL Database Adapter - psycopg3, con su pool de conexiones
+        'psycopg[binary,pool]>=3.2,<4.0',
         # Unicode slugification
         'awesome-slugify==1.6.5',
         # Time zones support
@@ -66,6 +66,8 @@ setup(
         'django-bootstrap4==23.4',
         # xls files handling
         'openpyxl==3.1.5',
+        # Server side PDF rendering
+        'reportlab>=4.2',
         # WSGI Handler
         'gunicorn==23.0.0',
         # Static and Media Storage
@@ -0,0 +1,50 @@
+function OnchangeEventHandler(event){if(event.target.getAttribute("value")){$.ajax({url:'/users/company-change/'+event.target.getAttribute("value")+'/',type:'GET',success:function(response){window.location.reload();},});}}
+$(document).on("click",".drop-company",function(event){OnchangeEventHandler(event);});;$(document).ready(function(){var menu=$(".cont_menu_lateral");var menu_in=$("#event_menu_in");var menu_out=$("#event_menu_out");var ham_button=$(".menu-icon");out=true;var cont_contenedor=$("#cont_content");var little=false;var len=0;$(document).on('click','.browse',function(){var file=$(this).parent().parent().parent().find('.file');file.trigger('click');});$(document).on('change','.file',function(){$(this).parent().find('.form-control').val($(this).val().replace(/C:\\fakepath\\/i,''));});if("#estimate_appear"){var boton_es=$("#estimate_appear");var boton_gen=$("#generator_appear");var estimacion=$(".cont_estimacion")[0]
+var generador=$(".cont_generator")[0]
+var print=$("#print_es");var ctrl=1;boton_es.on("click",function(){ctrl=0;estimacion.style.display="block";generador.style.display="none";boton_es[0].classList.add("active");boton_gen[0].classList.remove("active");});boton_gen.on("click",function(){ctrl=1;estimacion.style.display="none";generador.style.display="block";boton_es[0].classList.remove("active");boton_gen[0].classList.add("active");});print.on("click",function(){var win;var url=window.location.href
+url=url.replace('detalle','pdf');url=url.replace('#','');url=url.replace('/arriba','');url=url.replace('/abajo','');if(ctrl!=0){url=url.replace('estimacion','generador');}else{url=url.replace('generador','estimacion');}
+win=window.open(url,'_blank');win.focus();});}
+var intcomma=function(value){var origValue=String(value);var newValue=origValue.replace(/^(-?\d+)(\d{3})/,'$1,$2');if(origValue==newValue){return newValue;}else{return intcomma(newValue);}};function ajustarContenido(arg){if(arg==1){cont_contenedor.removeClass("content_with_little_sidebar");cont_contenedor.removeClass("content_with_sidebar");cont_contenedor.addClass("content_without_sidebar");}else if(arg==2&&little){cont_contenedor.addClass("content_with_little_sidebar");cont_contenedor.removeClass("content_with_sidebar");cont_contenedor.removeClass("content_without_sidebar");}else if(arg==2&&!little){cont_contenedor.removeClass("content_with_little_sidebar");cont_contenedor.addClass("content_with_sidebar");cont_contenedor.removeClass("content_without_sidebar");}}
+menu_in.on("click",function(){for(var i=0;i<$(".menuSign").length;i++){$(".menuSign")[i].style.display="none";}
+for(var i=0;i<$(".list_subsubmenu").length;i++){$(".list_subsubmenu")[i].style["margin-left"]="55px";}
+menu[0].style.width="55px";menu_in[0].style.display="none";menu_out[0].style.display="block";cont_contenedor.removeClass("content_with_sidebar");cont_contenedor.addClass("content_with_little_sidebar");little=true;});menu_out.on("click",function(){for(var i=0;i<$(".menuSign").length;i++){$(".menuSign")[i].style.display="initial";}
+for(var i=0;i<$(".list_subsubmenu").length;i++){$(".list_subsubmenu")[i].style["margin-left"]="200px";}
+menu[0].style.width="200px";menu_in[0].style.display="block";menu_out[0].style.display="none";cont_contenedor.removeClass("content_with_little_sidebar");cont_contenedor.addClass("content_with_sidebar");little=false;});ham_button.on("click",function(){if(out){menu[0].classList.add("disp_none");cont_contenedor.addClass("blur");out=false;}else{menu[0].classList.remove("disp_none");cont_contenedor.removeClass("blur");out=true;}});$(window).on("resize",function(){if(window.innerWidth<600){ajustarContenido(1);menu_out.click();menu_in[0].style.display="none";}else if(window.innerWidth>=600&&!little){cont_contenedor.removeClass("blur");if(!out){ham_button.click()}
+menu_in[0].style.display="block";ajustarContenido(2);}});if(window.innerWidth<600){menu_in[0].style.display="none";ajustarContenido(1);}else if(window.innerWidth>=600){ajustarContenido(2);}
+if($("#cont_est_danger")){let delete_est=$(".anchor_est_delete");let msj=$("#cont_est_danger")[0];delete_est.on("click",function(target){let element=target.target;let url=url_for_list+"eliminar/"+element.getAttribute("data-model")+"/"+element.getAttribute("data-id").split(",").join("")+"/";$.ajax({url:url,type:'GET',success:function(response){msj.style.display="block";msj.innerHTML=response;var f_data=$('#delete_form').serialize();$("#button_cancel").on("click",function(target){target.preventDefault();msj.style.display="none";});$("#delete_form").submit(function(event){event.preventDefault()
+$.ajax({type:"POST",url:url,data:f_data,success:function(){window.location.reload()}});});},});});}
+if($(".div_list")){var div_list=$(".div_list");var delete_link=$(".anchor_delete");var mensaje=$("#cont_danger")[0];delete_link.on("click",function(target){mensaje.innerHTML="";target.preventDefault();var element=target.target;var url=url_for_list+"eliminar/"+element.getAttribute("data-model")+"/"+element.getAttribute("data-id").split(",").join("")+"/";var pos=element.parentElement.getBoundingClientRect()
+for(i=0;i<div_list.length;i++){if(element.parentElement!=div_list[i]){div_list[i].classList.remove("border_danger");div_list[i].classList.add("border_normal");}}
+mensaje.style.top=window.scrollY+pos.y+"px";mensaje.style.left=pos.x+"px";mensaje.style.display="block";element.parentElement.classList.remove("border_normal");element.parentElement.classList.add("border_danger");$(window).on("resize",function(){pos=element.parentElement.getBoundingClientRect()
+mensaje.style.top=window.scrollY+pos.y+"px";mensaje.style.left=pos.x+"px";});$(window).on("scroll",function(){pos=element.parentElement.getBoundingClientRect()
+mensaje.style.top=window.scrollY+pos.y+"px";mensaje.style.left=pos.x+"px";});$.ajax({url:url,type:'GET',success:function(response){mensaje.innerHTML=response;habilitarBotones();},});function habilitarBotones(){var f_data=$('#delete_form').serialize();$("#button_cancel").on("click",function(target){target.preventDefault();element.parentElement.classList.add("border_normal");element.parentElement.classList.remove("border_danger");mensaje.style.display="none";});$("#delete_form").submit(function(event){event.preventDefault()
+$.ajax({type:"POST",url:url,data:f_data,success:function(){window.location.reload()}});});}});}
+if($(".form-group > label:contains('Image')")){ocultar_elementos();$(".add-form").on("click",function(){ocultar_elementos();});function ocultar_elementos(){$(".form-group > label:contains('Image')").hide();$("label:contains('Eliminar')").parent().hide();}
+$(document).on("click",".remove_ver_div",function(event){let ev=event.target;ev.closest(".remove_ver_div").nextSibling.nextSibling.children[0].children[0].click();ev.closest(".remove_ver_div").parentElement.classList.toggle("background_ver_eliminar");});$(document).on("click",".remove_img_span",function(event){let ev=event.target;ev.closest(".form-group").nextSibling.nextSibling.nextSibling.nextSibling.children[0].children[0].click();try{$(ev).parent().next().find(".custom-file-input")[0].classList.toggle("is-invalid");$(ev).parent().prev()[0].classList.toggle("appear");ev.classList.toggle("span_eliminar");}catch(err){ev=ev.parentNode;$(ev).parent().next().find(".custom-file-input")[0].classList.toggle("is-invalid");$(ev).parent().prev()[0].classList.toggle("appear");ev.classList.toggle("span_eliminar");}});$(document).on('change','.custom-file-input',function(){$(this).parent().find(".custom-file-label")[0].innerText=$(this).val().replace(/C:\\fakepath\\/i,'');});}
+if($("#select2-id_cliente-container").length&&$("#select2-id_sitio-container").length){$("#id_cliente").on("change",function(){if($("#select2-id_cliente-container")[0].childNodes[0].nodeName!="SPAN"){$("#select2-id_sitio-container")[0].parentNode.parentNode.parentNode.parentNode.style.display="block";}else{$("#select2-id_sitio-container")[0].parentNode.parentNode.parentNode.parentNode.style.display="none";}});if($("#select2-id_cliente-container")[0].childNodes[0].nodeName=="SPAN"){$("#select2-id_sitio-container")[0].parentNode.parentNode.parentNode.parentNode.style.display="none";}}
+if($(".llamar-subestimacion").length!=null){$(".llamar-subestimacion").on("click",function(evt){var url=evt.target.dataset['url'];var position=parseInt(evt.target.dataset['position']);if($(".clicked").length>0&&evt.target==$(".clicked")[0]){var position=parseInt($(".clicked")[0].dataset['position'])+1;var row=$("#subcontrato-table")[0].deleteRow(position);$(evt.target).removeClass("clicked");$(evt.target).removeClass("oi-chevron-bottom");$(evt.target).addClass("oi-chevron-right");}else if($(".clicked").length>0){$($(".clicked")[0]).removeClass("oi-chevron-bottom");$($(".clicked")[0]).addClass("oi-chevron-right");var pos_1=parseInt($(".clicked")[0].dataset['position'])+1;var row=$("#subcontrato-table")[0].deleteRow(pos_1);$($(".clicked")[0]).removeClass("clicked");$(evt.target).addClass("clicked");var position=parseInt($(".clicked")[0].dataset['position'])+1;$.ajax({url:url,type:'GET',success:function(response){var indice=position;var row=$("#subcontrato-table")[0].insertRow(indice);var text="<td colspan='6' id='subestimacioncontainer'><div>"+response+"</div></td>";row.innerHTML=text;},});$($(".clicked")[0]).removeClass("oi-chevron-right");$($(".clicked")[0]).addClass("oi-chevron-bottom");}else{$.ajax({url:url,type:'GET',success:function(response){var indice=position+1;var row=$("#subcontrato-table")[0].insertRow(indice);var text="<td colspan='6' id='subestimacioncontainer'><div>"+response+"</div></td>";row.innerHTML=text;},});$(evt.target).addClass("clicked");$($(".clicked")[0]).removeClass("oi-chevron-right");$($(".clicked")[0]).addClass("oi-chevron-bottom");}});}});;var setPrefix='concept_set';;var Formset=(function(){var callbacks={},empty_form={},form_count=0,form_manager={},form_placeholder=$('#formset-placeholder')[0],form_selector='.dynamic-form',prefix='form';function setup(context){$.extend(this,context);this.form_manager=$('#id_'+this.prefix+'-TOTAL_FORMS');this.form_count=parseInt(this.form_manager.val());if(this.form_placeholder===undefined||this.form_placeholder===[])
+this.form_placeholder=$('#'+this.prefix+'-placeholder');var empty_form=$(this.form_selector+':first').clone(true).get(0);$(empty_form).find(':input').removeAttr('checked').removeAttr('selected').not(':button, :submit, :reset, [type="hidden"], :radio, :checkbox').val('').attr('value','');this.empty_form=empty_form;if(this.callbacks.setup)
+this.callbacks.setup(this);}
+function add_form(){var self=this;var index=this.form_count;var form=$(this.empty_form).clone(true).get(0);this.update_index(form,index,false);if($(form).find(".dropdown-wrapper")!=null){$(form).find(".dropdown-wrapper").parent().remove();}
+if($(this.form_selector+':last').length>0)
+$(form).insertAfter($(this.form_selector+':last'));else
+$(form).insertAfter(this.form_placeholder);$(form).children('.hidden').removeClass('hidden');$(form).find('div, input, select, label, button, textarea').each(function(){self.update_index(this,index,false);});++this.form_count;this.form_manager.val(this.form_count);if(this.callbacks.add_form)
+this.callbacks.add_form(this,form,index);return false;}
+function delete_form(button){var self=this;$(button).parents(this.form_selector).hide(400,function(){var form=this;$(form).remove();--self.form_count;self.form_manager.val(self.form_count);if(self.callbacks.delete_form)
+self.callbacks.delete_form(self,form);self.update_all();});return false;}
+function update_all(){var self=this;var forms=$(this.form_selector);for(var index=0;index<this.form_count;index++){var form=forms.get(index);this.update_index(form,index);$(form).find('div, input, select, label, button').each(function(){self.update_index(this,index);});if(this.callbacks.update_all)
+this.callbacks.update_all(this,form,index);}}
+function update_index(element,index,external_links){if(external_links===undefined)
+external_links=true;var regex=new RegExp('('+this.prefix+'-\\d+)');var replacement=this.prefix+'-'+index;if($(element).attr("for"))
+$(element).attr("for",$(element).attr("for").replace(regex,replacement));if(element.id){if(external_links===true)
+$('a[href="#'+element.id+'"]').attr('href',function(i,attr){return attr.replace(regex,replacement);});element.id=element.id.replace(regex,replacement);}
+if(element.name)
+element.name=element.name.replace(regex,replacement);if(element.getAttribute('data-prefix'))
+element.setAttribute('data-prefix',element.getAttribute('data-prefix').replace(regex,replacement));if(this.callbacks.update_index)
+this.callbacks.update_index(this,element,index,regex,replacement);}
+return{callbacks:callbacks,empty_form:empty_form,form_count:form_count,form_manager:form_manager,form_placeholder:form_placeholder,form_selector:form_selector,prefix:prefix,setup:setup,add_form:add_form,delete_form:delete_form,update_all:update_all,update_index:update_index};});var callbacks={'setup':function(formset){$(formset.form_selector).find('.delete-form-row').click(function(e){e.preventDefault();formset.delete_form(this);});var addEventTarget=$('.add-form-row');if(formset.nested){addEventTarget=$(formset.form_selector).siblings('.add-img-form-row');}
+if(formset.vertice){addEventTarget=$(formset.form_selector).siblings('.add-ver-form-row');}
+addEventTarget.click(function(e){e.preventDefault();formset.add_form();});},'add_form':function(formset,form,index){$(form).find('.delete-form-row').click(function(e){e.preventDefault();formset.delete_form(this);});if(index%2!==0)
+$(form).removeClass('light');},'update_all':function(formset,form,index){if(index%2===0)
+$(form).addClass('light');else
+$(form).removeClass('light');}};;var formset=new Formset();formset.setup({prefix:setPrefix,callbacks:callbacks});;
\ No newline at end of file